@@ -0,0 +1,297 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+""" benchmarks/run.py -- End-to-end benchmarks of ERPpeek
+
+Run the scenarios against the fake server of :mod:`erppeek_testing`, and
+report the round trips, the wall time, the CPU time and the peak memory
+of each scenario.  The server runs in a child process, so that only the
+work of the client is measured.  Each scenario is repeated, and the
+median of the runs is stored as JSON, and compared with a previous run.
+"""
+from __future__ import with_statement
+
+import fnmatch
+import gc
+import json
+import multiprocessing
+import optparse
+import os
+import sys
+import time
+import traceback
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import erppeek
+from erppeek_testing import FakeServer
+try:
+    import tracemalloc
+except ImportError:     # Python < 3.4
+    tracemalloc = None
+
+__all__ = ['SCENARIOS', 'ServerProcess', 'measure', 'compare']
+
+# The metrics compared with the threshold; the round trips are exact
+METRICS = ('wall', 'cpu', 'memory')
+if hasattr(time, 'process_time'):
+    _cpu_time = time.process_time
+else:                   # Python < 3.3
+    _cpu_time = time.clock
+SCENARIOS = []
+
+
+def scenario(func):
+    """Register a scenario.
+
+    The scenario receives the `server` and the connected `client`, it
+    prepares the data and returns the function to measure.
+    """
+    SCENARIOS.append((func.__name__, func))
+    return func
+
+
+@scenario
+def client_startup(server, client):
+    def run():
+        erppeek.Client._login.cache.clear()
+        erppeek.Client(server.url, server.database, 'admin', 'admin')
+    return run
+
+
+@scenario
+def browse_attributes(server, client):
+    server.populate('res.country', 20)
+    server.populate('res.partner', 300)
+
+    def run():
+        client._models.clear()
+        for partner in client.model('res.partner').browse([]):
+            (partner.name, partner.email, partner.country_id.name)
+    return run
+
+
+def _read(count):
+    def prepare(server, client):
+        server.populate('res.country', 20)
+        server.populate('res.partner', count)
+
+        def run():
+            partners = client.model('res.partner').browse([])
+            partners.read('name email credit_limit country_id')
+        return run
+    prepare.__name__ = 'read_%dk' % (count // 1000)
+    return scenario(prepare)
+read_10k = _read(10000)
+read_100k = _read(100000)
+
+
+@scenario
+def bulk_write(server, client):
+    server.populate('res.partner', 10000)
+
+    def run():
+        partner = client.model('res.partner')
+        partner.browse([]).write({'customer': True, 'comment': 'bulk'})
+        for idx in range(200):
+            partner.create({'name': 'New %d' % idx})
+    return run
+
+
+@scenario
+def searchargs_parsing(server, client):
+    domains = [['name like Agrolait', 'id > %d' % idx, 'state in (a, b)',
+                ('parent_id', '=', False), 'ref =like SO%%%d' % idx,
+                'active = True', 'date <= 2013-03-01']
+               for idx in range(5000)]
+
+    def run():
+        for domain in domains:
+            erppeek.searchargs((domain,))
+    return run
+
+
+def _serve(conn, latency, workers):
+    """Run a fake server, and execute the requests received on `conn`."""
+    with FakeServer(latency=latency, workers=workers) as server:
+        conn.send((server.url, server.database))
+        while True:
+            request = conn.recv()
+            if request is None:
+                break
+            (name, args, kwargs) = request
+            try:
+                value = getattr(server, name)
+                if callable(value):
+                    value = value(*args, **kwargs)
+                conn.send((True, value))
+            except Exception:
+                conn.send((False, traceback.format_exc()))
+
+
+class ServerProcess(object):
+    """A :class:`FakeServer` in a child process.
+
+    It provides the `url`, the `database`, the counters and the method
+    ``populate`` of the server.
+    """
+
+    def __init__(self, latency=0.0, workers=4):
+        (self._conn, child_conn) = multiprocessing.Pipe()
+        self._process = multiprocessing.Process(
+            target=_serve, args=(child_conn, latency, workers))
+        self._process.daemon = True
+
+    def __enter__(self):
+        self._process.start()
+        (self.url, self.database) = self._conn.recv()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._conn.send(None)
+        self._process.join()
+
+    def _call(self, name, *args, **kwargs):
+        self._conn.send((name, args, kwargs))
+        (success, value) = self._conn.recv()
+        if not success:
+            raise RuntimeError(value)
+        return value
+
+    def populate(self, *args, **kwargs):
+        return self._call('populate', *args, **kwargs)
+
+    calls = property(lambda self: self._call('calls'))
+    bytes_sent = property(lambda self: self._call('bytes_sent'))
+
+
+def _median(values):
+    values = sorted(values)
+    middle = len(values) // 2
+    if len(values) % 2:
+        return values[middle]
+    return (values[middle - 1] + values[middle]) / 2.0
+
+
+def _measure_once(prepare, latency, workers):
+    with ServerProcess(latency=latency, workers=workers) as server:
+        client = erppeek.Client(server.url, server.database,
+                                'admin', 'admin')
+        run = prepare(server, client)
+        gc.collect()
+        (calls, sent) = (server.calls, server.bytes_sent)
+        if tracemalloc is not None:
+            tracemalloc.start()
+        (wall, cpu) = (time.time(), _cpu_time())
+        run()
+        (wall, cpu) = (time.time() - wall, _cpu_time() - cpu)
+        if tracemalloc is not None:
+            memory = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+        else:
+            memory = None
+        erppeek.Client._login.cache.clear()
+        return {'calls': server.calls - calls,
+                'bytes': server.bytes_sent - sent,
+                'wall': wall, 'cpu': cpu, 'memory': memory}
+
+
+def measure(prepare, latency=0.0, workers=4, repeat=3):
+    """Run the scenario `repeat` times, and return the median measures.
+
+    Each run uses a new server.
+    """
+    runs = [_measure_once(prepare, latency, workers)
+            for idx in range(repeat)]
+    res = {}
+    for key in ('calls', 'bytes', 'wall', 'cpu', 'memory'):
+        values = [run[key] for run in runs if run[key] is not None]
+        res[key] = _median(values) if values else None
+    for key in ('calls', 'bytes', 'memory'):
+        if res[key] is not None:
+            res[key] = int(res[key])
+    res['wall'] = round(res['wall'], 4)
+    res['cpu'] = round(res['cpu'], 4)
+    return res
+
+
+def compare(results, baseline, threshold=0.2):
+    """Return the list of the regressions of `results` over `baseline`."""
+    regressions = []
+    for (name, current) in sorted(results.items()):
+        previous = baseline.get(name)
+        if not previous:
+            continue
+        if current['calls'] > previous['calls']:
+            regressions.append('%s: calls %d > %d' %
+                               (name, current['calls'], previous['calls']))
+        for metric in METRICS:
+            (value, limit) = (current.get(metric), previous.get(metric))
+            if value and limit and value > limit * (1 + threshold):
+                regressions.append('%s: %s %s > %s (+%d%%)' %
+                                   (name, metric, value, limit,
+                                    (value / float(limit) - 1) * 100))
+    return regressions
+
+
+def main():
+    parser = optparse.OptionParser(
+        usage='%prog [options] [scenario_pattern ...]',
+        description='Run the benchmarks against a local fake server.')
+    parser.add_option(
+        '-l', '--list', action='store_true',
+        help='list the scenarios')
+    parser.add_option(
+        '-o', '--output', metavar='FILE',
+        help='store the results as JSON in this file')
+    parser.add_option(
+        '-b', '--baseline', metavar='FILE',
+        help='compare with the results stored in this file')
+    parser.add_option(
+        '-t', '--threshold', type='float', default=0.2,
+        help='fail if a measure exceeds the baseline by this ratio '
+             '(default: 0.2)')
+    parser.add_option(
+        '-n', '--repeat', type='int', default=3,
+        help='number of runs of each scenario, to compare the median '
+             '(default: 3)')
+    parser.add_option(
+        '--latency', type='float', default=0.0,
+        help='latency of the server in seconds (default: 0)')
+    parser.add_option(
+        '--workers', type='int', default=4,
+        help='number of requests processed concurrently (default: 4)')
+    (args, patterns) = parser.parse_args()
+
+    names = [name for (name, prepare) in SCENARIOS
+             if not patterns or [pattern for pattern in patterns
+                                 if fnmatch.fnmatch(name, pattern)]]
+    if args.list:
+        print('\n'.join(names))
+        return
+
+    results = {}
+    print('%-20s %7s %10s %9s %9s %12s' %
+          ('scenario', 'calls', 'bytes', 'wall', 'cpu', 'memory'))
+    for (name, prepare) in SCENARIOS:
+        if name not in names:
+            continue
+        res = results[name] = measure(prepare, args.latency, args.workers,
+                                      args.repeat)
+        print('%-20s %7d %10d %8.3fs %8.3fs %12s' %
+              (name, res['calls'], res['bytes'], res['wall'], res['cpu'],
+               res['memory'] if res['memory'] is not None else '-'))
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        if regressions:
+            print('\n'.join(['Regression: ' + msg for msg in regressions]))
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -7,26 +7,37 @@ Author: Florent Xicluna
 """
 from __future__ import with_statement
 
+from array import array
+import bisect
+from collections import deque
+import copy
+import csv
 import functools
 import optparse
 import os
-from pprint import pprint
+from pprint import pformat, pprint
 import re
+import socket
 import sys
+import threading
 import time
 import traceback
 import warnings
 try:                    # Python 3
     import configparser
+    from queue import Empty, Queue
     from threading import current_thread
-    from xmlrpc.client import Fault, ServerProxy
+    from xmlrpc.client import (Fault, SafeTransport, ServerProxy, Transport,
+                               dumps)
     basestring = str
     int_types = int
 except ImportError:     # Python 2
     import ConfigParser as configparser
     from itertools import ifilter as filter
+    from Queue import Empty, Queue
     from threading import currentThread as current_thread
-    from xmlrpclib import Fault, ServerProxy
+    from xmlrpclib import (Fault, SafeTransport, ServerProxy, Transport,
+                           dumps)
     int_types = int, long
 
 try:
@@ -64,9 +75,21 @@ except ImportError:     # Python 2.5
             return item
         return default
 
+try:
+    from collections import namedtuple as _namedtuple
+except ImportError:     # Python 2.5
+    _namedtuple = None
+
+try:
+    import numpy
+except ImportError:     # NumPy is optional
+    numpy = None
+
 
 __version__ = '1.4.6.dev0'
-__all__ = ['Client', 'Model', 'Record', 'RecordList', 'Service',
+__all__ = ['AdaptiveConcurrency', 'Cassette', 'Client', 'JSONTrace', 'Model',
+           'Record', 'RecordList', 'Replica', 'RPCBudget', 'RPCCall',
+           'RPCStats', 'Service',
            'format_exception', 'read_config', 'start_openerp_services']
 
 CONF_FILE = 'erppeek.ini'
@@ -75,6 +98,10 @@ DEFAULT_URL = 'http://localhost:8069'
 DEFAULT_DB = 'openerp'
 DEFAULT_USER = 'admin'
 MAXCOL = [79, 179, 9999]    # Line length in verbose mode
+if hasattr(time, 'process_time'):
+    _cpu_time = time.process_time
+else:                       # Python < 3.3
+    _cpu_time = time.clock
 
 USAGE = """\
 Usage (main commands):
@@ -97,6 +124,7 @@ Usage (main commands):
 
     do(obj, method, *params)        # Generic 'object.execute'
     exec_workflow(obj, signal, id)  # Trigger workflow signal
+    profile(expr)                   # Profile the expression
 
     client                          # Client object, connected
     client.login(user)              # Login with another user
@@ -115,6 +143,7 @@ _term_re = re.compile(
     '([\w._]+)\s*'  '(=(?:like|ilike|\?)|[<>!]=|[<>=]'
     '|(?<= )(?:like|ilike|in|not like|not ilike|not in|child_of))'  '\s*(.*)')
 _fields_re = re.compile(r'(?:[^%]|^)%\(([^)]+)\)')
+_xml_id_re = re.compile(r'^[\w-]+\.[\w-]+$')
 
 # Published object methods
 _methods = {
@@ -136,6 +165,14 @@ _methods_6_1 = {
 }
 # Hidden methods:
 #  - common: get_available_updates, get_migration_scripts, set_loglevel
+# Read-only object methods: concurrent identical calls are shared
+_readonly_methods = frozenset([
+    'read', 'search', 'search_count', 'name_get', 'name_search',
+    'fields_get', 'fields_get_keys', 'default_get', 'perm_read',
+    'read_group'])
+# Typecodes of the columns, for NumPy and for the array module
+_column_types = {'integer': 'l', 'many2one': 'l', 'float': 'd',
+                 'boolean': 'b'}
 _cause_message = ("\nThe above exception was the direct cause "
                   "of the following exception:\n\n")
 
@@ -202,6 +239,8 @@ def read_config(section=None):
     ``database``, ``user`` and (optional) ``password``.  Default values are
     read from the ``[DEFAULT]`` section.  If the ``password`` is not in the
     configuration file, it is requested on login.
+    The ``host`` can be a comma-separated list of hosts which share the
+    database: the ``server`` is a list of URLs in this case.
     Return a tuple ``(server, db, user, password or None)``.
     Without argument, it returns the list of configured environments.
     """
@@ -215,7 +254,10 @@ def read_config(section=None):
     if scheme == 'local':
         server = (scheme, env.get('options', ''))
     else:
-        server = '%s://%s:%s' % (scheme, env['host'], env['port'])
+        server = ['%s://%s:%s' % (scheme, host, env['port'])
+                  for host in env['host'].replace(',', ' ').split()]
+        if len(server) == 1:
+            (server,) = server
     return (server, env['database'], env['username'], env.get('password'))
 
 
@@ -301,6 +343,1129 @@ def searchargs(params, kwargs=None, context=None):
     return params
 
 
+def _like(pattern, value, ignorecase=False, exact=False):
+    """Match the `value` with a SQL ``LIKE`` pattern.
+
+    Both are compared as strings, like PostgreSQL does.  Unless `exact`
+    is :const:`True`, the pattern may match a part of the `value`.
+    """
+    (pattern, value) = ('%s' % (pattern,), '%s' % (value,))
+    if not exact:
+        pattern = '%' + pattern + '%'
+    regex = ''.join([{'%': '.*', '_': '.'}.get(char) or re.escape(char)
+                     for char in pattern])
+    return re.match('(?s)%s$' % regex, value,
+                    re.IGNORECASE if ignorecase else 0) is not None
+
+
+def _match_term(value, operator, arg, field_type=None):
+    """Evaluate a single term of a search domain against the `value`."""
+    if operator == '=?':
+        if arg is None or arg is False:
+            return True
+        operator = '='
+    if field_type == 'many2one':
+        # Compare the id, or the name of the related record
+        value = value and (value[1] if isinstance(arg, basestring)
+                           else value[0])
+    elif field_type in ('one2many', 'many2many'):
+        if operator in ('in', '=') and not isinstance(arg, basestring):
+            args = arg if isinstance(arg, (list, tuple)) else [arg]
+            return bool(set(value or ()).intersection(args))
+        if operator in ('not in', '!=', '<>') and arg is False:
+            return bool(value)
+        if operator in ('not in', '!=', '<>'):
+            args = arg if isinstance(arg, (list, tuple)) else [arg]
+            return not set(value or ()).intersection(args)
+        raise ValueError('Operator %r is not supported on %s fields' %
+                         (operator, field_type))
+    if operator == '=':
+        return value == arg or (arg is False and value is None)
+    if operator in ('!=', '<>'):
+        return not _match_term(value, '=', arg)
+    if operator == 'in':
+        return value in arg
+    if operator == 'not in':
+        return value not in arg
+    if operator in ('like', 'ilike', '=like', '=ilike',
+                    'not like', 'not ilike'):
+        if operator.startswith('not '):
+            return not _match_term(value, operator[4:], arg)
+        if value is False or value is None:
+            return False
+        return _like(arg, value, ignorecase=('ilike' in operator),
+                     exact=(operator[0] == '='))
+    if value is False or value is None:
+        return False
+    if operator == '<':
+        return value < arg
+    if operator == '>':
+        return value > arg
+    if operator == '<=':
+        return value <= arg
+    if operator == '>=':
+        return value >= arg
+    raise ValueError('Operator %r is not supported' % (operator,))
+
+
+def _match_domain(domain, values, fields):
+    """Evaluate the search `domain` against the `values` of a record.
+
+    The `fields` are the properties of the fields of the model, as
+    returned by :meth:`Model.fields`.
+    """
+    stack = []
+    for term in reversed(domain):
+        if term == '!':
+            stack.append(not stack.pop())
+        elif term == '&':
+            stack.append(stack.pop() & stack.pop())
+        elif term == '|':
+            stack.append(stack.pop() | stack.pop())
+        else:
+            (name, operator, arg) = term
+            field_type = fields[name]['type'] if name != 'id' else None
+            stack.append(_match_term(values[name], operator, arg,
+                                     field_type))
+    # Implicit '&' between the remaining terms
+    return False not in stack
+
+
+def _domain_fields(domain):
+    """Return the names of the fields used in the search `domain`."""
+    names = []
+    for term in domain:
+        if term not in DOMAIN_OPERATORS and term[0] not in names:
+            if '.' in term[0]:
+                raise ValueError('Cannot evaluate %r locally' % (term[0],))
+            names.append(term[0])
+    return names
+
+
+def _column(values, field_type):
+    """Convert the list of `values` of a field to a typed column.
+
+    The numeric, boolean and ``many2one`` columns are NumPy arrays, or
+    :mod:`array` buffers if NumPy is not installed.  The ``date`` and
+    ``datetime`` columns are NumPy arrays of ``datetime64``, or lists.
+    The ``many2one`` columns contain the ids, with 0 for empty values.
+    """
+    if field_type == 'many2one':
+        values = [value and value[0] or 0 for value in values]
+    elif field_type in ('integer', 'float'):
+        values = [value or 0 for value in values]
+    elif field_type == 'boolean':
+        values = [value and 1 or 0 for value in values]
+    elif field_type in ('date', 'datetime') and numpy is not None:
+        unit = 'D' if field_type == 'date' else 's'
+        return numpy.array([value or 'NaT' for value in values],
+                           dtype='datetime64[%s]' % unit)
+    else:
+        return values
+    typecode = _column_types[field_type]
+    if numpy is not None:
+        return numpy.array(values, dtype=typecode)
+    return array(typecode, values)
+
+
+def _tuple_rows(rows, header, factory=tuple):
+    """Convert the `rows` to compact tuples, ordered like the `header`.
+
+    The lists are converted to tuples, and the equal strings are replaced
+    with a single instance.
+    """
+    strings = {}
+
+    def compact(value):
+        if isinstance(value, basestring):
+            return strings.setdefault(value, value)
+        if isinstance(value, list):
+            return tuple([compact(item) for item in value])
+        return value
+    return [factory([compact(row[name]) for name in header])
+            for row in rows]
+
+
+def _parse_fields(fields):
+    """Return the list of field names, or None."""
+    if isinstance(fields, basestring):
+        return _fields_re.findall(fields) or fields.split()
+    return fields and list(fields) or None
+
+
+class _InFlight(object):
+    """A pending request, shared by concurrent callers."""
+    waiters = 0
+    result = exc_info = None
+
+    def __init__(self):
+        self.done = threading.Event()
+
+
+class _SingleFlight(object):
+    """Coalesce the concurrent identical calls of read-only methods.
+
+    The first thread sends the request, while the other threads asking
+    for the same `obj`, `method` and `params` wait for this request to
+    complete.  Each waiting thread receives its own copy of the result.
+    The other methods increment the `generation` when they start and
+    when they end: a request is shared only with the callers of the
+    same generation, so it never hides a write to its callers.
+    """
+    generation = 0
+
+    def __init__(self, execute, stats=None):
+        self._execute = execute
+        self._stats = stats
+        self._inflight = {}
+        self._lock = threading.Lock()
+
+    def _next_generation(self):
+        with self._lock:
+            self.generation += 1
+
+    def __call__(self, obj, method, *params):
+        if method not in _readonly_methods:
+            self._next_generation()
+            try:
+                return self._execute(obj, method, *params)
+            finally:
+                self._next_generation()
+        with self._lock:
+            key = (self.generation, obj, method, repr(params))
+            call = self._inflight.get(key)
+            if call is not None:
+                call.waiters += 1
+            else:
+                self._inflight[key] = _InFlight()
+        if self._stats is not None:
+            self._stats.cache('single_flight', call is not None,
+                              call is None)
+        if call is not None:
+            # Another thread is already sending the same request
+            call.done.wait()
+            if call.exc_info:
+                raise call.exc_info[1]
+            return copy.deepcopy(call.result)
+        res = None
+        exc_info = (None, Fault('', 'Interrupted'), None)
+        try:
+            res = self._execute(obj, method, *params)
+            exc_info = None
+        except Exception:
+            exc_info = sys.exc_info()
+            raise
+        finally:
+            with self._lock:
+                call = self._inflight.pop(key)
+            if call.waiters:
+                # Keep a pristine copy, the caller may alter the result
+                call.result = copy.deepcopy(res)
+                call.exc_info = exc_info
+            call.done.set()
+        return res
+
+
+class AdaptiveConcurrency(object):
+    """Limit of the concurrent requests of the parallel jobs of a Client.
+
+    The jobs which send their requests in parallel, like the exports, the
+    imports and :meth:`Model.resolve_names`, share this limit.  Each
+    worker holds a slot while it runs a task.  The limit grows by
+    `increase` every `limit` calls while the latency is stable, and it is
+    multiplied by `decrease` when a call takes longer than `tolerance`
+    times the average latency of its method, or when it fails with a
+    timeout.  It stays between `min_limit` and `max_limit`.
+
+    The average latency of each method is in the `latency` dictionary.
+    The limiter adds itself to the list of `hooks` while some slots are
+    held, to observe the RPC calls of the workers.
+
+    A parallel job started by a worker which holds a slot runs its tasks
+    sequentially in this worker, to never wait for a second slot.
+    """
+    before = None
+    increase = 1
+    decrease = 0.5
+    tolerance = 2.0
+    # A call faster than this is never a latency spike
+    min_latency = 0.05
+    min_limit = 1
+    max_limit = 64
+
+    def __init__(self, limit=4, hooks=None):
+        self.limit = float(limit)
+        self.hooks = hooks
+        self.inflight = 0
+        self.latency = {}
+        self._since_decrease = 0
+        self._cond = threading.Condition()
+        self._local = threading.local()
+
+    def __repr__(self):
+        return '<AdaptiveConcurrency %d/%d>' % (self.inflight, self.limit)
+
+    def holding(self):
+        """Return True if the current thread holds a slot."""
+        return bool(getattr(self._local, 'held', 0))
+
+    def acquire(self):
+        """Wait for a free slot."""
+        held = getattr(self._local, 'held', 0)
+        if not held:
+            # The nested tasks of a worker use its slot
+            with self._cond:
+                while self.inflight >= int(self.limit):
+                    self._cond.wait()
+                if not self.inflight and self.hooks is not None:
+                    self.hooks.append(self)
+                self.inflight += 1
+        self._local.held = held + 1
+
+    def release(self):
+        """Release the slot of the current thread."""
+        self._local.held -= 1
+        if not self._local.held:
+            with self._cond:
+                self.inflight -= 1
+                if not self.inflight and self.hooks is not None:
+                    self.hooks.remove(self)
+                self._cond.notify_all()
+
+    def after(self, call):
+        if not getattr(self._local, 'held', 0):
+            return
+        error = call.error
+        timeout = isinstance(error, socket.error) or (
+            isinstance(error, Fault) and
+            'timeout' in ('%s %s' % (error.faultCode,
+                                     error.faultString)).lower())
+        with self._cond:
+            usual = self.latency.get(call.key)
+            if usual is None:
+                self.latency[call.key] = usual = call.duration
+            else:
+                self.latency[call.key] = 0.9 * usual + 0.1 * call.duration
+            self._since_decrease += 1
+            if timeout or call.duration > max(usual * self.tolerance,
+                                              self.min_latency):
+                # Decrease once for the calls which were in flight
+                if self._since_decrease > self.inflight:
+                    self.limit = max(self.min_limit,
+                                     self.limit * self.decrease)
+                    self._since_decrease = 0
+            elif not error:
+                self.limit = min(self.max_limit,
+                                 self.limit + self.increase / self.limit)
+                self._cond.notify_all()
+
+
+def _imap(func, iterable, workers=1, limiter=None):
+    """Apply `func` to each item of the `iterable`, in a pool of threads.
+
+    Yield the results in the order of the items.  No more than `workers`
+    items are pending at the same time, and the `iterable` is consumed
+    lazily.  The first exception is raised in the caller.
+    The optional `limiter` is an :class:`AdaptiveConcurrency` shared with
+    the other parallel jobs.
+    """
+    if limiter is not None and limiter.holding():
+        # Nested in a worker: use its slot
+        workers = 1
+    if workers < 2:
+        for item in iterable:
+            yield func(item)
+        return
+    tasks = Queue(workers)
+
+    def worker():
+        while True:
+            task = tasks.get()
+            if task is None:
+                break
+            (item, call) = task
+            if limiter is not None:
+                limiter.acquire()
+            try:
+                call.result = func(item)
+            except:
+                # Raise it in the caller, even a KeyboardInterrupt
+                call.exc_info = sys.exc_info()
+            finally:
+                if limiter is not None:
+                    limiter.release()
+                call.done.set()
+
+    def result(call):
+        call.done.wait()
+        if call.exc_info:
+            raise call.exc_info[1]
+        return call.result
+    threads = [threading.Thread(target=worker) for idx in range(workers)]
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+    pending = deque()
+    try:
+        for item in iterable:
+            call = _InFlight()
+            tasks.put((item, call))
+            pending.append(call)
+            if len(pending) > workers:
+                yield result(pending.popleft())
+        while pending:
+            yield result(pending.popleft())
+    finally:
+        for thread in threads:
+            tasks.put(None)
+
+
+def _xmlrpc_size(params, methodname=None):
+    """Return the size of the XML-RPC request, or response, for `params`."""
+    try:
+        return len(dumps(tuple(params), methodname,
+                         methodresponse=(methodname is None),
+                         allow_none=True))
+    except Exception:
+        return len(repr(params))
+
+
+def _error_message(exc):
+    if isinstance(exc, Fault):
+        # OpenERP sends the message as the faultCode
+        return str(exc.faultCode)
+    return '%s: %s' % (type(exc).__name__, exc)
+
+
+def _trimmed_repr(value, maxcol):
+    """Return ``str(value)`` truncated to `maxcol` characters.
+
+    For a list, only the first items are formatted.
+    """
+    if isinstance(value, list) and len(value) > 1:
+        (parts, size) = ([], 0)
+        for item in value:
+            parts.append(repr(item))
+            size += len(parts[-1]) + 2
+            if size > maxcol:
+                break
+        if len(parts) < len(value):
+            rcv = '[%s, ...]' % ', '.join(parts)
+            suffix = '... N=%s' % len(value)
+            return rcv[:maxcol - len(suffix)] + suffix
+    rcv = str(value)
+    if len(rcv) > maxcol:
+        suffix = '... L=%s' % len(rcv)
+        rcv = rcv[:maxcol - len(suffix)] + suffix
+    return rcv
+
+
+class RPCCall(object):
+    """An RPC call, passed to the tracing hooks.
+
+    The `endpoint` is the name of the service, and the `name` and the
+    `args` are the RPC method and its arguments.  For the calls of the
+    ``object`` service, the `model` and the `method` are the model and
+    the method executed; otherwise `model` is :const:`None` and `method`
+    is the RPC method.  The `start` is the timestamp of the call.
+
+    When the call is complete, the `duration` is set in seconds, with
+    the `result` or the `error`.  The sizes of the XML-RPC payloads,
+    `request_bytes` and `response_bytes`, are computed when accessed.
+    """
+    result = error = duration = None
+    _request_bytes = _response_bytes = None
+
+    def __init__(self, endpoint, name, args):
+        self.endpoint = endpoint
+        self.name = name
+        self.args = args
+        if name in ('execute', 'execute_kw') and len(args) > 4:
+            (self.model, self.method) = args[3:5]
+        else:
+            (self.model, self.method) = (None, name)
+        self.start = time.time()
+
+    def __repr__(self):
+        return '<RPCCall %s>' % self.key
+
+    @property
+    def key(self):
+        """The model and the method, or the endpoint and the method."""
+        return '%s.%s' % (self.model or self.endpoint, self.method)
+
+    @property
+    def request_bytes(self):
+        if self._request_bytes is None:
+            self._request_bytes = _xmlrpc_size(self.args, self.name)
+        return self._request_bytes
+
+    @property
+    def response_bytes(self):
+        if self._response_bytes is None:
+            if isinstance(self.error, Fault):
+                self._response_bytes = len(dumps(self.error))
+            elif self.error is not None:
+                self._response_bytes = 0
+            else:
+                self._response_bytes = _xmlrpc_size((self.result,))
+        return self._response_bytes
+
+
+class _Hook(object):
+    def __init__(self, before=None, after=None):
+        self.before = before
+        self.after = after
+
+
+class JSONTrace(object):
+    """A tracing hook which writes one JSON line per RPC call.
+
+    The lines are written to the file-like `stream`.  If `spans` is
+    :const:`True`, each line is a span, in the format of the OpenTelemetry
+    data model, with the `trace_id` (or a random id).  Otherwise, it is
+    a log record with the model, the method, the duration and the sizes.
+    Register it with ``client.add_trace(after=JSONTrace(stream))``.
+    """
+
+    def __init__(self, stream, spans=False, trace_id=None):
+        import random
+        self.stream = stream
+        self.spans = spans
+        self.trace_id = trace_id or '%032x' % random.getrandbits(128)
+        self._random = random.Random()
+        self._lock = threading.Lock()
+
+    def __call__(self, call):
+        import json
+        if self.spans:
+            record = self._span(call)
+        else:
+            record = {
+                'time': time.strftime('%Y-%m-%dT%H:%M:%S',
+                                      time.gmtime(call.start)),
+                'endpoint': call.endpoint, 'model': call.model,
+                'method': call.method, 'duration': round(call.duration, 6),
+                'request_bytes': call.request_bytes,
+                'response_bytes': call.response_bytes,
+                'error': call.error and _error_message(call.error)}
+        line = json.dumps(record, sort_keys=True) + '\n'
+        with self._lock:
+            self.stream.write(line)
+
+    def _span(self, call):
+        if call.error is None:
+            status = {'code': 'OK'}
+        else:
+            status = {'code': 'ERROR',
+                      'description': _error_message(call.error)}
+        attributes = {'rpc.system': 'xmlrpc', 'rpc.service': call.endpoint,
+                      'rpc.method': call.name,
+                      'rpc.request.size': call.request_bytes,
+                      'rpc.response.size': call.response_bytes}
+        if call.model:
+            attributes.update({'openerp.model': call.model,
+                               'openerp.method': call.method})
+        return {'name': call.key, 'kind': 'CLIENT',
+                'trace_id': self.trace_id,
+                'span_id': '%016x' % self._random.getrandbits(64),
+                'start_time_unix_nano': int(call.start * 1e9),
+                'end_time_unix_nano': int((call.start + call.duration) * 1e9),
+                'attributes': attributes, 'status': status}
+
+
+class RPCBudget(object):
+    """Count the RPC calls of the `client`, and check the limits.
+
+    Use :meth:`Client.rpc_budget` to create it.  The instance is a
+    context manager and a decorator.  On exit, it raises an
+    :exc:`AssertionError` if there were more than `max_calls` calls or
+    more than `max_bytes` bytes sent and received, or it issues a warning
+    if `warn` is :const:`True`.
+
+    The attributes `calls` and `bytes` are the totals, and `methods` is a
+    dictionary of ``[calls, bytes]`` per method.  They are reset each time
+    the budget is entered, or each time the decorated function is called,
+    and they keep the counts of the last run.  The calls of the client
+    are counted in all the threads, including the workers of the
+    parallel jobs and the calls of other threads during this run.
+    """
+    before = None
+
+    def __init__(self, client, max_calls=None, max_bytes=None, warn=False):
+        self.client = client
+        self.max_calls = max_calls
+        self.max_bytes = max_bytes
+        self.warn = warn
+        self.calls = self.bytes = 0
+        self.methods = {}
+        self._depth = 0
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return '<RPCBudget %d/%s calls, %d/%s bytes>' % (
+            self.calls, self.max_calls, self.bytes, self.max_bytes)
+
+    def __enter__(self):
+        with self._lock:
+            self._depth += 1
+            if self._depth > 1:
+                # Nested run of the same budget
+                return self
+            self.calls = self.bytes = 0
+            self.methods = {}
+        self.client._hooks.append(self)
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        with self._lock:
+            self._depth -= 1
+            if self._depth:
+                return
+        self.client._hooks.remove(self)
+        if exc_type is None:
+            self.check()
+
+    def __call__(self, func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with self:
+                return func(*args, **kwargs)
+        return wrapper
+
+    def after(self, call):
+        size = call.request_bytes + call.response_bytes
+        with self._lock:
+            counters = self.methods.setdefault(call.key, [0, 0])
+            counters[0] += 1
+            counters[1] += size
+            self.calls += 1
+            self.bytes += size
+
+    def report(self):
+        """Return the number of calls and bytes per method, as text."""
+        lines = ['%8s %10s  %s' % ('calls', 'bytes', 'method')]
+        for (method, (calls, size)) in sorted(self.methods.items(),
+                                              key=lambda item: -item[1][0]):
+            lines.append('%8d %10d  %s' % (calls, size, method))
+        lines.append('%8d %10d  %s' % (self.calls, self.bytes, 'total'))
+        return '\n'.join(lines)
+
+    def check(self):
+        """Raise or warn if the budget is exceeded."""
+        exceeded = []
+        if self.max_calls is not None and self.calls > self.max_calls:
+            exceeded.append('%d calls > %d' % (self.calls, self.max_calls))
+        if self.max_bytes is not None and self.bytes > self.max_bytes:
+            exceeded.append('%d bytes > %d' % (self.bytes, self.max_bytes))
+        if exceeded:
+            message = 'RPC budget exceeded: %s\n%s' % (', '.join(exceeded),
+                                                       self.report())
+            if not self.warn:
+                raise AssertionError(message)
+            warnings.warn(message, stacklevel=3)
+
+
+class RPCStats(object):
+    """Counters of the RPC calls of a :class:`Client`.
+
+    It counts the calls, the errors, the bytes sent and received, and
+    the latency per ``(model, method)``, and the hits and misses of the
+    caches of the client.  Use :meth:`Client.stats` to read them.
+    The latency histogram uses the upper bounds of the `buckets`.
+    Nothing is counted until it is `enabled`: see
+    :meth:`Client.enable_stats`.  After `max_methods` different methods,
+    the other calls are counted together as ``('other', 'other')``.
+    """
+    before = None
+    buckets = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+    max_methods = 500
+    enabled = False
+
+    def __init__(self):
+        self.methods = {}
+        self.caches = {}
+        self._lock = threading.Lock()
+
+    def after(self, call):
+        key = (call.model or call.endpoint, call.method)
+        bucket = bisect.bisect_left(self.buckets, call.duration)
+        with self._lock:
+            if (key not in self.methods and
+                    len(self.methods) >= self.max_methods):
+                key = ('other', 'other')
+            try:
+                counters = self.methods[key]
+            except KeyError:
+                counters = self.methods[key] = {
+                    'calls': 0, 'errors': 0, 'duration': 0.0,
+                    'bytes_sent': 0, 'bytes_received': 0,
+                    'latency': [0] * (len(self.buckets) + 1)}
+            counters['calls'] += 1
+            counters['errors'] += call.error is not None
+            counters['duration'] += call.duration
+            counters['bytes_sent'] += call._request_bytes or 0
+            counters['bytes_received'] += call._response_bytes or 0
+            counters['latency'][bucket] += 1
+
+    def cache(self, name, hits=0, misses=0):
+        """Count the `hits` and `misses` of the cache `name`."""
+        if not self.enabled:
+            return
+        with self._lock:
+            counters = self.caches.setdefault(name, [0, 0])
+            counters[0] += hits
+            counters[1] += misses
+
+    def snapshot(self):
+        """Return a copy of the counters."""
+        with self._lock:
+            methods = dict([(key, dict(counters, latency=counters[
+                'latency'][:])) for (key, counters) in self.methods.items()])
+            caches = dict([(name, {'hits': hits, 'misses': misses,
+                                   'ratio': hits / float(hits + misses or 1)})
+                           for (name, (hits, misses)) in self.caches.items()])
+        totals = dict([(name, sum([counters[name]
+                                   for counters in methods.values()]))
+                       for name in ('calls', 'errors', 'duration',
+                                    'bytes_sent', 'bytes_received')])
+        return dict(totals, methods=methods, caches=caches)
+
+    def prometheus(self, prefix='erppeek'):
+        """Return the counters in the Prometheus text format."""
+        stats = self.snapshot()
+        lines = []
+
+        def metric(name, kind, doc, samples):
+            name = '%s_%s' % (prefix, name)
+            lines.append('# HELP %s %s' % (name, doc))
+            lines.append('# TYPE %s %s' % (name, kind))
+            for (suffix, labels, value) in samples:
+                labels = ','.join(['%s="%s"' % label for label in labels])
+                lines.append('%s%s{%s} %s' % (name, suffix, labels, value))
+        methods = sorted(stats['methods'].items())
+        for (name, key, doc) in [
+                ('rpc_calls_total', 'calls', 'Number of RPC calls.'),
+                ('rpc_errors_total', 'errors', 'Number of failed RPC calls.'),
+                ('rpc_sent_bytes_total', 'bytes_sent', 'Bytes sent.'),
+                ('rpc_received_bytes_total', 'bytes_received',
+                 'Bytes received.')]:
+            metric(name, 'counter', doc,
+                   [('', (('model', model), ('method', method)), counters[key])
+                    for ((model, method), counters) in methods])
+        samples = []
+        for ((model, method), counters) in methods:
+            labels = (('model', model), ('method', method))
+            count = 0
+            for (bound, value) in zip(self.buckets + ('+Inf',),
+                                      counters['latency']):
+                count += value
+                samples.append(('_bucket', labels + (('le', bound),), count))
+            samples.append(('_sum', labels, repr(counters['duration'])))
+            samples.append(('_count', labels, count))
+        metric('rpc_duration_seconds', 'histogram',
+               'Duration of the RPC calls.', samples)
+        caches = sorted(stats['caches'].items())
+        for (name, key) in [('cache_hits_total', 'hits'),
+                            ('cache_misses_total', 'misses')]:
+            metric(name, 'counter', 'Cache %s.' % key,
+                   [('', (('cache', cache),), counters[key])
+                    for (cache, counters) in caches])
+        return '\n'.join(lines) + '\n'
+
+    def statsd(self, prefix='erppeek', previous=None):
+        """Return the counters as StatsD lines.
+
+        The counters are the increments since the `previous` snapshot, and
+        the timer is the mean duration of these calls, in milliseconds.
+        """
+        stats = self.snapshot()
+        previous = previous and previous['methods'] or {}
+        lines = []
+        for ((model, method), counters) in sorted(stats['methods'].items()):
+            name = '%s.%s.%s' % (prefix, model.replace('.', '_'), method)
+            old = previous.get((model, method), {})
+            calls = counters['calls'] - old.get('calls', 0)
+            if not calls:
+                continue
+            for key in ('calls', 'errors', 'bytes_sent', 'bytes_received'):
+                lines.append('%s.%s:%d|c' %
+                             (name, key, counters[key] - old.get(key, 0)))
+            duration = counters['duration'] - old.get('duration', 0)
+            lines.append('%s.duration:%.3f|ms' % (name,
+                                                  duration * 1000 / calls))
+        for (cache, counters) in sorted(stats['caches'].items()):
+            lines.append('%s.cache.%s.ratio:%.4f|g' %
+                         (prefix, cache, counters['ratio']))
+        return lines, stats
+
+
+class _StatsExporter(threading.Thread):
+    """Write the statistics of the client to a file or a UDP socket."""
+
+    def __init__(self, stats, target, format, interval, prefix):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.stats = stats
+        self.target = target
+        self.format = format
+        self.interval = interval
+        self.prefix = prefix
+        self.previous = None
+        self._stop_event = threading.Event()
+
+    def export(self):
+        if self.format == 'statsd':
+            (lines, self.previous) = self.stats.statsd(self.prefix,
+                                                       self.previous)
+            payload = ''.join([line + '\n' for line in lines])
+        else:
+            payload = self.stats.prometheus(self.prefix)
+        if self.target.startswith('udp://'):
+            (host, port) = self.target[6:].rsplit(':', 1)
+            sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            try:
+                for line in payload.splitlines():
+                    sock.sendto(line.encode('utf-8'), (host, int(port)))
+            finally:
+                sock.close()
+        elif self.format == 'statsd':
+            with open(self.target, 'a') as f:
+                f.write(payload)
+        else:
+            # Replace the file atomically, for the node exporter
+            with open(self.target + '.tmp', 'w') as f:
+                f.write(payload)
+            os.rename(self.target + '.tmp', self.target)
+
+    def run(self):
+        while True:
+            self._stop_event.wait(self.interval)
+            if self._stop_event.is_set():
+                break
+            self.export()
+
+    def stop(self):
+        """Stop the exports, after a last one."""
+        self._stop_event.set()
+        self.join()
+        self.export()
+
+
+def _metered(transport_class):
+    class MeteredTransport(transport_class):
+        """Record the size of the last request and the last response."""
+        sent = received = None
+
+        def send_content(self, connection, request_body):
+            self.sent = len(request_body)
+            return transport_class.send_content(self, connection,
+                                                request_body)
+
+        def parse_response(self, response):
+            length = getattr(response, 'getheader', None)
+            length = length and length('Content-Length')
+            self.received = length and int(length)
+            return transport_class.parse_response(self, response)
+    return MeteredTransport
+_MeteredTransport = _metered(Transport)
+_MeteredSafeTransport = _metered(SafeTransport)
+
+
+def _parse_body(transport, body):
+    (parser, unmarshaller) = transport.getparser()
+    parser.feed(body)
+    parser.close()
+    return unmarshaller.close()
+
+
+def _recording(transport_class):
+    class RecordingTransport(transport_class):
+        """Record the responses in the `cassette`."""
+
+        def __init__(self, cassette):
+            transport_class.__init__(self)
+            self.cassette = cassette
+
+        def request(self, host, handler, request_body, verbose=False):
+            self._request = (handler, request_body, time.time())
+            return transport_class.request(self, host, handler,
+                                           request_body, verbose)
+
+        def parse_response(self, response):
+            body = response.read()
+            if response.getheader('Content-Encoding', '') == 'gzip':
+                import gzip
+                import io
+                body = gzip.GzipFile(fileobj=io.BytesIO(body)).read()
+            (handler, request_body, start) = self._request
+            self.received = len(body)
+            self.cassette._record(handler, request_body,
+                                  time.time() - start, body)
+            return _parse_body(self, body)
+    return RecordingTransport
+_RecordingTransport = _recording(_MeteredTransport)
+_RecordingSafeTransport = _recording(_MeteredSafeTransport)
+
+
+class _ReplayTransport(Transport):
+    """Return the responses of the `cassette`, without network."""
+    sent = received = None
+
+    def __init__(self, cassette):
+        Transport.__init__(self)
+        self.cassette = cassette
+
+    def request(self, host, handler, request_body, verbose=False):
+        (duration, body) = self.cassette._replay(handler, request_body)
+        if self.cassette.latency:
+            time.sleep(duration)
+        self.sent = len(request_body)
+        self.received = len(body)
+        return _parse_body(self, body)
+
+
+class Cassette(object):
+    """Record the XML-RPC responses to a file, or replay them.
+
+    The `filename` is a compressed JSON Lines file.  In ``record`` mode,
+    each response is written with the duration of the call.  In
+    ``replay`` mode, the responses are returned without network, after
+    the recorded duration if `latency` is :const:`True`.  The requests
+    are matched on their endpoint and a hash of their body, so the
+    passwords are not stored.  When the same request is sent more times
+    than recorded, the last response is returned again.
+
+    Pass it to the :class:`Client` with the argument `cassette`.
+    """
+
+    def __init__(self, filename, mode='replay', latency=True):
+        import gzip
+        if mode not in ('record', 'replay'):
+            raise ValueError('Invalid mode %r' % (mode,))
+        self.filename = filename
+        self.mode = mode
+        self.latency = latency
+        self._responses = {}
+        self._lock = threading.Lock()
+        if mode == 'record':
+            self._file = gzip.open(filename, 'wb')
+        else:
+            self._file = None
+            self._load(gzip.open(filename, 'rb'))
+
+    def __repr__(self):
+        return '<Cassette %r %s>' % (self.filename, self.mode)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    @staticmethod
+    def _key(handler, request_body):
+        import hashlib
+        return hashlib.sha1(handler.encode('utf-8') + request_body
+                            ).hexdigest()
+
+    def _load(self, f):
+        import json
+        try:
+            for line in f:
+                entry = json.loads(line.decode('utf-8'))
+                self._responses.setdefault(entry['key'], deque()).append(
+                    (entry['duration'], entry['response'].encode('utf-8')))
+        finally:
+            f.close()
+
+    def _record(self, handler, request_body, duration, body):
+        import json
+        line = json.dumps({'key': self._key(handler, request_body),
+                           'endpoint': handler.rsplit('/', 1)[-1],
+                           'duration': round(duration, 6),
+                           'response': body.decode('utf-8')},
+                          sort_keys=True) + '\n'
+        with self._lock:
+            self._file.write(line.encode('utf-8'))
+
+    def _replay(self, handler, request_body):
+        with self._lock:
+            responses = self._responses.get(self._key(handler, request_body))
+            if not responses:
+                raise ValueError('No response recorded in %s for this %s '
+                                 'request' % (self.filename, handler))
+            if len(responses) > 1:
+                return responses.popleft()
+            return responses[0]
+
+    def transport(self, secure=False):
+        """Return a new transport which records or replays."""
+        if self.mode == 'replay':
+            return _ReplayTransport(self)
+        if secure:
+            return _RecordingSafeTransport(self)
+        return _RecordingTransport(self)
+
+    def close(self):
+        """Close the file of the cassette."""
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+class _Router(object):
+    """Route the read-only calls of a :class:`Client` between servers.
+
+    The calls which are not read-only are pinned to the first server.
+    The policy is read on the `client`: see :attr:`Client.routing` and
+    :attr:`Client.hedged_reads`.  The hedged reads run in a pool of no
+    more than `pool_size` threads; when they are all busy, the reads
+    are not hedged.  An attempt which lost the race is not cancelled,
+    its response is dropped.
+    """
+    # Weight of the last call in the average latency
+    alpha = 0.3
+    # Every `probe` read, try the server which was not used for long
+    probe = 50
+    pool_size = 4
+
+    def __init__(self, client, urls):
+        self.client = client
+        self.urls = list(urls)
+        self.latency = dict.fromkeys(urls)
+        self.samples = dict([(url, deque()) for url in urls])
+        self.last_used = dict.fromkeys(urls, 0)
+        self._reads = 0
+        self._lock = threading.Lock()
+        self._tasks = Queue()
+        self._threads = self._idle = 0
+
+    def _record(self, url, duration):
+        with self._lock:
+            previous = self.latency[url]
+            if previous is None:
+                self.latency[url] = duration
+            else:
+                self.latency[url] = (self.alpha * duration +
+                                     (1 - self.alpha) * previous)
+            samples = self.samples[url]
+            samples.append(duration)
+            if len(samples) > 100:
+                samples.popleft()
+
+    def p95(self, url):
+        """Return the 95th percentile of the recent latency, or None."""
+        samples = sorted(self.samples[url])
+        if len(samples) < 20:
+            return None
+        return _percentile(samples, 95)
+
+    def order(self):
+        """Return the servers, by order of preference for a read."""
+        with self._lock:
+            self._reads += 1
+            if self.client.routing == 'round-robin':
+                index = self._reads % len(self.urls)
+                urls = self.urls[index:] + self.urls[:index]
+            elif self._reads % self.probe == 0:
+                urls = sorted(self.urls, key=self.last_used.get)
+            else:
+                # The servers without measure come first
+                urls = sorted(self.urls, key=lambda url: (
+                    self.latency[url] is not None, self.latency[url]))
+            self.last_used[urls[0]] = self._reads
+        return urls
+
+    def _timed(self, dispatch, name, args, url):
+        start = time.time()
+        try:
+            result = dispatch(name, args, url)
+        except Fault:
+            self._record(url, time.time() - start)
+            raise
+        except Exception:
+            # Penalize the server which failed
+            self._record(url, max(time.time() - start, 1.0) * 10)
+            raise
+        self._record(url, time.time() - start)
+        return result
+
+    def _worker(self):
+        while True:
+            (func, args) = self._tasks.get()
+            func(*args)
+            with self._lock:
+                self._idle += 1
+
+    def _submit(self, func, *args):
+        """Run `func` in the pool.  Return False if the pool is busy."""
+        with self._lock:
+            if self._idle:
+                self._idle -= 1
+            elif self._threads < self.pool_size:
+                self._threads += 1
+                thread = threading.Thread(target=self._worker)
+                thread.daemon = True
+                thread.start()
+            else:
+                return False
+        self._tasks.put((func, args))
+        return True
+
+    def _failover(self, dispatch, name, args, urls):
+        for url in urls[:-1]:
+            try:
+                return self._timed(dispatch, name, args, url)
+            except Fault:
+                raise
+            except Exception:
+                # Try the next server
+                pass
+        return self._timed(dispatch, name, args, urls[-1])
+
+    def _hedged(self, dispatch, name, args, urls):
+        results = Queue()
+
+        def attempt(url):
+            try:
+                results.put((True, self._timed(dispatch, name, args, url)))
+            except Exception:
+                results.put((False, sys.exc_info()[1]))
+        if not self._submit(attempt, urls[0]):
+            return self._failover(dispatch, name, args, urls)
+        (pending, remaining) = (1, urls[1:])
+        timeout = self.p95(urls[0])
+        while True:
+            try:
+                (success, value) = results.get(
+                    timeout=(timeout if remaining else None))
+            except Empty:
+                # The server is slower than usual, ask another one
+                if self._submit(attempt, remaining[0]):
+                    (pending, remaining) = (pending + 1, remaining[1:])
+                timeout = None
+                continue
+            pending -= 1
+            if success:
+                return value
+            if isinstance(value, Fault):
+                raise value
+            # Network error: fail over to the next server
+            if remaining and not pending:
+                return self._failover(dispatch, name, args, remaining)
+            if not pending:
+                raise value
+
+    def __call__(self, dispatch, name, args):
+        if not (name in ('execute', 'execute_kw') and len(args) > 4 and
+                args[4] in _readonly_methods):
+            return dispatch(name, args, self.urls[0])
+        urls = self.order()
+        if self.client.hedged_reads:
+            return self._hedged(dispatch, name, args, urls)
+        return self._failover(dispatch, name, args, urls)
+
 class Service(object):
     """A wrapper around XML-RPC endpoints.
 
@@ -310,17 +1475,53 @@ class Service(object):
     local server.  The `endpoint` argument is the name of the service
     (examples: ``"object"``, ``"db"``).  The `methods` is the list of methods
     which should be exposed on this endpoint.  Use ``dir(...)`` on the
-    instance to list them.
+    instance to list them.  The optional `cassette` is a :class:`Cassette`
+    which records or replays the calls.  The `server` can be a list of
+    URLs: the calls are sent to the first one, unless the :class:`Client`
+    routes the read-only calls to the others.
     """
-    def __init__(self, server, endpoint, methods, verbose=False):
-        if isinstance(server, basestring):
-            self._rpcpath = rpcpath = server + '/xmlrpc/'
-            proxy = ServerProxy(rpcpath + endpoint, allow_none=True)
-            self._dispatch = proxy._ServerProxy__request
+    _hooks = ()
+    _router = None
+
+    def __init__(self, server, endpoint, methods, verbose=False,
+                 cassette=None):
+        if isinstance(server, (basestring, list, tuple)):
+            urls = [server] if isinstance(server, basestring) else server
+            self._rpcpath = urls[0] + '/xmlrpc/'
+            local = threading.local()
+
+            def dispatch(name, args, url=urls[0]):
+                # The connection of a ServerProxy is not thread-safe
+                try:
+                    (proxy, transport) = local.proxies[url]
+                except AttributeError:
+                    local.proxies = {}
+                    return dispatch(name, args, url)
+                except KeyError:
+                    secure = url.startswith('https:')
+                    if cassette is not None:
+                        transport = cassette.transport(secure)
+                    elif secure:
+                        transport = _MeteredSafeTransport()
+                    else:
+                        transport = _MeteredTransport()
+                    proxy = ServerProxy('%s/xmlrpc/%s' % (url, endpoint),
+                                        transport=transport, allow_none=True)
+                    local.proxies[url] = (proxy, transport)
+                local.transport = transport
+                return proxy._ServerProxy__request(name, args)
+            if len(urls) > 1:
+                self._dispatch = lambda name, args: (
+                    self._router(dispatch, name, args) if self._router
+                    else dispatch(name, args))
+            else:
+                self._dispatch = dispatch
+            self._local = local
         else:
             self._rpcpath = ''
             proxy = server.netsvc.ExportService.getService(endpoint)
             self._dispatch = proxy.dispatch
+            self._local = None
         self._endpoint = endpoint
         self._methods = methods
         self._verbose = verbose
@@ -350,18 +1551,39 @@ class Service(object):
                     suffix = '... L=%s' % len(snt)
                     snt = snt[:maxcol - len(suffix)] + suffix
                 print('--> ' + snt)
-                res = self._dispatch(name, args)
-                rcv = str(res)
-                if len(rcv) > maxcol:
-                    suffix = '... L=%s' % len(rcv)
-                    rcv = rcv[:maxcol - len(suffix)] + suffix
-                print('<-- ' + rcv)
+                res = self._call(name, args)
+                print('<-- ' + _trimmed_repr(res, maxcol))
                 return res
         else:
-            wrapper = lambda s, *args: s._dispatch(name, args)
+            wrapper = lambda s, *args: s._call(name, args)
         wrapper.__name__ = name
         return wrapper.__get__(self, type(self))
 
+    def _call(self, name, args):
+        if not self._hooks:
+            return self._dispatch(name, args)
+        hooks = list(self._hooks)
+        call = RPCCall(self._endpoint, name, args)
+        for hook in hooks:
+            if hook.before is not None:
+                hook.before(call)
+        try:
+            call.result = self._dispatch(name, args)
+            return call.result
+        except Exception:
+            call.error = sys.exc_info()[1]
+            raise
+        finally:
+            call.duration = time.time() - call.start
+            transport = getattr(self._local, 'transport', None)
+            if transport is not None:
+                call._request_bytes = transport.sent
+                call._response_bytes = transport.received
+                transport.sent = transport.received = None
+            for hook in hooks:
+                if hook.after is not None:
+                    hook.after(call)
+
 
 class Client(object):
     """Connection to an OpenERP instance.
@@ -374,19 +1596,74 @@ class Client(object):
     The `db` is the name of the database and the `user` should exist in the
     table ``res.users``.  If the `password` is not provided, it will be
     asked on login.
+
+    When the attribute `auto_batch` is :const:`True`, the fields of the
+    records are read in batches: see :ref:`auto-batching <auto-batching>`.
+    The `batch_window` is the delay (in seconds) to collect the records
+    created in other threads before sending the batched request.
+    When `adaptive_prefetch` is :const:`True`, the fields used on the
+    records returned by :meth:`Model.browse` are learned for each call
+    site, and stored in :attr:`prefetch_profiles`.
+
+    The attributes `lazy_field_types`, `lazy_computed_fields` and
+    `lazy_field_size` define the expensive fields which are not read by
+    default on the records: see :ref:`lazy fields <lazy-fields>`.
+
+    The `replica` is an optional :class:`Replica` of some models, used
+    by ``Model.browse(..., source='replica')``.
+
+    The optional `cassette` is a :class:`Cassette`, to record the
+    XML-RPC responses or to replay them offline.
+
+    The `server` can be a list of URLs of instances which share the
+    same database.  The calls which modify data are sent to the first
+    one, and the read-only calls are routed to all of them, according
+    to the `routing` policy: ``'latency'`` prefers the server with the
+    lowest average latency and ``'round-robin'`` rotates them.  When
+    `hedged_reads` is :const:`True`, a read which is slower than the
+    95th percentile of the server is sent again to the next server, and
+    the first response wins.
+
+    The parallel requests of the exports, the imports and
+    :meth:`Model.resolve_names` are limited by the shared
+    :class:`AdaptiveConcurrency` of the `concurrency` attribute.
     """
     _config_file = os.path.join(os.path.curdir, CONF_FILE)
+    auto_batch = False
+    batch_window = 0
+    adaptive_prefetch = False
+    lazy_field_types = ('binary',)
+    lazy_computed_fields = True
+    lazy_field_size = None
+    replica = None
+    routing = 'latency'
+    hedged_reads = False
 
     def __init__(self, server, db=None, user=None, password=None,
-                 verbose=False):
+                 verbose=False, cassette=None, stats=False):
         if isinstance(server, basestring) and server[-1:] == '/':
             server = server.rstrip('/')
+        elif isinstance(server, (list, tuple)):
+            server = tuple([url.rstrip('/') for url in server])
+            if len(server) == 1:
+                (server,) = server
         self._server = server
+        if isinstance(server, tuple):
+            self._router = _Router(self, server)
+        else:
+            self._router = None
         self._db = ()
         self._environment = None
         self.user = None
         self._execute = None
         self._models = {}
+        self.prefetch_profiles = {}
+        self._xmlids = {}
+        self._stats = RPCStats()
+        self._hooks = []
+        self.concurrency = AdaptiveConcurrency(hooks=self._hooks)
+        if stats:
+            self.enable_stats()
         major_version = None
 
         def get_proxy(name):
@@ -395,7 +1672,11 @@ class Client(object):
             else:
                 # Only for OpenERP >= 6
                 methods = _methods[name] + _methods_6_1[name]
-            return Service(server, name, methods, verbose=verbose)
+            service = Service(server, name, methods, verbose=verbose,
+                              cassette=cassette)
+            service._hooks = self._hooks
+            service._router = self._router
+            return service
         self.server_version = ver = get_proxy('db').server_version()
         self.major_version = major_version = '.'.join(ver.split('.', 2)[:2])
         # Create the XML-RPC proxies
@@ -424,7 +1705,10 @@ class Client(object):
         return client
 
     def __repr__(self):
-        return "<Client '%s#%s'>" % (self._server or '', self._db)
+        server = self._server or ''
+        if isinstance(server, tuple):
+            server = ','.join(server)
+        return "<Client '%s#%s'>" % (server, self._db)
 
     def login(self, user, password=None, database=None):
         """Switch `user` and (optionally) `database`.
@@ -458,7 +1742,8 @@ class Client(object):
         # Authenticated endpoints
         def authenticated(method):
             return functools.partial(method, self._db, uid, password)
-        self._execute = authenticated(self._object.execute)
+        self._execute = _SingleFlight(authenticated(self._object.execute),
+                                      self._stats)
         self._exec_workflow = authenticated(self._object.exec_workflow)
         self.report = authenticated(self._report.report)
         self.report_get = authenticated(self._report.report_get)
@@ -527,7 +1812,8 @@ class Client(object):
         # Don't call multiple times
         del Client._set_interactive
         global_names = ['wizard', 'exec_workflow', 'read', 'search', 'count',
-                        'model', 'models', 'keys', 'fields', 'field', 'access']
+                        'model', 'models', 'keys', 'fields', 'field', 'access',
+                        'profile']
 
         def connect(self, env=None):
             """Connect to another environment and replace the globals()."""
@@ -582,6 +1868,127 @@ class Client(object):
         except KeyboardInterrupt:
             print({'id': thread_id, 'progress': progress})
 
+    def rpc_budget(self, max_calls=None, max_bytes=None, warn=False):
+        """Limit the number of RPC calls and the bytes transferred.
+
+        Return a :class:`RPCBudget`, to use as a context manager or as
+        a decorator.  It counts the calls of this client, and it raises an
+        :exc:`AssertionError` with the calls per method if the budget is
+        exceeded, or it issues a warning if `warn` is :const:`True`::
+
+            with client.rpc_budget(max_calls=5):
+                for partner in client.model('res.partner').browse([]):
+                    partner.name
+        """
+        return RPCBudget(self, max_calls, max_bytes, warn)
+
+    def enable_stats(self, enable=True):
+        """Start or stop counting the RPC calls of this client.
+
+        The statistics are disabled by default, unless the client is
+        created with ``stats=True``.  The counters are kept when they are
+        disabled.
+        """
+        self._stats.enabled = enable
+        if enable and self._stats not in self._hooks:
+            self._hooks.append(self._stats)
+        elif not enable and self._stats in self._hooks:
+            self._hooks.remove(self._stats)
+
+    def stats(self):
+        """Return the statistics of the RPC calls of this client.
+
+        The result is a dictionary with the totals: ``calls``, ``errors``,
+        ``duration``, ``bytes_sent`` and ``bytes_received``.  The key
+        ``methods`` has the same counters per ``(model, method)``, and the
+        latency histogram.  The key ``caches`` has the ``hits``, the
+        ``misses`` and the ``ratio`` of the caches of the client.
+        The calls are counted after :meth:`enable_stats` only.
+        """
+        return self._stats.snapshot()
+
+    def export_stats(self, target, format='prometheus', interval=None,
+                     prefix='erppeek'):
+        """Write the statistics in the Prometheus or StatsD format.
+
+        The `target` is a file name, or ``udp://host:port``.  The `format`
+        is ``prometheus`` or ``statsd``.  A Prometheus file is replaced
+        on each export, while the StatsD lines are appended.  If the
+        `interval` is set, the statistics are exported every `interval`
+        seconds by a thread, until its ``stop()`` method is called.
+        The statistics are enabled if needed.  Return this thread.
+        """
+        if format not in ('prometheus', 'statsd'):
+            raise ValueError('Invalid format %r' % (format,))
+        self.enable_stats()
+        exporter = _StatsExporter(self._stats, target, format,
+                                  interval, prefix)
+        if interval:
+            exporter.start()
+        else:
+            exporter.export()
+        return exporter
+
+    def add_trace(self, before=None, after=None):
+        """Register callbacks for the RPC calls of this client.
+
+        The `before` callback receives a :class:`RPCCall` before the
+        request is sent, and the `after` callback receives the same
+        :class:`RPCCall` when the call is complete, successful or not.
+        Return the hook, to remove it with :meth:`remove_trace`.
+        """
+        hook = _Hook(before, after)
+        self._hooks.append(hook)
+        return hook
+
+    def remove_trace(self, hook):
+        """Remove the hook returned by :meth:`add_trace`."""
+        self._hooks.remove(hook)
+
+    def profile(self, expr, limit=10):
+        """Run the `expr` with the profiler, and print a report.
+
+        The `expr` is a callable, or a Python expression evaluated in
+        the namespace of the caller.  The report splits the time of the
+        RPC round trips from the client time, lists the `limit` slowest
+        RPC calls and the functions which spent the most time.
+        Return the result of `expr`.
+        """
+        try:
+            import cProfile as profile
+        except ImportError:     # PyPy
+            import profile
+        import pstats
+        if not callable(expr):
+            frame = sys._getframe(1)
+            (code, namespace) = (expr, frame.f_globals)
+            expr = lambda: eval(code, namespace, frame.f_locals)
+        calls = []
+        hook = self.add_trace(after=calls.append)
+        profiler = profile.Profile()
+        (wall, cpu) = (time.time(), _cpu_time())
+        try:
+            return profiler.runcall(expr)
+        finally:
+            (wall, cpu) = (time.time() - wall, _cpu_time() - cpu)
+            self.remove_trace(hook)
+            rpc_time = sum([call.duration for call in calls])
+            received = sum([call._response_bytes or 0 for call in calls])
+            print('Profile: %.3fs wall time, %.3fs CPU time' % (wall, cpu))
+            print('  RPC:    %d calls, %.3fs round trips, %d bytes received'
+                  % (len(calls), rpc_time, received))
+            print('  Client: %.3fs outside the RPC calls' %
+                  max(wall - rpc_time, 0))
+            if calls:
+                print('Slowest RPC calls:')
+                calls.sort(key=lambda call: -call.duration)
+                for call in calls[:limit]:
+                    print('  %8.3fs  %s%s' % (call.duration, call.key,
+                                             call.error and ' (error)' or ''))
+            print('Client functions:')
+            stats = pstats.Stats(profiler, stream=sys.stdout)
+            stats.sort_stats('tottime').print_stats(limit)
+
     def execute(self, obj, method, *params, **kwargs):
         """Wrapper around ``object.execute`` RPC method.
 
@@ -701,6 +2108,7 @@ class Client(object):
 
         # Empty the models' cache
         self._models.clear()
+        self._xmlids.pop(self._db, None)
 
         # Apply scheduled upgrades
         if self.major_version == '5.0':
@@ -763,7 +2171,24 @@ class Client(object):
         used to restrict the search.  The `order` is also used to order the
         results returned.  Note: the low-level RPC method ``read`` itself does
         not preserve the order of the results.
+
+        If the keyword argument `format` is ``'columns'``, return a
+        dictionary of columns indexed by field name, including the ``id``.
+        The numeric, boolean, date and ``many2one`` columns are typed
+        arrays (see :ref:`columns <columns>`).
+
+        If the keyword argument `rows` is ``'tuple'``, return a tuple
+        ``(header, rows)``: the `header` is the tuple of the field names,
+        starting with ``id``, and each row is a tuple of values.  The
+        relational values are tuples, and the repeated strings are shared.
+        With ``rows='namedtuple'``, return a list of named tuples.
         """
+        if kwargs.pop('format', None) == 'columns':
+            return self._read_columns(obj, *params, **kwargs)
+        rows = kwargs.pop('rows', None)
+        if rows in ('tuple', 'namedtuple'):
+            kwargs['named'] = (rows == 'namedtuple')
+            return self._read_tuples(obj, *params, **kwargs)
         fmt = None
         if len(params) > 1 and isinstance(params[1], basestring):
             fmt = ('%(' in params[1]) and params[1]
@@ -788,6 +2213,63 @@ class Client(object):
             return res[fields[0]]
         return res
 
+    def resolve_xmlids(self, xml_ids, preload=False):
+        """Return the ``(model, res_id)`` of each xml_id of the list.
+
+        The `xml_ids` which are not cached yet are read with a single
+        request on ``ir.model.data``.  They are cached for the current
+        database, and :meth:`Model.get` uses the same cache.
+        Return a dictionary, where the missing `xml_ids` are None.
+        If `preload` is True, all the xml_ids of the same modules are
+        loaded in the cache.
+        """
+        (cache, preloaded) = self._xmlids.setdefault(self._db, ({}, set()))
+        (missing, misses) = ({}, 0)
+        for xml_id in xml_ids:
+            if xml_id not in cache:
+                (module, name) = xml_id.split('.')
+                if module not in preloaded:
+                    missing.setdefault(module, set()).add(name)
+                    misses += 1
+        self._stats.cache('xmlids', len(xml_ids) - misses, misses)
+        if missing:
+            domain = ['|'] * (len(missing) - 1)
+            for (module, names) in sorted(missing.items()):
+                if preload:
+                    domain.append(('module', '=', module))
+                    continue
+                if len(missing) > 1:
+                    domain.append('&')
+                domain += [('module', '=', module),
+                           ('name', 'in', sorted(names))]
+            for res in self.read('ir.model.data', domain,
+                                 'module name model res_id'):
+                cache['%s.%s' % (res['module'], res['name'])] = \
+                    (res['model'], res['res_id'])
+            if preload:
+                preloaded.update(missing)
+        return dict([(xml_id, cache.get(xml_id)) for xml_id in xml_ids])
+
+    def _read_columns(self, obj, domain, fields=None, **kwargs):
+        if isinstance(domain, int_types):
+            domain = [domain]
+        fields = _parse_fields(kwargs.pop('fields', fields))
+        rows = self.execute(obj, 'read', domain, fields, **kwargs)
+        return self.model(obj, False)._columns(rows, fields)
+
+    def _read_tuples(self, obj, domain, fields=None, named=False, **kwargs):
+        if isinstance(domain, int_types):
+            domain = [domain]
+        fields = _parse_fields(kwargs.pop('fields', fields))
+        rows = self.execute(obj, 'read', domain, fields, **kwargs)
+        rows = [row for row in rows if row]
+        if fields is None:
+            fields = sorted(rows[0]) if rows else []
+        header = ('id',) + tuple([name for name in fields if name != 'id'])
+        if named:
+            return _tuple_rows(rows, header, _namedtuple('Row', header)._make)
+        return header, _tuple_rows(rows, header)
+
     def _model(self, name):
         try:
             return self._models[name]
@@ -879,6 +2361,20 @@ class Client(object):
         except (TypeError, Fault):
             return False
 
+    def save_prefetch_profiles(self, filename):
+        """Save the :attr:`prefetch_profiles` in the file `filename`."""
+        profiles = dict([(key, sorted(fields))
+                         for (key, fields) in self.prefetch_profiles.items()])
+        with open(filename, 'w') as f:
+            f.write(pformat(profiles) + '\n')
+
+    def load_prefetch_profiles(self, filename):
+        """Load the :attr:`prefetch_profiles` from the file `filename`."""
+        with open(filename) as f:
+            profiles = literal_eval(f.read())
+        for (key, fields) in profiles.items():
+            self.prefetch_profiles[key] = set(fields)
+
     def __getattr__(self, method):
         if not method.islower():
             rv = self.model(lowercase(method))
@@ -897,6 +2393,98 @@ class Client(object):
         return wrapper.__get__(self, type(self))
 
 
+class _Prefetch(object):
+    """Field values shared by a batch of records.
+
+    When a field is missing for one record, it is read for all the
+    records of the batch which miss it, with a single RPC call.
+    The batch of a :class:`RecordList` contains its records.  The
+    standalone records are collected in an open batch of the model,
+    which is closed on the first read.
+    """
+
+    def __init__(self, model, ids, context=None, open_key=None,
+                 profile=None):
+        self.model = model
+        self.ids = ids
+        self.context = context
+        self.values = {}
+        self.stamps = {}
+        self.related = {}
+        self.used = set()
+        self._profile = profile or ()
+        self._open_key = open_key
+        self._lock = threading.Lock()
+
+    def get(self, id_, field):
+        """Return the value of the `field` for the record `id_`.
+
+        Raise a ``KeyError`` if the record cannot be read.
+        """
+        with self._lock:
+            self.used.add(field)
+            values = self.values.get(id_)
+            if values is None or field not in values:
+                # Read the fields of the profile at the same time
+                keys = self.model._keys
+                self._fetch([field] + [fld for fld in sorted(self._profile)
+                                       if fld != field and fld in keys], id_)
+                self._profile = ()
+                values = self.values.get(id_) or {}
+        return values[field]
+
+    def discard(self, id_):
+        """Forget the values of the record `id_`."""
+        self.values.pop(id_, None)
+        self.stamps.pop(id_, None)
+
+    def _close(self):
+        window = self.model.client.batch_window
+        if window:
+            # Let the other threads join the batch
+            time.sleep(window)
+        batches = self.model._batches
+        if batches.get(self._open_key) is self:
+            del batches[self._open_key]
+        self._open_key = None
+
+    def _fetch(self, fields, id_):
+        if self._open_key is not None:
+            self._close()
+        ids, seen = [], set([False])
+        for rid in self.ids + [id_]:
+            if rid in seen:
+                continue
+            seen.add(rid)
+            values = self.values.get(rid, ())
+            if [fld for fld in fields if fld not in values]:
+                ids.append(rid)
+        if not ids:
+            return
+        model = self.model
+        rows = model.client.execute(model._name, 'read', ids, fields,
+                                    context=self.context)
+        for row in rows:
+            if not row:
+                continue
+            values = self.values.setdefault(row['id'], {})
+            for fld in fields:
+                values[fld] = row[fld]
+        for fld in fields:
+            field = model._fields.get(fld) or {}
+            if field.get('type') in ('many2one', 'one2many', 'many2many'):
+                # Batch the related records too
+                rel_ids = []
+                for row in rows:
+                    value = row and row[fld]
+                    if field['type'] == 'many2one':
+                        value = value and [value[0]] or []
+                    rel_ids.extend(value or ())
+                rel_model = model.client.model(field['relation'], False)
+                self.related[fld] = _Prefetch(rel_model, rel_ids,
+                                              context=self.context)
+
+
 class Model(object):
     """The class for OpenERP models."""
 
@@ -910,10 +2498,21 @@ class Model(object):
         self.search = functools.partial(client.search, name)
         self.count = functools.partial(client.count, name)
         self.read = functools.partial(client.read, name)
+        self._batches = {}
+        self._resolved_names = {}
 
     def __repr__(self):
         return "<Model '%s'>" % (self._name,)
 
+    def _batch(self, context=None):
+        """Return the open batch of records, for auto-batching."""
+        key = repr(context)
+        try:
+            return self._batches[key]
+        except KeyError:
+            batch = _Prefetch(self, [], context=context, open_key=key)
+            return self._batches.setdefault(key, batch)
+
     def _get_keys(self):
         obj_keys = self._execute('fields_get_keys')
         obj_keys.sort()
@@ -943,6 +2542,32 @@ class Model(object):
         """Return the field properties for field `name`."""
         return self._fields[name]
 
+    def _is_lazy(self, field):
+        """Check if the field is too expensive to be read by default."""
+        client = self.client
+        if field['type'] in client.lazy_field_types:
+            return True
+        if ((client.lazy_computed_fields and
+             field.get('function') and not field.get('store'))):
+            return True
+        if client.lazy_field_size is not None:
+            if field['type'] in ('text', 'html'):
+                return True
+            return (field['type'] == 'char' and
+                    (field.get('size') or 0) > client.lazy_field_size)
+        return False
+
+    def _default_fields(self):
+        """Return the fields which are read by default on the records.
+
+        Return None if no field is excluded.
+        """
+        fields = self._fields
+        lazy = [name for (name, field) in fields.items()
+                if self._is_lazy(field)]
+        if lazy:
+            return sorted(set(fields).difference(lazy))
+
     def access(self, mode="read"):
         """Check if the user has access to this model.
 
@@ -959,8 +2584,12 @@ class Model(object):
         or a search domain.
         If it is a single integer, the return value is a :class:`Record`.
         Otherwise, the return value is a :class:`RecordList`.
+        If the keyword argument `source` is ``'replica'``, the search and
+        the values of the records use the :attr:`Client.replica`.
         """
         context = kwargs.pop('context', None)
+        if kwargs.pop('source', None) == 'replica':
+            return self._browse_replica(domain, params, kwargs, context)
         if isinstance(domain, int_types):
             assert not params and not kwargs
             return Record(self, domain, context=context)
@@ -972,7 +2601,43 @@ class Model(object):
                 print('Ignoring: %s = %r' % item)
         else:
             assert not params and not kwargs
-        return RecordList(self, domain, context=context)
+        records = RecordList(self, domain, context=context)
+        if self.client.adaptive_prefetch:
+            self._set_profile(records, sys._getframe(1))
+        return records
+
+    def _browse_replica(self, domain, params, kwargs, context=None):
+        replica = self.client.replica
+        if isinstance(domain, int_types):
+            assert not params and not kwargs
+            ids = [domain]
+        elif issearchdomain(domain):
+            params = searchargs((domain,) + params, kwargs, context)
+            ids = replica.search(self._name, *params[:4])
+            for item in kwargs.items():
+                print('Ignoring: %s = %r' % item)
+        else:
+            assert not params and not kwargs
+            ids = domain
+        # The fields which are not replicated are read from the server
+        prefetch = _Prefetch(self, list(ids), context=context)
+        for values in replica.read(self._name, prefetch.ids):
+            if values:
+                prefetch.values[values['id']] = values
+        if isinstance(domain, int_types):
+            return Record(self, domain, context=context, prefetch=prefetch)
+        return RecordList(self, ids, context=context, prefetch=prefetch)
+
+    def _set_profile(self, records, frame):
+        # The fields used at this call site are learned from the last
+        # browse, and read with the first missing field
+        key = (self._name,
+               '%s:%d' % (frame.f_code.co_filename, frame.f_lineno))
+        profiles = self.client.prefetch_profiles
+        prefetch = _Prefetch(self, records.id, context=records._context,
+                             profile=frozenset(profiles.get(key, ())))
+        profiles[key] = prefetch.used
+        records.__dict__['_prefetch'] = prefetch
 
     def get(self, domain, context=None):
         """Return a single :class:`Record`.
@@ -985,11 +2650,9 @@ class Model(object):
         if isinstance(domain, int_types):   # a single id
             return Record(self, domain, context=context)
         if isinstance(domain, basestring):  # lookup the xml_id
-            module, name = domain.split('.')
-            data = self.client.model('ir.model.data').read(
-                [('module', '=', module), ('name', '=', name)], 'model res_id')
-            assert not data or data[0]['model'] == self._name
-            ids = [res['res_id'] for res in data]
+            res = self.client.resolve_xmlids([domain])[domain]
+            assert not res or res[0] == self._name
+            ids = res and [res[1]] or []
         else:                               # a search domain
             assert issearchdomain(domain)
             params = searchargs((domain,), {'offset':0, 'limit':None, 'order':None}, context=context)
@@ -998,6 +2661,200 @@ class Model(object):
             raise ValueError('domain matches too many records (%d)' % len(ids))
         return Record(self, ids[0], context=context) if ids else None
 
+    def get_many(self, xml_ids, context=None):
+        """Return the list of :class:`Record` for the `xml_ids`.
+
+        The `xml_ids` are resolved with a single request, see
+        :meth:`Client.resolve_xmlids`.  The missing records are None.
+        """
+        resolved = self.client.resolve_xmlids(xml_ids)
+        records = []
+        for xml_id in xml_ids:
+            res = resolved[xml_id]
+            assert not res or res[0] == self._name
+            records.append(res and Record(self, res[1], context=context))
+        return records
+
+    def resolve_names(self, values, operator='=', workers=4, context=None):
+        """Return the ids of the records which match the names.
+
+        Each name of the `values` list is searched once.  The exact names
+        are searched with a single request, then the other names are
+        searched with ``name_search`` and the `operator`, with up to
+        `workers` concurrent requests.  When several records match a name,
+        the first one is used.  Return a dictionary where the names not
+        found are None.  The results are cached on the :class:`Model`.
+        """
+        cache = self._resolved_names.setdefault(operator, {})
+        (hits, missing, seen) = (0, [], set(cache))
+        for value in values:
+            if value in cache:
+                hits += 1
+            elif value not in seen:
+                seen.add(value)
+                missing.append(value)
+        self.client._stats.cache('names', hits, len(missing))
+        if missing and 'name' in self._keys:
+            rows = self.client.execute(self._name, 'read',
+                                       [('name', 'in', missing)], ['name'],
+                                       context=context)
+            # The first record wins
+            for row in reversed(rows):
+                cache[row['name']] = row['id']
+            missing = [value for value in missing if value not in cache]
+
+        def name_search(value):
+            res = self._execute('name_search', value, [], operator,
+                                context, 1)
+            return res and res[0][0] or None
+        for (value, id_) in zip(missing, _imap(name_search, missing, workers,
+                                               self.client.concurrency)):
+            cache[value] = id_
+        return dict([(value, cache[value]) for value in values])
+
+    def read_group(self, domain, fields, groupby, offset=0, limit=None,
+                   orderby=False, context=None):
+        """Aggregate the values of the records on the server.
+
+        The argument `domain` is a search domain, with the same syntax as
+        :meth:`Client.search`.  The arguments `fields` and `groupby` are
+        lists of field names, or strings of space-separated names.
+        Return a list of dictionaries, one per group, with the aggregated
+        values of the `fields`.  The records are grouped by the first
+        `groupby` field only: the ``__domain`` of each group selects its
+        records, to group them by the next field.  The `orderby` argument
+        needs OpenERP 6.1 or later.
+        """
+        (domain,) = searchargs((domain,))
+        if isinstance(fields, basestring):
+            fields = fields.split()
+        if isinstance(groupby, basestring):
+            groupby = groupby.split()
+        params = (domain, list(fields), list(groupby), offset, limit, context)
+        if orderby:
+            params += (orderby,)
+        return self._execute('read_group', *params)
+
+    def sum(self, field, domain=None, by=None, context=None):
+        """Return the sum of `field` for the records matching `domain`.
+
+        If `by` is a field name, or a list of field names, return a
+        dictionary of sums indexed by the values of these fields.  The
+        values of the ``many2one`` fields are ``(id, name)`` tuples.
+        When there are several `by` fields, the keys are tuples, and
+        each group is queried again for the next field.
+        """
+        if isinstance(by, basestring):
+            by = by.split()
+        by = list(by or ())
+        (domain,) = searchargs((domain or [],))
+        if not by:
+            groups = self._execute('read_group', domain, [field], [],
+                                   0, None, context)
+            return groups and groups[0][field] or 0
+        totals = {}
+
+        def collect(domain, names, key):
+            name = names[0]
+            groups = self._execute('read_group', domain, [field, name],
+                                   [name], 0, None, context)
+            for group in groups:
+                value = group[name]
+                if isinstance(value, list):
+                    value = tuple(value)
+                if names[1:]:
+                    collect(group['__domain'], names[1:], key + (value,))
+                elif key:
+                    totals[key + (value,)] = group[field] or 0
+                else:
+                    totals[value] = group[field] or 0
+        collect(domain, by, ())
+        return totals
+
+    def _changed(self, stamps, context=None):
+        """Return the ids which changed since the date of their stamp.
+
+        The argument `stamps` is a dictionary of ``write_date`` values,
+        indexed by ids.  The records without stamp are considered changed.
+        """
+        ids = [id_ for (id_, stamp) in stamps.items() if stamp]
+        current = {}
+        if ids:
+            rows = self.client.execute(self._name, 'read', ids,
+                                       ['write_date', 'create_date'],
+                                       context=context)
+            for row in rows:
+                if row:
+                    current[row['id']] = (row['write_date'] or
+                                          row['create_date'])
+        return [id_ for (id_, stamp) in stamps.items()
+                if not stamp or current.get(id_) != stamp]
+
+    def _refetch(self, ids, fields, context=None):
+        """Read the `fields` and the stamp of the records `ids`."""
+        fields = set(fields).union(['write_date', 'create_date'])
+        fields.discard('id')
+        rows = self.client.execute(self._name, 'read', ids, sorted(fields),
+                                   context=context)
+        return dict([(row['id'], row) for row in rows if row])
+
+    def revalidate(self, records, context=None):
+        """Refresh the cached records which changed on the server.
+
+        The argument `records` is a list of :class:`Record` of this model,
+        or a :class:`RecordList`.  The ``write_date`` of the cached records
+        is read with a single RPC call, and the values of the records which
+        changed are read again with another RPC call.  The first time, all
+        the cached records are read again, to know the date of their values.
+        Return the list of the records which changed, or a
+        :class:`RecordList` if `records` is a :class:`RecordList`.
+
+        Only the records of a :class:`RecordList` with shared values are
+        cached, with :attr:`Client.auto_batch` or
+        :attr:`Client.adaptive_prefetch`.  Otherwise the method
+        :meth:`RecordList.read` does not cache the values, and an empty
+        :class:`RecordList` is returned.
+        """
+        if isinstance(records, RecordList):
+            prefetch = records._prefetch
+            if prefetch is None:
+                return RecordList(self, [], context=records._context)
+            with prefetch._lock:
+                stamps = dict([(id_, prefetch.stamps.get(id_))
+                               for id_ in prefetch.values])
+                changed = self._changed(stamps, context=context)
+                fields = set()
+                for id_ in changed:
+                    fields.update(prefetch.values.pop(id_))
+                    prefetch.stamps.pop(id_, None)
+                if changed:
+                    rows = self._refetch(changed, fields, context=context)
+                    for (id_, row) in rows.items():
+                        prefetch.values[id_] = dict(row)
+                        prefetch.stamps[id_] = (row['write_date'] or
+                                                row['create_date'])
+            return RecordList(self, changed, context=records._context)
+        records = [rec for rec in records if rec._cached_keys]
+        stamps = dict([(rec.id, rec.__dict__.get('_write_date'))
+                       for rec in records])
+        changed_ids = set(self._changed(stamps, context=context))
+        changed = [rec for rec in records if rec.id in changed_ids]
+        cached_keys = [rec._cached_keys.copy() for rec in changed]
+        for rec in changed:
+            rec.refresh()
+        if changed:
+            fields = set()
+            for keys in cached_keys:
+                fields.update(keys)
+            rows = self._refetch(sorted(changed_ids), fields, context=context)
+            for (rec, keys) in zip(changed, cached_keys):
+                row = rows.get(rec.id)
+                if row:
+                    rec._update(dict([(key, row[key]) for key in keys]))
+                    rec.__dict__['_write_date'] = (row['write_date'] or
+                                                   row['create_date'])
+        return changed
+
     def create(self, values, context=None):
         """Create a :class:`Record`.
 
@@ -1008,26 +2865,45 @@ class Model(object):
         new_id = self._execute('create', values, context=context)
         return Record(self, new_id, context=context)
 
-    def _browse_values(self, values, context=None):
+    def _columns(self, rows, fields=None):
+        """Convert the `rows` read from the server to typed columns."""
+        rows = [row for row in rows if row]
+        if fields is None:
+            fields = sorted(rows[0]) if rows else []
+        columns = {'id': _column([row['id'] for row in rows], 'integer')}
+        for name in fields:
+            if name != 'id':
+                field_type = self._fields.get(name, {}).get('type')
+                columns[name] = _column([row[name] for row in rows],
+                                        field_type)
+        return columns
+
+    def _browse_values(self, values, context=None, prefetch=None):
         """Wrap the values of a Record.
 
         The argument `values` is a dictionary of values read from a Record.
         When the field type is relational (many2one, one2many or many2many),
         the value is wrapped in a Record or a RecordList.
+        The optional `prefetch` is the batch of the records which provides
+        the values.
         Return a dictionary with the same keys as the `values` argument.
         """
+        related = prefetch and prefetch.related or {}
         for key, value in values.items():
-            if key == 'id':
+            field = self._fields.get(key)
+            if field is None:
+                # The 'id' or a magic column like 'write_date'
                 continue
-            field = self._fields[key]
             field_type = field['type']
             if field_type == 'many2one':
                 if value:
                     rel_model = self.client.model(field['relation'], False)
-                    values[key] = Record(rel_model, value, context=context)
+                    values[key] = Record(rel_model, value, context=context,
+                                         prefetch=related.get(key))
             elif field_type in ('one2many', 'many2many'):
                 rel_model = self.client.model(field['relation'], False)
-                values[key] = RecordList(rel_model, value, context=context)
+                values[key] = RecordList(rel_model, value, context=context,
+                                         prefetch=related.get(key))
             elif value and field_type == 'reference':
                 res_model, res_id = value.split(',')
                 rel_model = self.client.model(res_model, False)
@@ -1078,7 +2954,7 @@ class RecordList(object):
     to assign a single value to all the selected records.
     """
 
-    def __init__(self, res_model, ids, context=None):
+    def __init__(self, res_model, ids, context=None, prefetch=None):
         _ids = []
         for id_ in ids:
             if isinstance(id_, (list, tuple)):
@@ -1092,6 +2968,7 @@ class RecordList(object):
             '_model': res_model,
             '_idnames': ids,
             '_context': context,
+            '_prefetch': prefetch,
             '_execute': res_model._execute,
         })
 
@@ -1103,18 +2980,221 @@ class RecordList(object):
         return "<RecordList '%s,%s'>" % (self._model_name, ids)
 
     def __dir__(self):
-        return ['__getitem__', 'read', 'write', 'unlink', '_context',
-                '_idnames', '_model', '_model_name'] + self._model._keys
+        return ['__getitem__', 'read', 'write', 'unlink', 'revalidate',
+                '_context', '_idnames', '_model', '_model_name'
+                ] + self._model._keys
 
     def __len__(self):
         return len(self.id)
 
-    def read(self, fields=None, context=None):
+    def _combine(self, ids, others):
+        # Keep the values already read
+        prefetch = _Prefetch(self._model, ids, context=self._context)
+        for other in (self,) + others:
+            assert other._model_name == self._model_name
+            if other._prefetch is not None:
+                prefetch.values.update(other._prefetch.values)
+        return RecordList(self._model, ids, context=self._context,
+                          prefetch=prefetch)
+
+    def union(self, *others):
+        """Return the records which are in any of the lists.
+
+        The order is preserved, and the duplicates are removed.
+        """
+        ids, seen = [], set([False])
+        for records in (self,) + others:
+            for id_ in records.id:
+                if id_ not in seen:
+                    seen.add(id_)
+                    ids.append(id_)
+        return self._combine(ids, others)
+
+    def intersection(self, *others):
+        """Return the records which are in all the lists."""
+        common = set(self.id)
+        for records in others:
+            common.intersection_update(records.id)
+        return self._combine([id_ for id_ in self.union().id
+                              if id_ in common], others)
+
+    def difference(self, *others):
+        """Return the records which are not in the other lists."""
+        excluded = set()
+        for records in others:
+            excluded.update(records.id)
+        return self._combine([id_ for id_ in self.union().id
+                              if id_ not in excluded], others)
+
+    __or__ = union
+    __and__ = intersection
+    __sub__ = difference
+
+    def _batch(self):
+        """Return the batch of the records, see :class:`_Prefetch`."""
+        prefetch = self._prefetch
+        if prefetch is None:
+            prefetch = _Prefetch(self._model, self.id, context=self._context)
+            self.__dict__['_prefetch'] = prefetch
+        return prefetch
+
+    def _values(self, fields):
+        """Return the raw values of the `fields` for each record.
+
+        The values already read are reused, and the missing values are
+        read with a single RPC call.
+        """
+        prefetch = self._batch()
+        fields = [fld for fld in fields if fld != 'id']
+        with prefetch._lock:
+            if fields:
+                prefetch._fetch(fields, False)
+            rows = []
+            for id_ in self.id:
+                values = dict(prefetch.values.get(id_) or {})
+                values['id'] = id_
+                rows.append(values)
+        return rows
+
+    def filtered(self, domain):
+        """Return the records which match the `domain`.
+
+        The `domain` is a search domain, evaluated locally with the values
+        of the records, or a function which receives a :class:`Record`.
+        Only the missing values are read from the server.
+        """
+        if hasattr(domain, '__call__'):
+            self._batch()
+            ids = [rec.id for rec in self if rec and domain(rec)]
+        else:
+            (domain,) = searchargs((domain,))[:1]
+            fields = self._model._fields
+            rows = self._values(_domain_fields(domain))
+            ids = [row['id'] for row in rows
+                   if row['id'] and _match_domain(domain, row, fields)]
+        return self._combine(ids, ())
+
+    def sorted(self, key=None, reverse=False):
+        """Return the records sorted by `key`.
+
+        The `key` is the name of a field, or a function which receives a
+        :class:`Record`.  If omitted, the records are sorted by ``id``.
+        """
+        if hasattr(key, '__call__'):
+            self._batch()
+            records = [rec for rec in self if rec]
+            ids = [rec.id for rec in sorted(records, key=key,
+                                            reverse=reverse)]
+        else:
+            key = key or 'id'
+            field_type = (key != 'id') and self._model._fields[key]['type']
+
+            def sort_key(row):
+                value = row[key]
+                if field_type == 'many2one':
+                    value = value and value[1]
+                # The empty values are sorted first
+                return (value is not False, value)
+            rows = [row for row in self._values([key]) if row['id']]
+            ids = [row['id'] for row in sorted(rows, key=sort_key,
+                                               reverse=reverse)]
+        return self._combine(ids, ())
+
+    def mapped(self, func):
+        """Apply `func` on each record and return the list of results.
+
+        If `func` is the name of a relational field, the related records
+        are returned as a single :class:`RecordList`, without duplicates.
+        Otherwise, it returns the list of values for the field.
+        """
+        if hasattr(func, '__call__'):
+            self._batch()
+            return [rec and func(rec) for rec in self]
+        field = self._model._fields[func]
+        values = [row[func] for row in self._values([func]) if row['id']]
+        if field['type'] in ('many2one', 'one2many', 'many2many'):
+            ids, seen = [], set([False])
+            for value in values:
+                if field['type'] == 'many2one':
+                    value = value and [value[0]] or []
+                for id_ in (value or ()):
+                    if id_ not in seen:
+                        seen.add(id_)
+                        ids.append(id_)
+            rel_model = self._model.client.model(field['relation'], False)
+            return RecordList(rel_model, ids, context=self._context,
+                              prefetch=self._prefetch.related.get(func))
+        return values
+
+    def join(self, other, on, how='left'):
+        """Combine the records with the records of the `other` list.
+
+        The relational field `on` belongs to the model of this list and
+        refers to the model of the `other` list, or the reverse.  Return an
+        iterator of the pairs ``(record, other_record)`` which are related
+        by this field.  If `how` is ``'left'``, the records without related
+        record are paired with None.  If `how` is ``'inner'``, they are
+        skipped.  The values of `on` already read are reused, and the
+        missing ones are read with a single RPC call.
+        """
+        if how not in ('left', 'inner'):
+            raise ValueError('Invalid join: %r' % (how,))
+        field = self._model._fields.get(on)
+        if field and field.get('relation') == other._model_name:
+            matches = dict(self._related(on, field['type'], set(other.id)))
+        else:
+            field = other._model._fields[on]
+            assert field.get('relation') == self._model_name
+            matches = {}
+            for (other_id, ids) in other._related(on, field['type'],
+                                                  set(self.id)):
+                for id_ in ids:
+                    matches.setdefault(id_, []).append(other_id)
+        return self._join(other, matches, how == 'left')
+
+    def _related(self, field, field_type, ids):
+        """Return the pairs ``(id, related_ids)``, restricted to `ids`."""
+        related = []
+        for row in self._values([field]):
+            value = row['id'] and row[field]
+            if field_type == 'many2one':
+                value = value and [value[0]] or []
+            value = [id_ for id_ in (value or ()) if id_ and id_ in ids]
+            if value:
+                related.append((row['id'], value))
+        return related
+
+    def _join(self, other, matches, left):
+        prefetch, other_prefetch = self._batch(), other._batch()
+        for id_ in self.id:
+            if not id_:
+                continue
+            record = Record(self._model, id_, context=self._context,
+                            prefetch=prefetch)
+            other_ids = matches.get(id_)
+            if not other_ids:
+                if left:
+                    yield (record, None)
+                continue
+            for other_id in other_ids:
+                yield (record, Record(other._model, other_id,
+                                      context=other._context,
+                                      prefetch=other_prefetch))
+
+    def read(self, fields=None, context=None, format=None):
         """Wrapper for :meth:`Record.read` method."""
         if context is None and self._context:
             context = self._context
+        if fields is None:
+            fields = self._model._default_fields()
 
         client = self._model.client
+        if format == 'columns':
+            fields = _parse_fields(fields)
+            rows = self.id and client.execute(
+                self._model_name, 'read', self.id, fields,
+                order=True, context=context)
+            return self._model._columns(rows or [], fields)
         if self.id:
             values = client.read(self._model_name, self.id,
                                  fields, order=True, context=context)
@@ -1152,6 +3232,7 @@ class RecordList(object):
             context = self._context
         values = self._model._unbrowse_values(values)
         rv = self._execute('write', self.id, values, context=context)
+        self._discard()
         return rv
 
     def unlink(self, context=None):
@@ -1161,14 +3242,32 @@ class RecordList(object):
         if context is None and self._context:
             context = self._context
         rv = self._execute('unlink', self.id, context=context)
+        self._discard()
         return rv
 
+    def revalidate(self, context=None):
+        """Refresh the cached values which changed on the server.
+
+        Return a :class:`RecordList` of the records which changed.
+        See :meth:`Model.revalidate` for details.
+        """
+        return self._model.revalidate(self, context=context)
+
+    def _discard(self):
+        if self._prefetch is not None:
+            for id_ in self.id:
+                self._prefetch.discard(id_)
+
     def __getitem__(self, key):
         idname = self._idnames[key]
         if idname is False:
             return False
+        prefetch = self._prefetch
+        if prefetch is None and self._model.client.auto_batch:
+            prefetch = self._batch()
         cls = RecordList if isinstance(key, slice) else Record
-        return cls(self._model, idname, context=self._context)
+        return cls(self._model, idname, context=self._context,
+                   prefetch=prefetch)
 
     def __getattr__(self, attr):
         context = self._context
@@ -1208,16 +3307,20 @@ class Record(object):
     The attributes are evaluated lazily, and they are cached in the record.
     The Record's cache is invalidated if any attribute is changed.
     """
-    def __init__(self, res_model, res_id, context=None):
+    def __init__(self, res_model, res_id, context=None, prefetch=None):
         if isinstance(res_id, (list, tuple)):
             (res_id, res_name) = res_id
             self.__dict__['_name'] = res_name
+        if prefetch is None and res_model.client.auto_batch:
+            prefetch = res_model._batch(context)
+            prefetch.ids.append(res_id)
         # Bypass the __setattr__ method
         self.__dict__.update({
             'id': res_id,
             '_model_name': res_model._name,
             '_model': res_model,
             '_context': context,
+            '_prefetch': prefetch,
             '_cached_keys': set(),
             '_execute': res_model._execute,
         })
@@ -1250,9 +3353,26 @@ class Record(object):
         for key in self._cached_keys:
             delattr(self, key)
         self._cached_keys.clear()
+        self.__dict__.pop('_write_date', None)
+        if self._prefetch is not None:
+            self._prefetch.discard(self.id)
+
+    def revalidate(self, context=None):
+        """Refresh the cached values if the record changed on the server.
 
-    def _update(self, values):
-        new_values = self._model._browse_values(values, context=self._context)
+        See :meth:`Model.revalidate` for details.
+        """
+        return bool(self._model.revalidate([self], context=context))
+
+    def _update(self, values, prefetch=None):
+        new_values = self._model._browse_values(values, context=self._context,
+                                                prefetch=prefetch)
+        if ((new_values.get('write_date') is not None and
+             '_write_date' not in self.__dict__ and
+             self._cached_keys.issubset(new_values))):
+            # All the cached values are current at this date
+            self.__dict__['_write_date'] = (new_values['write_date'] or
+                                            new_values.get('create_date'))
         self.__dict__.update(new_values)
         self._cached_keys.update(new_values)
         return new_values
@@ -1262,9 +3382,23 @@ class Record(object):
 
         The argument `fields` accepts different kinds of values.
         See :meth:`Client.read` for details.
+        If `fields` is omitted, the expensive fields are not read: they
+        are read on demand.
         """
         if context is None and self._context:
             context = self._context
+        if fields is None:
+            fields = self._model._default_fields()
+        prefetch = self._prefetch
+        if (prefetch is not None and context is self._context and
+                isinstance(fields, basestring) and
+                fields in self._model._keys):
+            try:
+                value = prefetch.get(self.id, fields)
+            except KeyError:
+                pass    # Not readable: fall back to a standard read
+            else:
+                return self._update({fields: value}, prefetch)[fields]
         rv = self._model.read(self.id, fields, context=context)
         if isinstance(rv, dict):
             return self._update(rv)
@@ -1320,7 +3454,7 @@ class Record(object):
 
     def __dir__(self):
         return ['read', 'write', 'copy', 'unlink', '_send', 'refresh',
-                '_context', '_model', '_model_name', '_name',
+                'revalidate', '_context', '_model', '_model_name', '_name',
                 '_keys', '_fields'] + self._model._keys
 
     def __getattr__(self, attr):
@@ -1355,7 +3489,644 @@ class Record(object):
         self.write({attr: value})
 
 
-def _interact(use_pprint=True, usage=USAGE):
+class Replica(object):
+    """A local SQLite copy of some models.
+
+    The `client` is a connected :class:`Client`.  The `filename` is the
+    path of the SQLite database, which is created if needed.
+    Assign the replica to :attr:`Client.replica` to use it with
+    ``Model.browse(..., source='replica')``.
+    """
+    _sql_types = {'integer': 'INTEGER', 'many2one': 'INTEGER',
+                  'boolean': 'INTEGER', 'float': 'REAL'}
+    # SQLite LIKE ignores the case: the case-sensitive operators use GLOB
+    _sql_operators = {'=': '=', '!=': '!=', '<>': '!=', '<': '<', '>': '>',
+                      '<=': '<=', '>=': '>=', '=like': 'GLOB',
+                      '=ilike': 'LIKE', 'like': 'GLOB', 'ilike': 'LIKE',
+                      'not like': 'NOT GLOB', 'not ilike': 'NOT LIKE'}
+
+    def __init__(self, client, filename=':memory:'):
+        import sqlite3
+        self.client = client
+        self.filename = filename
+        self._conn = sqlite3.connect(filename, check_same_thread=False)
+        self._lock = threading.Lock()
+        self._conn.execute('CREATE TABLE IF NOT EXISTS erppeek_replica '
+                           '(model TEXT PRIMARY KEY, fields TEXT, '
+                           'last_sync TEXT)')
+        self._models = {}
+        for (model, fields, last_sync) in self._conn.execute(
+                'SELECT model, fields, last_sync FROM erppeek_replica'):
+            self._models[model] = [literal_eval(fields), last_sync]
+
+    def __repr__(self):
+        return "<Replica '%s'>" % (self.filename,)
+
+    @staticmethod
+    def _table(model):
+        return '"%s"' % model.replace('.', '_')
+
+    @staticmethod
+    def _glob(pattern):
+        """Convert a SQL ``LIKE`` pattern to a SQLite ``GLOB`` pattern."""
+        return ''.join([{'%': '*', '_': '?', '*': '[*]', '?': '[?]',
+                         '[': '[[]'}.get(char, char)
+                        for char in '%s' % (pattern,)])
+
+    def models(self):
+        """Return the list of the replicated models."""
+        return sorted(self._models)
+
+    def add(self, model, fields=None):
+        """Replicate the `model`.
+
+        The optional argument `fields` is the list of the fields to copy.
+        If omitted, the stored fields are copied, except the ``one2many``,
+        ``many2many`` and ``binary`` fields.  The data are loaded on the
+        next :meth:`sync`.
+        """
+        columns = self.client.model(model, False)._fields
+        if fields is None:
+            fields = [name for (name, field) in columns.items()
+                      if field['type'] not in ('one2many', 'many2many',
+                                               'binary') and
+                      not (field.get('function') and not field.get('store'))]
+        elif isinstance(fields, basestring):
+            fields = fields.split()
+        fields = sorted(set(fields).difference(['id']))
+        if model in self._models and self._models[model][0] == fields:
+            return
+        ddl = ['id INTEGER PRIMARY KEY']
+        for name in fields:
+            sql_type = self._sql_types.get(columns[name]['type'], 'TEXT')
+            ddl.append('"%s" %s' % (name, sql_type))
+        with self._lock:
+            with self._conn:
+                self._conn.execute('DROP TABLE IF EXISTS %s' %
+                                   self._table(model))
+                self._conn.execute('CREATE TABLE %s (%s)' %
+                                   (self._table(model), ', '.join(ddl)))
+                self._conn.execute('INSERT OR REPLACE INTO erppeek_replica '
+                                   'VALUES (?, ?, NULL)',
+                                   (model, repr(fields)))
+        self._models[model] = [fields, None]
+
+    def sync(self, models=None, batch_size=500):
+        """Copy the changes of the replicated models.
+
+        The first time, all the records are copied.  Then only the records
+        created or updated since the last synchronization are copied, based
+        on their ``write_date``, and the deleted records are removed.
+        Return a dictionary ``{model: (updated, deleted)}``.
+        """
+        if isinstance(models, basestring):
+            models = [models]
+        context = {'active_test': False}
+        result = {}
+        for model in (models or self.models()):
+            (fields, last_sync) = self._models[model]
+            domain = []
+            if last_sync:
+                domain = ['|', ('write_date', '>=', last_sync),
+                          ('create_date', '>=', last_sync)]
+            ids = self.client.search(model, domain, order='id',
+                                     context=context)
+            for idx in range(0, len(ids), batch_size):
+                rows = self.client.read(
+                    model, ids[idx:idx + batch_size],
+                    fields + ['write_date', 'create_date'], context=context)
+                dates = [(row['write_date'] or row['create_date'] or '')
+                         for row in rows]
+                last_sync = max([last_sync or ''] + dates) or None
+                self._store(model, fields, rows)
+            deleted = 0
+            if last_sync and self._models[model][1]:
+                # Detect the records deleted on the server
+                deleted = self._purge(model, self.client.search(
+                    model, [], context=context))
+            with self._lock:
+                with self._conn:
+                    self._conn.execute('UPDATE erppeek_replica '
+                                       'SET last_sync=? WHERE model=?',
+                                       (last_sync, model))
+            self._models[model][1] = last_sync
+            result[model] = (len(ids), deleted)
+        return result
+
+    def _store(self, model, fields, rows):
+        columns = self.client.model(model, False)._fields
+        sql = 'INSERT OR REPLACE INTO %s (id, %s) VALUES (?%s)' % (
+            self._table(model), ', '.join(['"%s"' % name for name in fields]),
+            ', ?' * len(fields))
+        params = []
+        for row in rows:
+            values = [row['id']]
+            for name in fields:
+                (value, field_type) = (row[name], columns[name]['type'])
+                if field_type == 'many2one':
+                    value = value and value[0] or None
+                elif value is False and field_type != 'boolean':
+                    value = None
+                values.append(value)
+            params.append(values)
+        with self._lock:
+            with self._conn:
+                self._conn.executemany(sql, params)
+
+    def _purge(self, model, ids):
+        table = self._table(model)
+        with self._lock:
+            local_ids = set([row[0] for row in
+                             self._conn.execute('SELECT id FROM ' + table)])
+            deleted = sorted(local_ids.difference(ids))
+            with self._conn:
+                self._conn.executemany('DELETE FROM %s WHERE id=?' % table,
+                                       [(id_,) for id_ in deleted])
+        return len(deleted)
+
+    def query(self, sql, params=()):
+        """Run the SQL query on the local database and return the rows."""
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    def _where(self, model, domain):
+        """Convert the search `domain` to a SQL clause and parameters."""
+        fields = self._models[model][0]
+        columns = self.client.model(model, False)._fields
+        stack = []
+        for term in reversed(domain or []):
+            if term in DOMAIN_OPERATORS:
+                if term == '!':
+                    (sql, params) = stack.pop()
+                    stack.append(('NOT (%s)' % sql, params))
+                else:
+                    (sql1, params1) = stack.pop()
+                    (sql2, params2) = stack.pop()
+                    sql_op = ' AND ' if term == '&' else ' OR '
+                    stack.append(('(%s%s%s)' % (sql1, sql_op, sql2),
+                                  params1 + params2))
+                continue
+            (name, operator, value) = term
+            if name != 'id' and name not in fields:
+                raise ValueError('Field %r is not replicated' % (name,))
+            column = '"%s"' % name
+            if operator in ('in', 'not in'):
+                value = list(value)
+                sql = '%s %s (%s)' % (column, operator.upper(),
+                                      ', '.join('?' * len(value)))
+                stack.append((sql, value))
+            elif operator not in self._sql_operators:
+                raise ValueError('Operator %r is not supported' % (operator,))
+            elif (value is False and operator in ('=', '!=') and
+                  columns.get(name, {}).get('type') != 'boolean'):
+                stack.append(('%s IS %sNULL' % (column, operator == '!=' and
+                                                'NOT ' or ''), []))
+            else:
+                if operator in ('like', 'ilike', 'not like', 'not ilike'):
+                    value = '%%%s%%' % (value,)
+                if self._sql_operators[operator].endswith('GLOB'):
+                    value = self._glob(value)
+                stack.append(('%s %s ?' % (column,
+                                           self._sql_operators[operator]),
+                              [value]))
+        # Implicit '&' between the remaining terms
+        stack.reverse()
+        return (' AND '.join([sql for (sql, params) in stack]) or '1',
+                sum([params for (sql, params) in stack], []))
+
+    def search(self, model, domain=None, offset=0, limit=None, order=None):
+        """Search the local copy of the `model`, return the ``ids``.
+
+        The arguments are the same as :meth:`Client.search`.
+        """
+        (where, params) = self._where(model, searchargs((domain or [],))[0])
+        sql = 'SELECT id FROM %s WHERE %s ORDER BY %s LIMIT %d OFFSET %d' % (
+            self._table(model), where, order or 'id',
+            -1 if limit is None else limit, offset or 0)
+        return [row[0] for row in self.query(sql, params)]
+
+    def read(self, model, ids, fields=None):
+        """Read the local copy of the records `ids` of the `model`.
+
+        Return a list of dictionaries, in the same order as the `ids`.
+        The missing records are ``False``.
+        """
+        columns = self.client.model(model, False)._fields
+        fields = fields or self._models[model][0]
+        rows = {}
+        sql = 'SELECT id, %s FROM %s WHERE id IN (%s)'
+        for idx in range(0, len(ids), 500):
+            chunk = ids[idx:idx + 500]
+            for row in self.query(sql % (
+                    ', '.join(['"%s"' % name for name in fields]),
+                    self._table(model), ', '.join('?' * len(chunk))), chunk):
+                values = {'id': row[0]}
+                for (name, value) in zip(fields, row[1:]):
+                    field_type = columns[name]['type']
+                    if value is None:
+                        value = False
+                    elif field_type == 'boolean':
+                        value = bool(value)
+                    values[name] = value
+                rows[row[0]] = values
+        return [rows.get(id_, False) for id_ in ids]
+
+
+def _open_csv(filename, mode):
+    """Open a file for the :mod:`csv` module."""
+    if sys.version_info[0] < 3:
+        return open(filename, mode + 'b')
+    return open(filename, mode, newline='', encoding='utf-8')
+
+
+def _export_value(value, field_type):
+    """Format the `value` of a field for a CSV file."""
+    if field_type == 'many2one':
+        return value and value[1] or ''
+    if field_type in ('one2many', 'many2many'):
+        return ','.join([str(id_) for id_ in value])
+    if value is False and field_type != 'boolean':
+        return ''
+    if isinstance(value, basestring) and not isinstance(value, str):
+        return value.encode('utf-8')    # Python 2
+    return value
+
+
+def _search_pages(client, model, domain, batch_size, last_id=0):
+    """Search the ids greater than `last_id`, by pages of `batch_size`."""
+    while True:
+        ids = client.execute(model, 'search',
+                             domain + [('id', '>', last_id)],
+                             0, batch_size, 'id')
+        if not ids:
+            break
+        yield ids
+        last_id = ids[-1]
+
+
+def _export(client, model, domain, fields, filename,
+            batch_size=500, workers=1, resume=False):
+    """Export the records of the `model` to a CSV or a JSON Lines file.
+
+    The records are searched and read by pages of `batch_size` ids, and
+    written as soon as they are read.  Up to `workers` pages are read
+    concurrently.  After each page, the progress is saved in a file
+    ``<filename>.resume``, which is removed at the end.  If `resume` is
+    True, an interrupted export continues after the last page saved.
+    In a CSV file, the ``many2one`` fields contain the name of the
+    related record.  Return the number of records exported.
+    """
+    import json
+    res_model = client.model(model)
+    fields = _parse_fields(fields)
+    if not fields:
+        fields = res_model._default_fields() or sorted(res_model._keys)
+    fields = [name for name in fields if name != 'id']
+    types = [res_model._fields.get(name, {}).get('type') for name in fields]
+    (domain,) = searchargs((list(domain),))
+    state_file = filename + '.resume'
+    (last_id, size) = (0, 0)
+    if resume and os.path.exists(state_file):
+        with open(state_file) as f:
+            (last_id, size) = [int(value) for value in f.read().split()]
+        # Discard the rows written after the last saved page
+        with open(filename, 'r+b') as f:
+            f.truncate(size)
+    as_csv = filename.endswith('.csv')
+    if as_csv:
+        out = _open_csv(filename, size and 'a' or 'w')
+        writer = csv.writer(out)
+        if not size:
+            writer.writerow(['id'] + fields)
+    else:
+        out = open(filename, size and 'a' or 'w')
+
+    def read(ids):
+        rows = client.execute(model, 'read', ids, fields, order=True)
+        return (ids[-1], [row for row in rows if row])
+    pages = _search_pages(client, model, domain, batch_size, last_id)
+    count = 0
+    with out:
+        for (last_id, rows) in _imap(read, pages, workers,
+                                     client.concurrency):
+            if as_csv:
+                writer.writerows([[row['id']] +
+                                  [_export_value(row[name], field_type)
+                                   for (name, field_type)
+                                   in zip(fields, types)]
+                                  for row in rows])
+            else:
+                out.writelines([json.dumps(row, sort_keys=True) + '\n'
+                                for row in rows])
+            out.flush()
+            with open(state_file, 'w') as f:
+                f.write('%d %d\n' % (last_id, out.tell()))
+            count += len(rows)
+    if os.path.exists(state_file):
+        os.remove(state_file)
+    return count
+
+
+class _Importer(object):
+    """Import the rows of a CSV or a JSON Lines file in a model.
+
+    The rows are sent by chunks of `batch_size`, with the ``load`` method
+    (OpenERP 7), or with one ``create`` per row.  Up to `workers` chunks
+    are sent concurrently.  The ``many2one`` values are the name or the
+    ``xml_id`` of the related record, resolved with one request per chunk
+    and per model, and cached.  When ``load`` reports errors, the invalid
+    rows are rejected and the other rows are loaded again.  When it fails
+    without telling which rows are invalid, the rows of the chunk are
+    created one by one.
+    """
+
+    def __init__(self, client, model, batch_size=500, workers=1):
+        self.client = client
+        self.model = client.model(model)
+        self.batch_size = batch_size
+        self.workers = workers
+        self.use_load = client.major_version >= '7.0'
+
+    def _read(self, filename):
+        import json
+        if filename.endswith('.csv'):
+            with _open_csv(filename, 'r') as f:
+                for row in csv.DictReader(f):
+                    if sys.version_info[0] < 3:
+                        row = dict([(key, value.decode('utf-8'))
+                                    for (key, value) in row.items()])
+                    yield row
+        else:
+            with open(filename) as f:
+                for line in f:
+                    if line.strip():
+                        yield json.loads(line)
+
+    def _chunks(self, rows):
+        chunk = []
+        for row in rows:
+            chunk.append(row)
+            if len(chunk) >= self.batch_size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+    def _resolve(self, relation, values):
+        """Return the ids of the names or ``xml_ids`` of `relation`."""
+        ids = {}
+        xml_ids = [value for value in values if _xml_id_re.match(value)]
+        if xml_ids:
+            for (xml_id, res) in self.client.resolve_xmlids(xml_ids).items():
+                if res and res[0] == relation:
+                    ids[xml_id] = res[1]
+        names = [value for value in values if value not in ids]
+        if names:
+            rel_model = self.client.model(relation, False)
+            ids.update(rel_model.resolve_names(names, workers=1))
+        return ids
+
+    def _convert(self, chunk):
+        """Return the values of the rows, and the rejected rows."""
+        fields = self.model._fields
+        names = {}
+        for row in chunk:
+            for (key, value) in row.items():
+                field = fields.get(key)
+                if field and field['type'] == 'many2one':
+                    if isinstance(value, (list, tuple)):
+                        value = value[1]    # exported as [id, name]
+                    if value and isinstance(value, basestring):
+                        names.setdefault(key, set()).add(value)
+        ids = dict([(key, self._resolve(fields[key]['relation'], values))
+                    for (key, values) in names.items()])
+        (records, rejects) = ([], [])
+        for row in chunk:
+            try:
+                records.append((row, self._values(row, ids)))
+            except (KeyError, ValueError):
+                rejects.append((row, str(sys.exc_info()[1])))
+        return (records, rejects)
+
+    def _values(self, row, ids):
+        fields = self.model._fields
+        values = {}
+        for (key, value) in row.items():
+            if key == 'id':
+                continue    # The ids of the exporting database
+            if key not in fields:
+                raise KeyError('Unknown field %r' % key)
+            field_type = fields[key]['type']
+            if value == '' or value is None:
+                value = False
+            if field_type == 'many2one':
+                if isinstance(value, (list, tuple)):
+                    value = value[1]
+                if value and isinstance(value, basestring):
+                    if ids[key][value] is None:
+                        raise ValueError('%s not found: %s' % (key, value))
+                    value = ids[key][value]
+            elif field_type in ('one2many', 'many2many'):
+                if isinstance(value, basestring):
+                    value = [int(id_) for id_ in value.split(',')]
+                value = [(6, 0, value or [])]
+            elif isinstance(value, basestring):
+                if field_type == 'integer':
+                    value = int(value)
+                elif field_type == 'float':
+                    value = float(value)
+                elif field_type == 'boolean':
+                    value = value.lower() in ('1', 'true', 'yes')
+            values[key] = value
+        return values
+
+    def _load_data(self, records):
+        """Return the arguments of the ``load`` method."""
+        fields = self.model._fields
+        keys = set()
+        for (row, values) in records:
+            keys.update(values)
+        keys = sorted(keys)
+        columns = []
+        for key in keys:
+            if fields[key]['type'] in ('many2one', 'one2many', 'many2many'):
+                columns.append(key + '/.id')
+            else:
+                columns.append(key)
+        data = []
+        for (row, values) in records:
+            line = []
+            for key in keys:
+                value = values.get(key, False)
+                if isinstance(value, list):
+                    value = ','.join([str(id_) for id_ in value[0][2]])
+                elif value is False:
+                    value = (fields[key]['type'] == 'boolean' and
+                             'False' or '')
+                line.append(value if isinstance(value, basestring)
+                            else str(value))
+            data.append(line)
+        return (columns, data)
+
+    def _send(self, chunk):
+        (records, rejects) = self._convert(chunk)
+        count = 0
+        while records and self.use_load:
+            (columns, data) = self._load_data(records)
+            try:
+                res = self.model._execute('load', columns, data)
+            except Fault:
+                break
+            if res['ids']:
+                return (len(res['ids']), rejects)
+            # The load is rolled back: reject the invalid rows, and send
+            # the other rows again
+            errors = {}
+            for message in res.get('messages') or ():
+                if message.get('type') == 'error' and 'record' in message:
+                    errors.setdefault(message['record'],
+                                      message.get('message') or 'Error')
+            if not errors:
+                break
+            for (index, error) in sorted(errors.items()):
+                rejects.append((records[index][0], error))
+            records = [record for (index, record) in enumerate(records)
+                       if index not in errors]
+        for (row, values) in records:
+            try:
+                self.model._execute('create', values)
+                count += 1
+            except Fault:
+                rejects.append((row, '%s' % sys.exc_info()[1].faultCode))
+        return (count, rejects)
+
+    def run(self, filename, rejects_file):
+        """Import the file.  Return the number of records and rejects."""
+        import json
+        (count, rejected, out, writer) = (0, 0, None, None)
+        chunks = self._chunks(self._read(filename))
+        try:
+            for (created, rejects) in _imap(self._send, chunks, self.workers,
+                                            self.client.concurrency):
+                count += created
+                for (row, error) in rejects:
+                    row = dict(row, _error=error)
+                    if out is None and rejects_file.endswith('.csv'):
+                        out = _open_csv(rejects_file, 'w')
+                        writer = csv.DictWriter(out, sorted(row))
+                        writer.writerow(dict([(key, key) for key in row]))
+                    elif out is None:
+                        out = open(rejects_file, 'w')
+                    if writer is not None:
+                        writer.writerow(dict([
+                            (key, _export_value(value, None))
+                            for (key, value) in row.items()]))
+                    else:
+                        out.write(json.dumps(row, sort_keys=True) + '\n')
+                    rejected += 1
+        finally:
+            if out is not None:
+                out.close()
+        return (count, rejected)
+
+
+def _percentile(values, percent):
+    """Return the percentile of the sorted `values` (nearest rank)."""
+    if not values:
+        return 0
+    return values[max(int(round(len(values) * percent / 100.0)) - 1, 0)]
+
+
+class _LoadTest(object):
+    """Run the scenario of a load test in concurrent sessions.
+
+    The `filename` is a Python file which defines ``scenario(client)``,
+    one iteration of a user session, and optionally ``setup(client)``
+    which runs once.  Each session has its own :class:`Client`, and it
+    waits `think_time` seconds between two iterations.  The sessions are
+    started progressively during `ramp_up` seconds, and they stop after
+    `duration` seconds.
+    """
+
+    def __init__(self, client, filename, users=1, duration=60,
+                 think_time=0, ramp_up=0):
+        self.client = client
+        self.users = users
+        self.duration = duration
+        self.think_time = think_time
+        self.ramp_up = ramp_up
+        self.namespace = {'__file__': filename, '__name__': '__loadtest__'}
+        with open(filename) as f:
+            exec(compile(f.read(), filename, 'exec'), self.namespace)
+        if 'scenario' not in self.namespace:
+            raise ValueError('%s does not define scenario(client)' %
+                             filename)
+        self.durations = {}
+        self.errors = {}
+        self.first_error = None
+        self._lock = threading.Lock()
+
+    def _record(self, operation, duration, error=False):
+        with self._lock:
+            self.durations.setdefault(operation, []).append(duration)
+            if error:
+                self.errors[operation] = self.errors.get(operation, 0) + 1
+
+    def _session(self, index, deadline):
+        time.sleep(self.ramp_up * index / float(self.users))
+        client = Client(self.client._server, self.client._db,
+                        self.client.user)
+        client.add_trace(after=lambda call: self._record(
+            call.key, call.duration, call.error is not None))
+        scenario = self.namespace['scenario']
+        while time.time() < deadline:
+            start = time.time()
+            try:
+                scenario(client)
+                error = False
+            except Exception:
+                error = True
+                if self.first_error is None:
+                    self.first_error = ''.join(format_exception(
+                        *sys.exc_info(), **{'chain': False}))
+            self._record('scenario', time.time() - start, error)
+            if self.think_time and time.time() < deadline:
+                time.sleep(self.think_time)
+
+    def run(self):
+        """Run the sessions and return the elapsed time."""
+        if 'setup' in self.namespace:
+            self.namespace['setup'](self.client)
+        start = time.time()
+        deadline = start + self.duration
+        threads = [threading.Thread(target=self._session,
+                                    args=(index, deadline))
+                   for index in range(self.users)]
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return time.time() - start
+
+    def report(self, elapsed):
+        """Return the throughput and the latency percentiles, as text."""
+        lines = ['%-36s %7s %6s %8s %8s %8s %8s %8s' % (
+            'operation', 'count', 'errors', 'rate/s',
+            'p50', 'p90', 'p99', 'max')]
+        for (operation, values) in sorted(self.durations.items()):
+            values = sorted(values)
+            lines.append('%-36s %7d %6d %8.1f %7.3fs %7.3fs %7.3fs %7.3fs' % (
+                operation, len(values), self.errors.get(operation, 0),
+                len(values) / elapsed, _percentile(values, 50),
+                _percentile(values, 90), _percentile(values, 99),
+                values[-1]))
+        if self.first_error:
+            lines.append('First error:\n' + self.first_error.rstrip())
+        return '\n'.join(lines)
+
+
+def _interact(use_pprint=True, usage=USAGE, profile=False):
     import code
     try:
         import builtins
@@ -1400,7 +4171,11 @@ def _interact(use_pprint=True, usage=USAGE):
     class Console(code.InteractiveConsole):
         def runcode(self, code):
             try:
-                _exec(code, globals())
+                client = globals().get('client')
+                if profile and client:
+                    client.profile(lambda: _exec(code, globals()))
+                else:
+                    _exec(code, globals())
             except SystemExit:
                 raise
             except:
@@ -1446,6 +4221,44 @@ def main():
     parser.add_option(
         '-f', '--fields', action='append',
         help='restrict the output to certain fields (multiple allowed)')
+    parser.add_option(
+        '--export', metavar='FILE',
+        help='export the records of the model to a .csv or .jsonl file')
+    parser.add_option(
+        '--import', metavar='FILE', dest='import_file',
+        help='import the records of a .csv or .jsonl file in the model')
+    parser.add_option(
+        '--rejects', metavar='FILE',
+        help='write the rows rejected by --import to this file '
+             '(default: FILE.rejects.csv or FILE.rejects.jsonl)')
+    parser.add_option(
+        '--batch-size', type='int', default=500, metavar='N',
+        help='number of records per request (default: 500)')
+    parser.add_option(
+        '--workers', type='int', default=1, metavar='N',
+        help='maximum number of concurrent requests (default: 1)')
+    parser.add_option(
+        '--resume', action='store_true',
+        help='resume an interrupted --export')
+    parser.add_option(
+        '--loadtest', metavar='FILE',
+        help='run the scenario(client) function of this file in concurrent '
+             'sessions, and report the latency of the operations')
+    parser.add_option(
+        '--users', type='int', default=1, metavar='N',
+        help='number of concurrent sessions for --loadtest (default: 1)')
+    parser.add_option(
+        '--duration', type='float', default=60, metavar='SECONDS',
+        help='duration of the --loadtest (default: 60)')
+    parser.add_option(
+        '--think-time', type='float', default=0, metavar='SECONDS',
+        help='pause between two iterations of a session (default: 0)')
+    parser.add_option(
+        '--ramp-up', type='float', default=0, metavar='SECONDS',
+        help='delay to start all the sessions (default: 0)')
+    parser.add_option(
+        '--profile', action='store_true',
+        help='profile the command, or each statement in interactive mode')
     parser.add_option(
         '-i', '--interact', action='store_true',
         help='use interactively; default when no model is queried')
@@ -1460,7 +4273,7 @@ def main():
         print('Available settings:  ' + ' '.join(read_config()))
         return
 
-    if (args.interact or not args.model):
+    if (args.interact or not (args.model or args.loadtest)):
         Client._set_interactive()
         print(USAGE)
 
@@ -1470,15 +4283,48 @@ def main():
         client = Client(args.server, args.db, args.user, args.password,
                         verbose=args.verbose)
 
-    if args.model and domain and client.user:
-        data = client.execute(args.model, 'read', domain, args.fields)
-        pprint(data)
+    def run():
+        if args.loadtest and client.user:
+            loadtest = _LoadTest(client, args.loadtest, users=args.users,
+                                 duration=args.duration,
+                                 think_time=args.think_time,
+                                 ramp_up=args.ramp_up)
+            elapsed = loadtest.run()
+            print('%d sessions during %.1fs' % (args.users, elapsed))
+            print(loadtest.report(elapsed))
+        elif args.model and args.export and client.user:
+            fields = args.fields and ' '.join(args.fields).split()
+            count = _export(client, args.model, domain, fields, args.export,
+                            batch_size=args.batch_size, workers=args.workers,
+                            resume=args.resume)
+            print('%d records exported to %s' % (count, args.export))
+        elif args.model and args.import_file and client.user:
+            (base, ext) = os.path.splitext(args.import_file)
+            rejects_file = args.rejects or (base + '.rejects' + ext)
+            importer = _Importer(client, args.model,
+                                 batch_size=args.batch_size,
+                                 workers=args.workers)
+            start = time.time()
+            (count, rejected) = importer.run(args.import_file, rejects_file)
+            elapsed = max(time.time() - start, 0.001)
+            print('%d records imported, %d rejected, in %.1fs (%d rows/s)' %
+                  (count, rejected, elapsed, (count + rejected) / elapsed))
+            if rejected:
+                print('Rejected rows written to %s' % rejects_file)
+        elif args.model and domain and client.user:
+            data = client.execute(args.model, 'read', domain, args.fields)
+            pprint(data)
+
+    if args.profile and (args.model or args.loadtest) and client.user:
+        client.profile(run)
+    else:
+        run()
 
     if client.connect is not None:
         # Set the globals()
         client.connect()
         # Enter interactive mode
-        _interact()
+        _interact(profile=args.profile)
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,479 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+""" erppeek_testing.py -- In-process fake OpenERP server
+
+Serve the ``db``, ``common``, ``object`` and ``report`` XML-RPC endpoints
+from an in-memory ORM, to exercise the ERPpeek client without OpenERP.
+"""
+from __future__ import with_statement
+
+import sys
+import threading
+import time
+import traceback
+try:                    # Python 3
+    from socketserver import ThreadingMixIn
+    from xmlrpc.client import Fault, dumps, loads
+    from xmlrpc.server import SimpleXMLRPCServer, SimpleXMLRPCRequestHandler
+except ImportError:     # Python 2
+    from SocketServer import ThreadingMixIn
+    from SimpleXMLRPCServer import (SimpleXMLRPCServer,
+                                    SimpleXMLRPCRequestHandler)
+    from xmlrpclib import Fault, dumps, loads
+
+from erppeek import _match_domain, int_types, searchargs
+
+try:
+    basestring
+except NameError:       # Python 3
+    basestring = str
+
+__all__ = ['FakeServer']
+
+ENDPOINTS = ('db', 'common', 'object', 'report')
+# The models created with each server
+BASE_MODELS = {
+    'ir.model': {'name': {'type': 'char'}, 'model': {'type': 'char'}},
+    'ir.model.data': {
+        'module': {'type': 'char'}, 'name': {'type': 'char'},
+        'model': {'type': 'char'}, 'res_id': {'type': 'integer'}},
+    'res.users': {'name': {'type': 'char'}, 'login': {'type': 'char'},
+                  'password': {'type': 'char'}},
+    'res.country': {'name': {'type': 'char'}, 'code': {'type': 'char'}},
+    'res.partner': {
+        'name': {'type': 'char'}, 'email': {'type': 'char'},
+        'comment': {'type': 'text'}, 'active': {'type': 'boolean'},
+        'customer': {'type': 'boolean'}, 'credit_limit': {'type': 'float'},
+        'country_id': {'type': 'many2one', 'relation': 'res.country'},
+        'parent_id': {'type': 'many2one', 'relation': 'res.partner'},
+        'category_ids': {'type': 'many2many',
+                         'relation': 'res.partner.category'}},
+    'res.partner.category': {'name': {'type': 'char'}},
+}
+MAGIC_COLUMNS = ('create_date', 'write_date')
+
+
+class FakeModel(object):
+    """A model of the in-memory ORM."""
+
+    def __init__(self, server, name, fields):
+        self.server = server
+        self.name = name
+        self.fields = dict(fields)
+        self.records = {}
+        self._sequence = 0
+
+    def _now(self):
+        return time.strftime('%Y-%m-%d %H:%M:%S')
+
+    def _x2many(self, ids, commands):
+        """Apply the commands on the list of `ids`."""
+        ids = list(ids or ())
+        for command in commands or ():
+            if command[0] == 6:
+                ids = list(command[2])
+            elif command[0] == 4 and command[1] not in ids:
+                ids.append(command[1])
+            elif command[0] in (2, 3) and command[1] in ids:
+                ids.remove(command[1])
+            elif command[0] == 5:
+                ids = []
+            elif isinstance(command, int_types):
+                ids.append(command)
+        return ids
+
+    def _store(self, record, values):
+        for (key, value) in values.items():
+            field = self.fields.get(key)
+            if field is None:
+                raise Fault('ValueError: Invalid field %r on model %r' %
+                            (key, self.name), '')
+            if field['type'] in ('one2many', 'many2many'):
+                value = self._x2many(record.get(key), value)
+            elif field['type'] == 'many2one' and isinstance(value, list):
+                value = value[0]
+            record[key] = value
+
+    def _values(self, record, fields=None):
+        """Return the values of the `record`, as returned by ``read``."""
+        values = {'id': record['id']}
+        for name in (fields or self.fields):
+            if name in MAGIC_COLUMNS:
+                values[name] = record.get(name, False)
+                continue
+            field = self.fields[name]
+            value = record.get(name, False)
+            if field['type'] == 'many2one' and value:
+                related = self.server.models[field['relation']].records
+                if value in related:
+                    value = [value, related[value].get('name') or '']
+                else:
+                    value = False
+            elif field['type'] in ('one2many', 'many2many'):
+                value = list(value or ())
+            elif field['type'] in ('integer', 'float') and value is False:
+                value = 0
+            values[name] = value
+        return values
+
+    def _sorted(self, records, order):
+        for term in reversed((order or 'id').split(',')):
+            term = term.split()
+            reverse = len(term) > 1 and term[1].lower() == 'desc'
+            name = term[0]
+
+            def key(record):
+                value = record.get(name, False)
+                if self.fields.get(name, {}).get('type') == 'many2one':
+                    value = self._values(record, [name])[name]
+                    value = value and value[1]
+                return (value is not False, value)
+            records = sorted(records, key=key, reverse=reverse)
+        return records
+
+    def fields_get(self, allfields=None, context=None, *args):
+        names = allfields or self.fields
+        return dict([(name, dict(self.fields[name], string=name))
+                     for name in names if name in self.fields])
+
+    def fields_get_keys(self, context=None):
+        return sorted(self.fields)
+
+    def search(self, domain=None, offset=0, limit=None, order=None,
+               context=None, count=False):
+        (domain,) = searchargs((list(domain or ()),))
+        # Like PostgreSQL, cast the pattern to text
+        domain = [(term[0], term[1], str(term[2]))
+                  if not isinstance(term, basestring) and
+                  'like' in term[1] and isinstance(term[2], int_types)
+                  else term for term in domain]
+        if 'active' in self.fields and not [term for term in domain
+                                            if term[0] == 'active']:
+            domain = domain + [('active', '=', True)]
+        fields = dict(self.fields, id={'type': 'integer'})
+        for name in MAGIC_COLUMNS:
+            fields[name] = {'type': 'datetime'}
+        names = list(self.fields) + list(MAGIC_COLUMNS)
+        records = [record for record in self.records.values()
+                   if _match_domain(domain, self._values(record, names),
+                                    fields)]
+        if count:
+            return len(records)
+        records = self._sorted(records, order)
+        records = records[offset or 0:]
+        if limit:
+            records = records[:limit]
+        return [record['id'] for record in records]
+
+    def search_count(self, domain=None, context=None):
+        return self.search(domain, count=True)
+
+    def read(self, ids, fields=None, context=None, *args):
+        fields = [name for name in (fields or ()) if name != 'id']
+        unknown = [name for name in fields if name not in self.fields and
+                   name not in MAGIC_COLUMNS]
+        if unknown:
+            raise Fault('ValueError: Invalid fields %r on model %r' %
+                        (unknown, self.name), '')
+        if isinstance(ids, int_types):
+            return self._values(self.records[ids], fields)
+        return [self._values(self.records[id_], fields)
+                for id_ in ids if id_ in self.records]
+
+    def create(self, values, context=None):
+        self._sequence += 1
+        new_id = self._sequence
+        record = {'id': new_id, 'create_date': self._now()}
+        if 'active' in self.fields:
+            record['active'] = True
+        self._store(record, values)
+        self.records[new_id] = record
+        return new_id
+
+    def write(self, ids, values, context=None):
+        if isinstance(ids, int_types):
+            ids = [ids]
+        now = self._now()
+        for id_ in ids:
+            record = self.records[id_]
+            self._store(record, values)
+            record['write_date'] = now
+        return True
+
+    def unlink(self, ids, context=None):
+        if isinstance(ids, int_types):
+            ids = [ids]
+        for id_ in ids:
+            self.records.pop(id_, None)
+        return True
+
+    def copy(self, id_, default=None, context=None):
+        values = dict([(key, value) for (key, value)
+                       in self.records[id_].items()
+                       if key in self.fields])
+        values.update(default or {})
+        return self.create(values)
+
+    def name_get(self, ids, context=None):
+        if isinstance(ids, int_types):
+            ids = [ids]
+        return [[id_, self.records[id_].get('name') or '']
+                for id_ in ids if id_ in self.records]
+
+    def name_search(self, name='', args=None, operator='ilike',
+                    context=None, limit=100):
+        domain = list(args or ())
+        if name:
+            domain.append(('name', operator, name))
+        return self.name_get(self.search(domain, 0, limit))
+
+    def perm_read(self, ids, context=None, details=True):
+        return [{'id': id_, 'create_uid': 1, 'write_uid': 1,
+                 'create_date': self.records[id_].get('create_date'),
+                 'write_date': self.records[id_].get('write_date', False),
+                 'xmlid': False} for id_ in ids if id_ in self.records]
+
+    def default_get(self, fields, context=None):
+        return {}
+
+    def check(self, *args):
+        # Method of 'ir.model.access'
+        return True
+
+
+class FakeServer(object):
+    """An OpenERP server, with its data in memory.
+
+    The server runs in a thread and listens on a local port.  Each request
+    waits `latency` seconds before the response, and no more than `workers`
+    requests are processed at the same time.  The number of requests and
+    the size of the request and response payloads are counted.
+
+    Use it as a context manager::
+
+        with FakeServer(latency=0.01) as server:
+            server.populate('res.partner', 1000)
+            client = erppeek.Client(server.url, server.database,
+                                    'admin', 'admin')
+    """
+
+    def __init__(self, database='test', version='7.0', latency=0.0,
+                 workers=4, host='127.0.0.1', port=0):
+        self.database = database
+        self.version = version
+        self.latency = latency
+        self.workers = workers
+        self.address = (host, port)
+        self.models = {}
+        self.calls = 0
+        self.bytes_received = self.bytes_sent = 0
+        self._lock = threading.RLock()
+        self._slots = threading.Semaphore(workers)
+        self._server = self._thread = None
+        for (name, fields) in sorted(BASE_MODELS.items()):
+            self.add_model(name, fields)
+        self.model('res.users').create({'name': 'Administrator',
+                                        'login': 'admin',
+                                        'password': 'admin'})
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    @property
+    def url(self):
+        """The URL of the server, to create a :class:`erppeek.Client`."""
+        return 'http://%s:%s' % self._server.server_address[:2]
+
+    def start(self):
+        """Start the server in a thread."""
+        self._server = _XMLRPCServer(self, self.address)
+        self._thread = threading.Thread(target=self._server.serve_forever,
+                                        args=(0.05,))
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Stop the server."""
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._thread.join()
+            self._server = self._thread = None
+
+    def model(self, name):
+        """Return the :class:`FakeModel` `name`."""
+        return self.models[name]
+
+    def add_model(self, name, fields):
+        """Add a model with its `fields`.
+
+        The `fields` is a dictionary of field properties, indexed by field
+        name, as returned by ``fields_get``.
+        """
+        model = self.models[name] = FakeModel(self, name, fields)
+        if 'ir.model' in self.models:
+            self.model('ir.model').create({'name': name, 'model': name})
+        for (fname, field) in fields.items():
+            relation = field.get('relation')
+            if relation and relation not in self.models:
+                self.add_model(relation, {'name': {'type': 'char'}})
+        return model
+
+    def populate(self, name, count, text_size=16, seed=0):
+        """Create `count` records in the model `name`.
+
+        The values are generated according to the type of the fields.
+        The ``char`` and ``text`` values have `text_size` characters.
+        The ``many2one`` values refer to existing records.
+        Return the list of the new ids.
+        """
+        model = self.model(name)
+        related = {}
+        for (fname, field) in model.fields.items():
+            if field['type'] in ('many2one', 'one2many', 'many2many'):
+                related[fname] = sorted(
+                    self.model(field['relation']).records) or [False]
+        ids = []
+        with self._lock:
+            for idx in range(seed, seed + count):
+                values = {}
+                for (fname, field) in model.fields.items():
+                    ftype = field['type']
+                    if ftype in ('char', 'text', 'html'):
+                        value = '%s %d ' % (fname, idx)
+                        value = (value * (text_size // len(value) + 1))
+                        value = value[:text_size]
+                    elif ftype == 'integer':
+                        value = idx
+                    elif ftype == 'float':
+                        value = idx * 1.5
+                    elif ftype == 'boolean':
+                        value = bool(idx % 2)
+                    elif ftype == 'date':
+                        value = '2013-%02d-%02d' % (idx % 12 + 1,
+                                                    idx % 28 + 1)
+                    elif ftype == 'datetime':
+                        value = '2013-%02d-%02d 12:00:00' % (idx % 12 + 1,
+                                                             idx % 28 + 1)
+                    elif ftype == 'selection':
+                        value = field['selection'][0][0]
+                    elif ftype == 'many2one':
+                        value = related[fname][idx % len(related[fname])]
+                    elif ftype in ('one2many', 'many2many'):
+                        value = [(6, 0, [id_ for id_ in related[fname][:2]
+                                         if id_])]
+                    else:
+                        continue
+                    values[fname] = value
+                if 'active' in model.fields:
+                    values['active'] = True
+                ids.append(model.create(values))
+        return ids
+
+    def dispatch(self, endpoint, method, params):
+        """Process a request received on the `endpoint`."""
+        with self._slots:
+            if self.latency:
+                time.sleep(self.latency)
+            handler = getattr(self, '_%s_%s' % (endpoint, method), None)
+            if handler is None:
+                raise Fault('Method not found: %s.%s' % (endpoint, method),
+                            '')
+            with self._lock:
+                self.calls += 1
+                return handler(*params)
+
+    def _check(self, database, uid, password):
+        if database != self.database:
+            raise Fault('FATAL: database "%s" does not exist' % database, '')
+        user = self.model('res.users').records.get(uid)
+        if not user or user['password'] != password:
+            raise Fault('AccessDenied', '')
+
+    def _db_server_version(self):
+        return self.version
+
+    def _db_list(self):
+        return [self.database]
+
+    def _common_login(self, database, login, password):
+        if database != self.database:
+            raise Fault('FATAL: database "%s" does not exist' % database, '')
+        for user in self.model('res.users').records.values():
+            if user['login'] == login and user['password'] == password:
+                return user['id']
+        return False
+
+    def _common_version(self):
+        return {'server_version': self.version}
+
+    def _method(self, database, uid, password, obj, method):
+        self._check(database, uid, password)
+        if obj not in self.models:
+            raise Fault("Object %s doesn't exist" % obj, '')
+        func = getattr(self.models[obj], method, None)
+        if method.startswith('_') or func is None:
+            raise Fault("AttributeError: '%s' object has no attribute '%s'" %
+                        (obj, method), '')
+        return func
+
+    def _object_execute(self, database, uid, password, obj, method, *args):
+        func = self._method(database, uid, password, obj, method)
+        return func(*args)
+
+    def _object_execute_kw(self, database, uid, password, obj, method,
+                           args, kwargs=None):
+        func = self._method(database, uid, password, obj, method)
+        return func(*args, **(kwargs or {}))
+
+    def _object_exec_workflow(self, database, uid, password, *args):
+        self._check(database, uid, password)
+        return True
+
+    def _report_report(self, database, uid, password, *args):
+        self._check(database, uid, password)
+        return 1
+
+    def _report_report_get(self, database, uid, password, report_id):
+        self._check(database, uid, password)
+        return {'state': True, 'format': 'pdf', 'result': ''}
+
+
+class _RequestHandler(SimpleXMLRPCRequestHandler):
+    rpc_paths = tuple(['/xmlrpc/' + endpoint for endpoint in ENDPOINTS])
+
+    def log_message(self, format, *args):
+        pass
+
+
+class _XMLRPCServer(ThreadingMixIn, SimpleXMLRPCServer):
+    daemon_threads = True
+
+    def __init__(self, fake, address):
+        SimpleXMLRPCServer.__init__(self, address, _RequestHandler,
+                                    logRequests=False, allow_none=True)
+        self.fake = fake
+
+    def _marshaled_dispatch(self, data, dispatch_method=None, path=None):
+        endpoint = (path or '').rsplit('/', 1)[-1]
+        try:
+            (params, method) = loads(data)
+            response = dumps((self.fake.dispatch(endpoint, method, params),),
+                             methodresponse=True, allow_none=True)
+        except Fault:
+            response = dumps(sys.exc_info()[1], allow_none=True)
+        except Exception:
+            (exc_type, exc, tb) = sys.exc_info()
+            message = '%s: %s' % (exc_type.__name__, exc)
+            response = dumps(Fault(message, ''.join(
+                traceback.format_exception(exc_type, exc, tb))))
+        if not isinstance(response, bytes):
+            response = response.encode('utf-8', 'xmlcharrefreplace')
+        with self.fake._lock:
+            self.fake.bytes_received += len(data)
+            self.fake.bytes_sent += len(response)
+        return response
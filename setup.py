@@ -33,7 +33,7 @@ setup(
     url='http://erppeek.readthedocs.org/',
     author='Florent Xicluna',
     author_email='florent.xicluna@gmail.com',
-    py_modules=['erppeek'],
+    py_modules=['erppeek', 'erppeek_testing'],
     zip_safe=False,
     platforms='any',
     entry_points={
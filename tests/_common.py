@@ -1,4 +1,7 @@
 # -*- coding: utf-8 -*-
+import shutil
+import tempfile
+
 import unittest2
 import mock
 from mock import call, sentinel
@@ -27,6 +30,12 @@ class PseudoFile(list):
         return rv
 
 
+def mkdtemp(testcase):
+    tmpdir = tempfile.mkdtemp()
+    testcase.addCleanup(shutil.rmtree, tmpdir)
+    return tmpdir
+
+
 def OBJ(*args):
     return ('object.execute', sentinel.AUTH) + args
 
@@ -1,6 +1,9 @@
 # -*- coding: utf-8 -*-
 from __future__ import with_statement
 
+import threading
+import time
+
 import mock
 from mock import call, sentinel, ANY
 
@@ -98,13 +101,13 @@ class TestCreateClient(XmlRpcTestCase):
     """Test the Client class."""
     server_version = '6.1'
     startup_calls = (
-        call(ANY, 'db', ANY, verbose=ANY),
+        call(ANY, 'db', ANY, verbose=ANY, cassette=ANY),
         'db.server_version',
-        call(ANY, 'db', ANY, verbose=ANY),
-        call(ANY, 'common', ANY, verbose=ANY),
-        call(ANY, 'object', ANY, verbose=ANY),
-        call(ANY, 'report', ANY, verbose=ANY),
-        call(ANY, 'wizard', ANY, verbose=ANY),
+        call(ANY, 'db', ANY, verbose=ANY, cassette=ANY),
+        call(ANY, 'common', ANY, verbose=ANY, cassette=ANY),
+        call(ANY, 'object', ANY, verbose=ANY, cassette=ANY),
+        call(ANY, 'report', ANY, verbose=ANY, cassette=ANY),
+        call(ANY, 'wizard', ANY, verbose=ANY, cassette=ANY),
         'db.list',
     )
 
@@ -469,6 +472,37 @@ class TestClientApi(XmlRpcTestCase):
         self.assertCalls()
         self.assertOutput('')
 
+    def test_read_tuples(self):
+        read = self.client.read
+        rows = [{'id': 13, 'state': ''.join(['do', 'ne']),
+                 'partner_id': [7, ''.join(['Sp', 'am'])]},
+                {'id': 17, 'state': ''.join(['do', 'ne']),
+                 'partner_id': [7, ''.join(['Sp', 'am'])]},
+                {'id': 42, 'state': 'draft', 'partner_id': False}]
+        self.service.object.execute.side_effect = \
+            lambda *args: args[4] == 'search' and [13, 17, 42] or rows
+
+        header, tuples = read('foo.bar', [13, 17, 42], 'state partner_id',
+                              rows='tuple')
+        self.assertEqual(header, ('id', 'state', 'partner_id'))
+        self.assertEqual(tuples, [(13, 'done', (7, 'Spam')),
+                                  (17, 'done', (7, 'Spam')),
+                                  (42, 'draft', False)])
+        self.assertIs(tuples[0][1], tuples[1][1])
+        self.assertIs(tuples[0][2][1], tuples[1][2][1])
+
+        records = read('foo.bar', [], rows='namedtuple')
+        self.assertEqual(records[0]._fields, ('id', 'partner_id', 'state'))
+        self.assertEqual(records[1].partner_id, (7, 'Spam'))
+        self.assertEqual(records[2].state, 'draft')
+
+        self.assertCalls(
+            OBJ('foo.bar', 'read', [13, 17, 42], ['state', 'partner_id']),
+            OBJ('foo.bar', 'search', []),
+            OBJ('foo.bar', 'read', [13, 17, 42], None),
+        )
+        self.assertOutput('')
+
     def test_method(self, method_name='method', single_id=True):
         method = getattr(self.client, method_name)
 
@@ -581,6 +615,69 @@ class TestClientApi(XmlRpcTestCase):
         )
         self.assertOutput('')
 
+    def test_singleflight(self):
+        started, release = threading.Event(), threading.Event()
+        fields = {'spam': {'type': 'char'}}
+
+        def slow_exec(*args):
+            started.set()
+            release.wait(5)
+            return {'spam': {'type': 'char'}}
+        self.service.object.execute.side_effect = slow_exec
+        inflight = self.client._execute._inflight
+        results = []
+
+        def fields_get():
+            results.append(self.client.execute('foo.bar', 'fields_get'))
+        threads = [threading.Thread(target=fields_get) for i in range(3)]
+        threads[0].start()
+        started.wait(5)
+        for thread in threads[1:]:
+            thread.start()
+        while list(inflight.values())[0].waiters < 2:
+            time.sleep(0.001)
+        release.set()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(results, [fields] * 3)
+        self.assertIsNot(results[1], results[2])
+        self.assertFalse(inflight)
+        self.assertCalls(OBJ('foo.bar', 'fields_get'))
+        self.assertOutput('')
+
+    def test_singleflight_after_write(self):
+        started, release = threading.Event(), threading.Event()
+        reads = []
+
+        def slow_exec(*args):
+            if args[4] == 'read':
+                reads.append(args)
+                if len(reads) == 1:
+                    started.set()
+                    release.wait(5)
+                    return [{'id': 1, 'name': 'Old'}]
+                return [{'id': 1, 'name': 'New'}]
+            return True
+        self.service.object.execute.side_effect = slow_exec
+        results = []
+        thread = threading.Thread(target=lambda: results.append(
+            self.client.execute('foo.bar', 'read', [1], ['name'])))
+        thread.start()
+        started.wait(5)
+
+        # The read after a write is not shared with the pending read
+        self.client.execute('foo.bar', 'write', [1], {'name': 'New'})
+        self.assertEqual(self.client.execute('foo.bar', 'read', [1],
+                                             ['name']),
+                         [{'id': 1, 'name': 'New'}])
+        release.set()
+        thread.join()
+        self.assertEqual(results, [[{'id': 1, 'name': 'Old'}]])
+        self.assertEqual(len(reads), 2)
+        self.assertFalse(self.client._execute._inflight)
+        self.assertOutput('')
+
     def test_exec_workflow(self):
         exec_workflow = self.client.exec_workflow
 
@@ -1,9 +1,12 @@
 # -*- coding: utf-8 -*-
+import os
+
 import mock
 from mock import sentinel, ANY
+import unittest2
 
 import erppeek
-from ._common import XmlRpcTestCase, OBJ, callable
+from ._common import XmlRpcTestCase, OBJ, callable, mkdtemp
 
 
 class TestCase(XmlRpcTestCase):
@@ -26,7 +29,8 @@ class TestCase(XmlRpcTestCase):
         if args[4] == 'read':
             if args[5] is sentinel.FOO:
                 if args[3] == 'ir.model.data':
-                    return [{'model': 'foo.bar', 'id': 1733, 'res_id': 42}]
+                    return [{'model': 'foo.bar', 'id': 1733, 'res_id': 42,
+                             'module': 'base', 'name': 'foo_company'}]
                 return [{'model': 'foo.bar', 'id': 371},
                         {'model': 'ir.model.data', 'id': 17}]
 
@@ -379,13 +383,78 @@ class TestModel(TestCase):
         self.assertRaises(AssertionError, BabarFoo.get, 'base.foo_company')
 
         self.assertCalls(
-            OBJ('ir.model.data', 'search', [('module', '=', 'base'), ('name', '=', 'missing_company')]),
-            OBJ('ir.model.data', 'search', [('module', '=', 'base'), ('name', '=', 'foo_company')]),
-            OBJ('ir.model.data', 'read', sentinel.FOO, ['model', 'res_id']),
-            OBJ('ir.model.data', 'search', [('module', '=', 'base'), ('name', '=', 'foo_company')]),
-            OBJ('ir.model.data', 'read', sentinel.FOO, ['model', 'res_id']),
+            OBJ('ir.model.data', 'search', [('module', '=', 'base'), ('name', 'in', ['missing_company'])]),
+            OBJ('ir.model.data', 'search', [('module', '=', 'base'), ('name', 'in', ['foo_company'])]),
+            OBJ('ir.model.data', 'read', sentinel.FOO, ['module', 'name', 'model', 'res_id']),
+        )
+
+        self.assertOutput('')
+
+    def test_get_many(self):
+        data = [{'module': 'base', 'name': 'foo_company', 'model': 'foo.bar',
+                 'res_id': 42},
+                {'module': 'sale', 'name': 'foo_shop', 'model': 'foo.bar',
+                 'res_id': 7},
+                {'module': 'sale', 'name': 'other', 'model': 'foo.bar',
+                 'res_id': 9}]
+        self.service.object.execute.side_effect = [[1, 2], data[:2],
+                                                   [1, 2, 3], data]
+        FooBar = self.model('foo.bar')
+
+        records = FooBar.get_many(['base.foo_company', 'sale.foo_shop',
+                                   'base.missing'])
+        self.assertEqual([rec and rec.id for rec in records], [42, 7, None])
+        self.assertEqual(FooBar.get('sale.foo_shop').id, 7)
+        self.assertEqual(self.client.resolve_xmlids(['sale.other'],
+                                                    preload=True),
+                         {'sale.other': ('foo.bar', 9)})
+        self.assertEqual(self.client.resolve_xmlids(['sale.missing']),
+                         {'sale.missing': None})
+
+        fields = ['module', 'name', 'model', 'res_id']
+        self.assertCalls(
+            OBJ('ir.model.data', 'search',
+                ['|', '&', ('module', '=', 'base'),
+                 ('name', 'in', ['foo_company', 'missing']),
+                 '&', ('module', '=', 'sale'),
+                 ('name', 'in', ['foo_shop'])]),
+            OBJ('ir.model.data', 'read', [1, 2], fields),
+            OBJ('ir.model.data', 'search', [('module', '=', 'sale')]),
+            OBJ('ir.model.data', 'read', [1, 2, 3], fields),
         )
+        self.assertOutput('')
+
+    def test_resolve_names(self):
+        def obj_exec(*args):
+            if args[4] == 'search':
+                return [3, 4]
+            if args[4] == 'read':
+                return [{'id': 3, 'name': 'Spam'}, {'id': 4, 'name': 'Spam'}]
+            if args[4] == 'name_search':
+                return args[5] == 'Ham' and [[5, 'Ham Ltd']] or []
+            return self.obj_exec(*args)
+        self.service.object.execute.side_effect = obj_exec
+        FooBar = self.model('foo.bar')
+        self.client.enable_stats()
+
+        self.assertEqual(FooBar.resolve_names(['Spam', 'Ham', 'Eggs', 'Ham']),
+                         {'Spam': 3, 'Ham': 5, 'Eggs': None})
+        self.assertEqual(FooBar.resolve_names(['Eggs', 'Spam']),
+                         {'Spam': 3, 'Eggs': None})
+        self.assertEqual(FooBar.resolve_names(['Ham'], 'ilike', workers=1),
+                         {'Ham': 5})
+        self.assertEqual(self.client.stats()['caches']['names'],
+                         {'hits': 2, 'misses': 4, 'ratio': 2 / 6.})
 
+        self.assertCalls(
+            OBJ('foo.bar', 'fields_get_keys'),
+            OBJ('foo.bar', 'search', [('name', 'in', ['Spam', 'Ham', 'Eggs'])]),
+            OBJ('foo.bar', 'read', [3, 4], ['name']),
+            ANY, ANY,
+            OBJ('foo.bar', 'search', [('name', 'in', ['Ham'])]),
+            OBJ('foo.bar', 'read', [3, 4], ['name']),
+            OBJ('foo.bar', 'name_search', 'Ham', [], 'ilike', None, 1),
+        )
         self.assertOutput('')
 
     def test_create(self):
@@ -409,6 +478,58 @@ class TestModel(TestCase):
         )
         self.assertOutput('')
 
+    def test_read_group(self):
+        FooBar = self.model('foo.bar')
+        groups = [
+            {'amount': 42.0, 'partner_id': [3, 'Morice'], 'state': 'done'},
+            {'amount': 7.5, 'partner_id': False, 'state': 'done'},
+        ]
+        by_partner = [
+            {'amount': 42.0, 'partner_id': [3, 'Morice'],
+             '__domain': [('partner_id', '=', 3)]},
+            {'amount': 7.5, 'partner_id': False,
+             '__domain': [('partner_id', '=', False)]},
+        ]
+        self.service.object.execute.side_effect = [
+            groups, groups, by_partner,
+            [{'amount': 30.0, 'state': 'done'},
+             {'amount': 12.0, 'state': 'draft'}],
+            [{'amount': 7.5, 'state': 'done'}],
+            [{'amount': 49.5}], []]
+
+        self.assertEqual(FooBar.read_group(['state = done'], 'amount',
+                                           'partner_id', orderby='amount'),
+                         groups)
+        self.assertEqual(FooBar.sum('amount', ['state = done'],
+                                    by='partner_id'),
+                         {(3, 'Morice'): 42.0, False: 7.5})
+        self.assertEqual(FooBar.sum('amount', by=['partner_id', 'state']),
+                         {((3, 'Morice'), 'done'): 30.0,
+                          ((3, 'Morice'), 'draft'): 12.0,
+                          (False, 'done'): 7.5})
+        self.assertEqual(FooBar.sum('amount'), 49.5)
+        self.assertEqual(FooBar.sum('amount', ['state = draft']), 0)
+
+        self.assertCalls(
+            OBJ('foo.bar', 'read_group', [('state', '=', 'done')],
+                ['amount'], ['partner_id'], 0, None, None, 'amount'),
+            OBJ('foo.bar', 'read_group', [('state', '=', 'done')],
+                ['amount', 'partner_id'], ['partner_id'],
+                0, None, None),
+            OBJ('foo.bar', 'read_group', [],
+                ['amount', 'partner_id'], ['partner_id'],
+                0, None, None),
+            OBJ('foo.bar', 'read_group', [('partner_id', '=', 3)],
+                ['amount', 'state'], ['state'], 0, None, None),
+            OBJ('foo.bar', 'read_group', [('partner_id', '=', False)],
+                ['amount', 'state'], ['state'], 0, None, None),
+            OBJ('foo.bar', 'read_group', [], ['amount'], [],
+                0, None, None),
+            OBJ('foo.bar', 'read_group', [('state', '=', 'draft')],
+                ['amount'], [], 0, None, None),
+        )
+        self.assertOutput('')
+
     def test_method(self, method_name='method', single_id=True):
         FooBar = self.model('foo.bar')
         FooBar_method = getattr(FooBar, method_name)
@@ -436,6 +557,25 @@ class TestModel(TestCase):
         self.test_method('perm_read', single_id=False)
 
 
+class TestModel50(TestCase):
+    """Tests the Model class against OpenERP 5.0."""
+    server_version = '5.0'
+
+    def test_sum(self):
+        self.service.object.execute.side_effect = [
+            [{'amount': 42.0, 'state': 'done'}], [{'amount': 49.5}]]
+        FooBar = self.model('foo.bar')
+        self.assertEqual(FooBar.sum('amount', by='state'), {'done': 42.0})
+        self.assertEqual(FooBar.sum('amount', ['state = done']), 49.5)
+        self.assertCalls(
+            OBJ('foo.bar', 'read_group', [], ['amount', 'state'], ['state'],
+                0, None, None),
+            OBJ('foo.bar', 'read_group', [('state', '=', 'done')],
+                ['amount'], [], 0, None, None),
+        )
+        self.assertOutput('')
+
+
 class TestRecord(TestCase):
     """Tests the Model class and methods."""
 
@@ -454,16 +594,318 @@ class TestRecord(TestCase):
         records.read('birthdate city')
 
         self.assertCalls(
+            OBJ('foo.bar', 'fields_get'),
             OBJ('foo.bar', 'read', 42, None),
             OBJ('foo.bar', 'read', [13, 17], None),
             OBJ('foo.bar', 'read', 42, ['message']),
-            OBJ('foo.bar', 'fields_get'),
             OBJ('foo.bar', 'read', [13, 17], ['message']),
             OBJ('foo.bar', 'read', 42, ['name', 'message']),
             OBJ('foo.bar', 'read', [13, 17], ['birthdate', 'city']),
         )
         self.assertOutput('')
 
+    def test_read_lazy_fields(self):
+        fields = {
+            'name': {'type': 'char', 'size': 64},
+            'notes': {'type': 'text'},
+            'image': {'type': 'binary'},
+            'total': {'type': 'float', 'function': '_total', 'store': False},
+            'amount': {'type': 'float', 'function': '_amount', 'store': True},
+        }
+
+        def obj_exec(*args):
+            if args[4] == 'fields_get':
+                return fields
+            if args[4] == 'fields_get_keys':
+                return list(fields)
+            return self.obj_exec(*args)
+        self.service.object.execute.side_effect = obj_exec
+        records = self.model('foo.bar').browse([13, 17])
+        rec = self.model('foo.bar').browse(42)
+
+        rec.read()
+        self.assertEqual(rec.image, 'v_image')
+        self.client.lazy_field_size = 256
+        records.read()
+        records.read('total')
+
+        self.assertCalls(
+            OBJ('foo.bar', 'fields_get'),
+            OBJ('foo.bar', 'read', 42, ['amount', 'name', 'notes']),
+            OBJ('foo.bar', 'fields_get_keys'),
+            OBJ('foo.bar', 'read', 42, ['image']),
+            OBJ('foo.bar', 'read', [13, 17], ['amount', 'name']),
+            OBJ('foo.bar', 'read', [13, 17], ['total']),
+        )
+        self.assertOutput('')
+
+    def test_revalidate(self):
+        dates = {42: '2013-05-01 12:00:00', 43: False}
+
+        def obj_exec(*args):
+            if args[4] != 'read':
+                return self.obj_exec(*args)
+            if isinstance(args[5], int):
+                return obj_exec(*(args[:5] + ([args[5]],) + args[6:]))[0]
+            rows = []
+            for id_ in args[5]:
+                row = dict([(fld, 'v_' + fld) for fld in args[6]], id=id_)
+                if 'write_date' in row:
+                    row['write_date'] = dates[id_]
+                    row['create_date'] = '2013-04-01 12:00:00'
+                rows.append(row)
+            return rows
+        self.service.object.execute.side_effect = obj_exec
+        FooBar = self.model('foo.bar')
+        rec1, rec2 = FooBar.browse(42), FooBar.browse(43)
+        rec1.read(['name'])
+        rec2.read(['name', 'message'])
+        self.service.reset_mock()
+
+        # The first time, all the cached records are read again
+        self.assertEqual(FooBar.revalidate([rec1, rec2]), [rec1, rec2])
+        self.assertEqual(FooBar.revalidate([rec1, rec2]), [])
+        dates[42] = '2013-05-02 12:00:00'
+        self.assertTrue(rec1.revalidate())
+        self.assertFalse(rec2.revalidate())
+        self.assertEqual(rec2.message, 'v_message')
+
+        date_fields = ['write_date', 'create_date']
+        self.assertCalls(
+            OBJ('foo.bar', 'read', [42, 43],
+                ['create_date', 'message', 'name', 'write_date']),
+            OBJ('foo.bar', 'read', [42, 43], date_fields),
+            OBJ('foo.bar', 'read', [42], date_fields),
+            OBJ('foo.bar', 'read', [42],
+                ['create_date', 'name', 'write_date']),
+            OBJ('foo.bar', 'read', [43], date_fields),
+        )
+
+        # Without shared values, nothing is cached
+        records = FooBar.browse([42, 43])
+        records.read('name')
+        self.service.reset_mock()
+        changed = records.revalidate()
+        self.assertIsInstance(changed, erppeek.RecordList)
+        self.assertEqual(changed.id, [])
+
+        self.client.auto_batch = True
+        records = FooBar.browse([42, 43])
+        self.assertEqual([rec.name for rec in records], ['v_name'] * 2)
+        self.service.reset_mock()
+        changed = records.revalidate()
+        self.assertIsInstance(changed, erppeek.RecordList)
+        self.assertEqual(sorted(changed.id), [42, 43])
+        self.assertEqual(records.revalidate().id, [])
+        dates[43] = '2013-05-03 12:00:00'
+        self.assertEqual(records.revalidate().id, [43])
+        self.assertEqual(records[1].name, 'v_name')
+        self.assertCalls(
+            OBJ('foo.bar', 'read', [42, 43],
+                ['create_date', 'name', 'write_date']),
+            OBJ('foo.bar', 'read', [42, 43], date_fields),
+            OBJ('foo.bar', 'read', [42, 43], date_fields),
+            OBJ('foo.bar', 'read', [43],
+                ['create_date', 'name', 'write_date']),
+        )
+        self.assertOutput('')
+
+    def test_recordlist_algebra(self):
+        rows = {
+            13: {'name': 'Morice', 'state': 'draft', 'amount': 4.5,
+                 'partner_id': [7, 'Spam']},
+            17: {'name': 'Blinky', 'state': 'done', 'amount': 2.0,
+                 'partner_id': False},
+            42: {'name': 'Pinky', 'state': 'done', 'amount': 9.0,
+                 'partner_id': [8, 'Ham']},
+        }
+
+        def obj_exec(*args):
+            if args[4] == 'fields_get':
+                return {'name': {'type': 'char'},
+                        'state': {'type': 'selection'},
+                        'amount': {'type': 'float'},
+                        'partner_id': {'type': 'many2one',
+                                       'relation': 'res.partner'}}
+            if args[4] == 'fields_get_keys':
+                return ['amount', 'name', 'partner_id', 'state']
+            if args[4] == 'read':
+                return [dict([(fld, rows[id_][fld]) for fld in args[6]],
+                             id=id_) for id_ in args[5]]
+            return self.obj_exec(*args)
+        self.service.object.execute.side_effect = obj_exec
+        FooBar = self.model('foo.bar')
+        records = FooBar.browse([13, 17])
+        others = FooBar.browse([42, 17])
+
+        self.assertEqual((records | others).id, [13, 17, 42])
+        self.assertEqual((records & others).id, [17])
+        self.assertEqual((records - others).id, [13])
+        self.assertEqual(records.union(others, records).id, [13, 17, 42])
+        self.assertCalls()
+
+        allrecs = records | others
+        self.assertEqual(allrecs.filtered(['state = done']).id, [17, 42])
+        self.assertEqual(allrecs.filtered(['amount > 3']).id, [13, 42])
+        self.assertEqual(allrecs.filtered(['name ilike INK']).id, [17, 42])
+        self.assertEqual(allrecs.filtered(['name ilike 1']).id, [])
+        self.assertEqual(allrecs.filtered(['amount like 4.5']).id, [13])
+        self.assertEqual(allrecs.filtered(['name like P_nk']).id, [42])
+        self.assertEqual(allrecs.filtered(['name ilike b%Y']).id, [17])
+        self.assertEqual(allrecs.filtered(['name like i.k']).id, [])
+        self.assertEqual(allrecs.filtered(['name =like %ky']).id, [17, 42])
+        self.assertEqual(allrecs.filtered(
+            ['|', ('partner_id', '=', 7), ('partner_id', '=', False)]).id,
+            [13, 17])
+        self.assertEqual(allrecs.filtered(
+            ['!', ('partner_id', 'ilike', 'spa'), 'state != done']).id, [])
+        self.assertEqual(allrecs.sorted('name').id, [17, 13, 42])
+        self.assertEqual(allrecs.sorted('amount', reverse=True).id,
+                         [42, 13, 17])
+        self.assertEqual(allrecs.sorted('partner_id').id, [17, 42, 13])
+        self.assertEqual(allrecs.mapped('amount'), [4.5, 2.0, 9.0])
+        partners = allrecs.mapped('partner_id')
+        self.assertIsInstance(partners, erppeek.RecordList)
+        self.assertEqual(partners.id, [7, 8])
+        self.assertEqual(allrecs.filtered(lambda rec: rec.amount < 5).id,
+                         [13, 17])
+
+        self.assertCalls(
+            OBJ('foo.bar', 'fields_get'),
+            OBJ('foo.bar', 'read', [13, 17, 42], ['state']),
+            OBJ('foo.bar', 'read', [13, 17, 42], ['amount']),
+            OBJ('foo.bar', 'read', [13, 17, 42], ['name']),
+            OBJ('foo.bar', 'read', [13, 17, 42], ['partner_id']),
+            OBJ('foo.bar', 'fields_get_keys'),
+        )
+        self.assertRaises(ValueError, allrecs.filtered,
+                          ['partner_id.name = Spam'])
+        self.assertOutput('')
+
+    def test_join(self):
+        rows = {
+            'foo.bar': {13: {'partner_id': [7, 'Spam']},
+                        17: {'partner_id': False},
+                        42: {'partner_id': [8, 'Ham']},
+                        43: {'partner_id': [7, 'Spam']}},
+            'res.partner': {7: {'name': 'Spam'}, 8: {'name': 'Ham'},
+                            9: {'name': 'Eggs'}},
+        }
+
+        def obj_exec(*args):
+            if args[4] == 'fields_get':
+                if args[3] == 'res.partner':
+                    return {'name': {'type': 'char'}}
+                return {'partner_id': {'type': 'many2one',
+                                       'relation': 'res.partner'}}
+            if args[4] == 'fields_get_keys':
+                return args[3] == 'res.partner' and ['name'] or ['partner_id']
+            if args[4] == 'read':
+                return [dict([(fld, rows[args[3]][id_][fld])
+                              for fld in args[6]], id=id_)
+                        for id_ in args[5]]
+            return self.obj_exec(*args)
+        self.service.object.execute.side_effect = obj_exec
+        lines = self.model('foo.bar').browse([13, 17, 42, 43])
+        partners = self.model('res.partner', False).browse([9, 7])
+
+        pairs = [(rec.id, other and other.id)
+                 for (rec, other) in lines.join(partners, 'partner_id')]
+        self.assertEqual(pairs, [(13, 7), (17, None), (42, None), (43, 7)])
+        joined = list(lines.join(partners, 'partner_id', how='inner'))
+        self.assertEqual([other.name for (rec, other) in joined],
+                         ['Spam', 'Spam'])
+
+        pairs = [(rec.id, other and other.id)
+                 for (rec, other) in partners.join(lines, 'partner_id')]
+        self.assertEqual(pairs, [(9, None), (7, 13), (7, 43)])
+        self.assertRaises(ValueError, lines.join, partners, 'partner_id',
+                          how='outer')
+
+        self.assertCalls(
+            OBJ('foo.bar', 'fields_get'),
+            OBJ('foo.bar', 'read', [13, 17, 42, 43], ['partner_id']),
+            OBJ('res.partner', 'fields_get_keys'),
+            OBJ('res.partner', 'read', [7, 9], ['name']),
+            OBJ('res.partner', 'fields_get'),
+        )
+        self.assertOutput('')
+
+    def _patch_columns(self):
+        rows = {
+            13: {'name': 'Morice', 'amount': 4.5, 'qty': 3,
+                 'partner_id': [7, 'Spam'], 'date': '2013-04-01'},
+            17: {'name': 'Blinky', 'amount': 2.0, 'qty': False,
+                 'partner_id': False, 'date': False},
+        }
+
+        def obj_exec(*args):
+            if args[4] == 'fields_get':
+                return {'name': {'type': 'char'},
+                        'amount': {'type': 'float'},
+                        'qty': {'type': 'integer'},
+                        'date': {'type': 'date'},
+                        'partner_id': {'type': 'many2one',
+                                       'relation': 'res.partner'}}
+            if args[4] == 'read':
+                fields = args[6] or ['amount', 'date', 'name',
+                                     'partner_id', 'qty']
+                return [dict([(fld, rows[id_][fld]) for fld in fields],
+                             id=id_) for id_ in args[5] if id_ in rows]
+            return self.obj_exec(*args)
+        self.service.object.execute.side_effect = obj_exec
+
+    def test_read_columns(self):
+        self._patch_columns()
+        patcher = mock.patch('erppeek.numpy', None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        records = self.model('foo.bar').browse([17, 13, 99])
+
+        columns = records.read('amount qty partner_id date',
+                               format='columns')
+        self.assertEqual(sorted(columns),
+                         ['amount', 'date', 'id', 'partner_id', 'qty'])
+        self.assertEqual(columns['id'], erppeek.array('l', [17, 13]))
+        self.assertEqual(columns['amount'], erppeek.array('d', [2.0, 4.5]))
+        self.assertEqual(columns['qty'], erppeek.array('l', [0, 3]))
+        self.assertEqual(columns['partner_id'], erppeek.array('l', [0, 7]))
+        self.assertEqual(columns['date'], [False, '2013-04-01'])
+
+        columns = self.client.read('foo.bar', 13, format='columns')
+        self.assertEqual(columns['name'], ['Morice'])
+        self.assertEqual(columns['amount'], erppeek.array('d', [4.5]))
+        self.assertEqual(records[:0].read(format='columns'),
+                         {'id': erppeek.array('l')})
+
+        self.assertCalls(
+            OBJ('foo.bar', 'read', [13, 17, 99],
+                ['amount', 'qty', 'partner_id', 'date']),
+            OBJ('foo.bar', 'fields_get'),
+            OBJ('foo.bar', 'read', [13], None),
+        )
+        self.assertOutput('')
+
+    @unittest2.skipIf(erppeek.numpy is None, 'NumPy is not installed')
+    def test_read_columns_numpy(self):
+        numpy = erppeek.numpy
+        self._patch_columns()
+        records = self.model('foo.bar').browse([17, 13, 99])
+
+        columns = records.read('amount qty partner_id date',
+                               format='columns')
+        self.assertIsInstance(columns['id'], numpy.ndarray)
+        self.assertEqual(columns['id'].tolist(), [17, 13])
+        self.assertEqual(columns['amount'].dtype, numpy.dtype('d'))
+        self.assertEqual(columns['amount'].tolist(), [2.0, 4.5])
+        self.assertEqual(columns['qty'].tolist(), [0, 3])
+        self.assertEqual(columns['partner_id'].tolist(), [0, 7])
+        self.assertEqual(columns['date'].dtype,
+                         numpy.dtype('datetime64[D]'))
+        self.assertTrue(numpy.isnat(columns['date'][0]))
+        self.assertEqual(str(columns['date'][1]), '2013-04-01')
+        self.assertOutput('')
+
     def test_write(self):
         records = self.model('foo.bar').browse([13, 17])
         rec = self.model('foo.bar').browse(42)
@@ -568,6 +1010,66 @@ class TestRecord(TestCase):
         )
         self.assertOutput('')
 
+    def test_auto_batch(self):
+        self.client.auto_batch = True
+        FooBar = self.model('foo.bar')
+        records = FooBar.browse([13, 17])
+        self.assertEqual([rec.message for rec in records], ['v_message'] * 2)
+        self.assertEqual(records[0].message, 'v_message')
+
+        rec1, rec2 = FooBar.browse(42), FooBar.browse(43)
+        self.assertEqual(rec1.name, 'v_name')
+        self.assertEqual(rec2.name, 'v_name')
+        rec3 = FooBar.browse(44)
+        self.assertEqual(rec3.name, 'v_name')
+
+        self.assertCalls(
+            OBJ('foo.bar', 'fields_get_keys'),
+            OBJ('foo.bar', 'read', [13, 17], ['message']),
+            OBJ('foo.bar', 'fields_get'),
+            OBJ('foo.bar', 'read', [42, 43], ['name']),
+            OBJ('foo.bar', 'read', [44], ['name']),
+        )
+
+        # The values are read again after a change
+        records[1].write({'message': 'Hello'})
+        self.assertEqual(records[1].message, 'v_message')
+        self.assertCalls(
+            OBJ('foo.bar', 'write', [17], {'message': 'Hello'}),
+            OBJ('foo.bar', 'read', [17], ['message']),
+        )
+        self.assertOutput('')
+
+    def test_adaptive_prefetch(self):
+        self.client.adaptive_prefetch = True
+        FooBar = self.model('foo.bar')
+        for idx in range(2):
+            records = FooBar.browse([13, 17])
+            self.assertEqual([(rec.name, rec.message) for rec in records],
+                             [('v_name', 'v_message')] * 2)
+
+        self.assertCalls(
+            OBJ('foo.bar', 'fields_get_keys'),
+            OBJ('foo.bar', 'read', [13, 17], ['name']),
+            OBJ('foo.bar', 'fields_get'),
+            OBJ('foo.bar', 'read', [13, 17], ['message']),
+            OBJ('foo.bar', 'read', [13, 17], ['name', 'message']),
+        )
+        (key,) = self.client.prefetch_profiles
+        self.assertEqual(key[0], 'foo.bar')
+        self.assertEqual(self.client.prefetch_profiles[key],
+                         set(['name', 'message']))
+
+        # Save and reload the profiles
+        tmpdir = mkdtemp(self)
+        filename = os.path.join(tmpdir, 'profiles.txt')
+        self.client.save_prefetch_profiles(filename)
+        self.client.prefetch_profiles.clear()
+        self.client.load_prefetch_profiles(filename)
+        self.assertEqual(self.client.prefetch_profiles,
+                         {key: set(['name', 'message'])})
+        self.assertOutput('')
+
     def test_attr(self):
         records = self.model('foo.bar').browse([13, 17])
         rec = self.model('foo.bar').browse(42)
@@ -619,3 +1121,287 @@ class TestRecord(TestCase):
 
         self.assertCalls()
         self.assertOutput('')
+
+
+class TestReplica(TestCase):
+    """Tests the Replica class."""
+
+    def setUp(self):
+        super(TestReplica, self).setUp()
+        self.rows = {
+            1: {'id': 1, 'name': 'Alpha', 'active': True,
+                'partner_id': [7, 'Spam'], 'write_date': '2013-05-01',
+                'create_date': '2013-04-01'},
+            2: {'id': 2, 'name': 'Beta', 'active': False,
+                'partner_id': False, 'write_date': False,
+                'create_date': '2013-04-02'},
+        }
+        self.service.object.execute.side_effect = self.replica_exec
+        self.replica = erppeek.Replica(self.client)
+        self.client.replica = self.replica
+
+    def replica_exec(self, *args):
+        if args[4] == 'fields_get':
+            return {'name': {'type': 'char'},
+                    'active': {'type': 'boolean'},
+                    'partner_id': {'type': 'many2one',
+                                   'relation': 'res.partner'},
+                    'line_ids': {'type': 'one2many',
+                                 'relation': 'foo.line'}}
+        if args[4] == 'fields_get_keys':
+            return ['active', 'line_ids', 'name', 'partner_id']
+        if args[4] == 'search':
+            if args[5]:
+                return [2]
+            return sorted(self.rows)
+        if args[4] == 'read':
+            return [dict([(fld, self.rows[id_][fld])
+                          for fld in ['id'] + args[6]]) for id_ in args[5]]
+        return self.obj_exec(*args)
+
+    def test_sync(self):
+        self.replica.add('foo.bar')
+        self.assertEqual(self.replica.models(), ['foo.bar'])
+        self.assertEqual(self.replica.sync(), {'foo.bar': (2, 0)})
+
+        fields = ['active', 'name', 'partner_id', 'write_date', 'create_date']
+        ctx = {'active_test': False}
+        self.assertCalls(
+            OBJ('foo.bar', 'fields_get'),
+            OBJ('foo.bar', 'search', [], 0, None, 'id', ctx),
+            OBJ('foo.bar', 'read', [1, 2], fields, ctx),
+        )
+        self.assertEqual(
+            self.replica.query('SELECT * FROM foo_bar ORDER BY id'),
+            [(1, 1, 'Alpha', 7), (2, 0, 'Beta', None)])
+
+        # Incremental update and deleted records
+        self.rows[2]['name'] = 'Gamma'
+        del self.rows[1]
+        self.assertEqual(self.replica.sync('foo.bar'), {'foo.bar': (1, 1)})
+        self.assertCalls(
+            OBJ('foo.bar', 'search',
+                ['|', ('write_date', '>=', '2013-05-01'),
+                 ('create_date', '>=', '2013-05-01')], 0, None, 'id', ctx),
+            OBJ('foo.bar', 'read', [2], fields, ctx),
+            OBJ('foo.bar', 'search', [], 0, None, None, ctx),
+        )
+        self.assertEqual(self.replica.query('SELECT id, name FROM foo_bar'),
+                         [(2, 'Gamma')])
+        self.assertOutput('')
+
+    def test_browse(self):
+        self.replica.add('foo.bar', 'name active')
+        self.replica.sync()
+        self.service.reset_mock()
+        FooBar = self.model('foo.bar')
+
+        self.assertEqual(self.replica.search('foo.bar', ['active = True']),
+                         [1])
+        self.assertEqual(self.replica.search('foo.bar', ['name like et']),
+                         [2])
+        self.assertEqual(self.replica.search('foo.bar', ['name like ET']),
+                         [])
+        self.assertEqual(self.replica.search('foo.bar', ['name ilike ET']),
+                         [2])
+        self.assertEqual(self.replica.search('foo.bar', ['name =like B_ta']),
+                         [2])
+        self.assertEqual(self.replica.search('foo.bar', ['name =like b%']),
+                         [])
+        self.assertEqual(self.replica.search('foo.bar',
+                                             ['name not like ALPHA']), [1, 2])
+        self.assertEqual(self.replica.search('foo.bar', ['name like *']), [])
+        self.assertEqual(self.replica.search(
+            'foo.bar', ['|', ('name', '=', 'Alpha'), ('active', '=', False)],
+            order='id DESC'), [2, 1])
+        records = FooBar.browse(['active = False'], source='replica')
+        self.assertEqual(records.id, [2])
+        self.assertEqual(records[0].name, 'Beta')
+        self.assertIs(FooBar.browse(1, source='replica').active, True)
+        self.assertCalls(OBJ('foo.bar', 'fields_get_keys'))
+
+        # Not replicated
+        self.assertRaises(ValueError, self.replica.search,
+                          'foo.bar', ['partner_id = 7'])
+        self.assertEqual(records[0].partner_id, False)
+        self.assertCalls(OBJ('foo.bar', 'read', [2], ['partner_id']))
+        self.assertOutput('')
+
+
+class TestExport(TestCase):
+    """Tests the export of the records."""
+
+    def setUp(self):
+        super(TestExport, self).setUp()
+        self.rows = dict([(id_, {'id': id_, 'name': 'Name %d' % id_,
+                                 'partner_id': id_ % 2 and [7, 'Spam']})
+                          for id_ in range(1, 6)])
+        self.service.object.execute.side_effect = self.export_exec
+        self.tmpdir = mkdtemp(self)
+
+    def export_exec(self, *args):
+        if args[4] == 'fields_get':
+            return {'name': {'type': 'char'},
+                    'partner_id': {'type': 'many2one',
+                                   'relation': 'res.partner'}}
+        if args[4] == 'fields_get_keys':
+            return ['name', 'partner_id']
+        if args[4] == 'search':
+            (last_id, limit) = (args[5][-1][2], args[7])
+            return [id_ for id_ in sorted(self.rows) if id_ > last_id][:limit]
+        if args[4] == 'read':
+            return [dict([(fld, self.rows[id_][fld])
+                          for fld in ['id'] + args[6]]) for id_ in args[5]]
+        return self.obj_exec(*args)
+
+    def test_export_csv(self):
+        filename = os.path.join(self.tmpdir, 'out.csv')
+        count = erppeek._export(self.client, 'foo.bar', [], None, filename,
+                                batch_size=2, workers=2)
+        self.assertEqual(count, 5)
+        with open(filename) as f:
+            self.assertEqual(f.read().splitlines(), [
+                'id,name,partner_id', '1,Name 1,Spam', '2,Name 2,',
+                '3,Name 3,Spam', '4,Name 4,', '5,Name 5,Spam'])
+        self.assertFalse(os.path.exists(filename + '.resume'))
+        search = [call[1][5:] for call in self.service.mock_calls
+                  if call[1][4] == 'search']
+        self.assertEqual(search, [
+            ([('id', '>', 0)], 0, 2, 'id'),
+            ([('id', '>', 2)], 0, 2, 'id'),
+            ([('id', '>', 4)], 0, 2, 'id'),
+            ([('id', '>', 5)], 0, 2, 'id')])
+        self.assertOutput('')
+
+    def test_export_resume(self):
+        filename = os.path.join(self.tmpdir, 'out.jsonl')
+        read = self.export_exec
+
+        def interrupted(*args):
+            if args[4] == 'read' and 3 in args[5]:
+                raise KeyboardInterrupt
+            return read(*args)
+        self.service.object.execute.side_effect = interrupted
+        self.assertRaises(KeyboardInterrupt, erppeek._export, self.client,
+                          'foo.bar', ['name like Name'], 'name', filename,
+                          batch_size=2)
+        with open(filename + '.resume') as f:
+            self.assertEqual(f.read(), '2 56\n')
+        with open(filename, 'a') as f:
+            f.write('{"id": 3, "na')
+
+        self.service.object.execute.side_effect = read
+        count = erppeek._export(self.client, 'foo.bar', ['name like Name'],
+                                'name', filename, batch_size=2, resume=True)
+        self.assertEqual(count, 3)
+        with open(filename) as f:
+            lines = f.read().splitlines()
+        self.assertEqual(len(lines), 5)
+        self.assertEqual(lines[2], '{"id": 3, "name": "Name 3"}')
+        self.assertFalse(os.path.exists(filename + '.resume'))
+        self.assertOutput('')
+
+
+class TestImport(TestCase):
+    """Tests the import of the records."""
+    server_version = '7.0'
+
+    def setUp(self):
+        super(TestImport, self).setUp()
+        self.service.object.execute.side_effect = self.import_exec
+        self.tmpdir = mkdtemp(self)
+
+    def import_exec(self, *args):
+        if args[4] == 'fields_get':
+            return {'name': {'type': 'char'},
+                    'active': {'type': 'boolean'},
+                    'partner_id': {'type': 'many2one',
+                                   'relation': 'res.partner'}}
+        if args[4] == 'search':
+            if args[3] == 'ir.model.data':
+                return [1733]
+            return [7]
+        if args[4] == 'read':
+            if args[3] == 'ir.model.data':
+                return [{'id': 1733, 'module': 'base', 'name': 'main_partner',
+                         'model': 'res.partner', 'res_id': 1}]
+            return [{'id': 7, 'name': 'Spam'}]
+        if args[4] == 'name_search':
+            return []
+        if args[4] == 'load':
+            messages = [{'type': 'error', 'record': index,
+                         'message': 'Invalid name'}
+                        for (index, line) in enumerate(args[6])
+                        if 'Bad' in line]
+            if messages:
+                return {'ids': False, 'messages': messages}
+            return {'ids': list(range(len(args[6]))), 'messages': []}
+        if args[4] == 'create':
+            if args[5]['name'] == 'Bad':
+                raise erppeek.Fault('Invalid name', '')
+            return 42
+        return self.obj_exec(*args)
+
+    def test_import_csv(self):
+        filename = os.path.join(self.tmpdir, 'in.csv')
+        rejects_file = os.path.join(self.tmpdir, 'rejects.csv')
+        with open(filename, 'w') as f:
+            f.write('id,name,partner_id,active\n'
+                    '1,Alpha,Spam,True\n'
+                    '2,Beta,base.main_partner,\n'
+                    '3,Gamma,Missing,True\n'
+                    '4,Bad,Spam,True\n'
+                    '5,Delta,,False\n')
+        importer = erppeek._Importer(self.client, 'foo.bar', batch_size=2)
+        self.assertEqual(importer.run(filename, rejects_file), (3, 2))
+        with open(rejects_file) as f:
+            self.assertEqual(f.read().splitlines(), [
+                '_error,active,id,name,partner_id',
+                'partner_id not found: Missing,True,3,Gamma,Missing',
+                'Invalid name,True,4,Bad,Spam'])
+
+        loads = [call[1][5:] for call in self.service.mock_calls
+                 if call[1][4] == 'load']
+        self.assertEqual(loads, [
+            (['active', 'name', 'partner_id/.id'],
+             [['True', 'Alpha', '7'], ['False', 'Beta', '1']]),
+            (['active', 'name', 'partner_id/.id'], [['True', 'Bad', '7']]),
+            (['active', 'name', 'partner_id/.id'],
+             [['False', 'Delta', '']])])
+        creates = [call[1][5] for call in self.service.mock_calls
+                   if call[1][4] == 'create']
+        self.assertEqual(creates, [])
+        self.assertOutput('')
+
+    def test_import_load_messages(self):
+        filename = os.path.join(self.tmpdir, 'in.jsonl')
+        rejects_file = os.path.join(self.tmpdir, 'rejects.jsonl')
+        with open(filename, 'w') as f:
+            f.write('{"name": "Alpha"}\n{"name": "Bad"}\n{"name": "Beta"}\n')
+        importer = erppeek._Importer(self.client, 'foo.bar', batch_size=3)
+        self.assertEqual(importer.run(filename, rejects_file), (2, 1))
+        loads = [call[1][6] for call in self.service.mock_calls
+                 if call[1][4] == 'load']
+        self.assertEqual(loads, [[['Alpha'], ['Bad'], ['Beta']],
+                                 [['Alpha'], ['Beta']]])
+        self.assertOutput('')
+
+    def test_import_load_fault(self):
+        def import_exec(*args):
+            if args[4] == 'load':
+                raise erppeek.Fault('Unknown column', '')
+            return self.import_exec(*args)
+        self.service.object.execute.side_effect = import_exec
+        filename = os.path.join(self.tmpdir, 'in.jsonl')
+        rejects_file = os.path.join(self.tmpdir, 'rejects.jsonl')
+        with open(filename, 'w') as f:
+            f.write('{"name": "Alpha"}\n{"name": "Bad"}\n{"name": "Beta"}\n')
+        importer = erppeek._Importer(self.client, 'foo.bar', batch_size=2)
+        self.assertEqual(importer.run(filename, rejects_file), (2, 1))
+        with open(rejects_file) as f:
+            self.assertIn('"_error": "Invalid name"', f.read())
+        creates = [call[1][5] for call in self.service.mock_calls
+                   if call[1][4] == 'create']
+        self.assertEqual(creates, [{'name': 'Alpha'}, {'name': 'Bad'},
+                                   {'name': 'Beta'}])
+        self.assertOutput('')
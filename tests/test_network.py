@@ -0,0 +1,491 @@
+# -*- coding: utf-8 -*-
+from __future__ import with_statement
+
+import json
+import os
+import re
+import socket
+import sys
+import threading
+import time
+import warnings
+
+import mock
+import unittest2
+
+import erppeek
+from erppeek_testing import FakeServer
+from ._common import PseudoFile, mkdtemp
+
+
+class TestHooks(unittest2.TestCase):
+
+    def setUp(self):
+        self.server = server = FakeServer().start()
+        self.addCleanup(server.stop)
+        server.populate('res.partner', 5)
+        self.client = erppeek.Client(server.url, 'test', 'admin', 'admin')
+        self.addCleanup(erppeek.Client._login.cache.clear)
+
+    def test_no_hooks(self):
+        self.assertEqual(self.client._hooks, [])
+        with mock.patch('erppeek.RPCCall') as rpc_call:
+            self.assertEqual(self.client.search('res.partner', ['id < 3']),
+                             [1, 2])
+        self.assertFalse(rpc_call.called)
+
+        # The limiter observes the calls of the parallel jobs only
+        seen = []
+
+        def search(domain):
+            seen.append(list(self.client._hooks))
+            return self.client.search('res.partner', domain)
+        self.assertEqual(list(erppeek._imap(search, [['id = 1'], ['id = 2']],
+                                            2, self.client.concurrency)),
+                         [[1], [2]])
+        self.assertEqual(seen, [[self.client.concurrency]] * 2)
+        self.assertEqual(self.client._hooks, [])
+
+    def test_budget(self):
+        with self.client.rpc_budget(max_calls=2) as budget:
+            self.client.search('res.partner')
+            self.client.read('res.partner', [1, 2], 'name')
+        self.assertEqual(budget.calls, 2)
+        self.assertEqual(sorted(budget.methods),
+                         ['res.partner.read', 'res.partner.search'])
+        self.assertEqual(budget.bytes,
+                         sum([size for (calls, size)
+                              in budget.methods.values()]))
+        self.assertEqual(self.client._hooks, [])
+
+        partner = self.client.model('res.partner')
+        self.assertTrue(partner.keys() and partner.fields())
+        with self.client.rpc_budget() as budget:
+            records = partner.browse([])
+            try:
+                with self.client.rpc_budget(max_calls=2):
+                    [record.name for record in records]
+            except AssertionError:
+                message = str(sys.exc_info()[1])
+        self.assertIn('5 calls > 2', message)
+        self.assertTrue(re.search(r'\n +5 +\d+  res.partner.read\n',
+                                  message))
+        self.assertEqual(budget.calls, 6)
+
+    def test_decorator(self):
+        budget = self.client.rpc_budget(max_bytes=100, warn=True)
+        search = budget(self.client.search)
+
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter('always')
+            self.assertEqual(search('res.partner'), [1, 2, 3, 4, 5])
+        self.assertEqual(len(caught), 1)
+        self.assertIn('bytes > 100', str(caught[0].message))
+        self.assertEqual(budget.calls, 1)
+        self.assertEqual(list(budget.methods), ['res.partner.search'])
+        self.assertIn('res.partner.search', budget.report())
+
+        # The counters are reset on each call
+        budget.max_bytes = None
+        count = budget(lambda: len(search('res.partner')))
+        self.assertEqual(count(), 5)
+        self.assertEqual(budget.calls, 1)
+        self.assertEqual(self.client._hooks, [])
+
+    def test_trace(self):
+        (before, after) = ([], [])
+        hook = self.client.add_trace(before.append, after.append)
+        self.client.search('res.partner', ['id < 3'])
+        self.assertRaises(erppeek.Fault, self.client.execute,
+                          'res.partner', 'missing')
+        self.client.db.list()
+        self.client.remove_trace(hook)
+        self.client.search('res.partner')
+
+        self.assertEqual(before, after)
+        self.assertEqual([call.key for call in after],
+                         ['res.partner.search', 'res.partner.missing',
+                          'db.list'])
+        (search, missing, db_list) = after
+        self.assertEqual((search.endpoint, search.model, search.method),
+                         ('object', 'res.partner', 'search'))
+        self.assertEqual(search.result, [1, 2])
+        self.assertIsNone(search.error)
+        self.assertTrue(search.duration >= 0)
+        self.assertTrue(search.request_bytes > search.response_bytes > 0)
+        self.assertIsInstance(missing.error, erppeek.Fault)
+        self.assertTrue(missing.response_bytes > 0)
+        self.assertEqual((db_list.model, db_list.method), (None, 'list'))
+
+    def test_json_trace(self):
+        (logs, spans) = (PseudoFile(), PseudoFile())
+        self.client.add_trace(after=erppeek.JSONTrace(logs))
+        self.client.add_trace(after=erppeek.JSONTrace(spans, spans=True,
+                                                      trace_id='4bf92f35'))
+        self.client.search('res.partner', ['id < 3'])
+        self.assertRaises(erppeek.Fault, self.client.execute,
+                          'res.partner', 'missing')
+
+        (log, log_error) = [json.loads(line) for line in logs]
+        self.assertEqual(sorted(log), [
+            'duration', 'endpoint', 'error', 'method', 'model',
+            'request_bytes', 'response_bytes', 'time'])
+        self.assertEqual((log['model'], log['method'], log['error']),
+                         ('res.partner', 'search', None))
+        self.assertIn('no attribute', log_error['error'])
+
+        (span, span_error) = [json.loads(line) for line in spans]
+        self.assertEqual((span['name'], span['kind'], span['trace_id']),
+                         ('res.partner.search', 'CLIENT', '4bf92f35'))
+        self.assertEqual(span['status'], {'code': 'OK'})
+        self.assertEqual(span['attributes']['rpc.service'], 'object')
+        self.assertEqual(span['attributes']['openerp.model'], 'res.partner')
+        self.assertTrue(span['end_time_unix_nano'] >=
+                        span['start_time_unix_nano'])
+        self.assertEqual(span_error['status']['code'], 'ERROR')
+        self.assertNotEqual(span['span_id'], span_error['span_id'])
+
+    def test_stats(self):
+        # Disabled by default
+        self.client.search('res.partner')
+        self.client.resolve_xmlids(['base.main_company'])
+        self.assertEqual(self.client.stats()['calls'], 0)
+        self.assertEqual(self.client.stats()['caches'], {})
+
+        self.client = erppeek.Client(self.server.url, 'test', 'admin',
+                                     'admin', stats=True)
+        self.client.search('res.partner', ['id < 3'])
+        self.client.search('res.partner')
+        self.assertRaises(erppeek.Fault, self.client.execute,
+                          'res.partner', 'missing')
+        self.client.resolve_xmlids(['base.main_company'])
+
+        stats = self.client.stats()
+        search = stats['methods'][('res.partner', 'search')]
+        self.assertEqual((search['calls'], search['errors']), (2, 0))
+        self.assertTrue(search['bytes_sent'] > search['bytes_received'] > 0)
+        self.assertEqual(sum(search['latency']), 2)
+        self.assertEqual(stats['methods'][('db', 'server_version')]['calls'],
+                         1)
+        self.assertEqual(stats['methods'][('res.partner', 'missing')]
+                         ['errors'], 1)
+        self.assertEqual(stats['errors'], 1)
+        self.assertEqual(stats['calls'],
+                         sum([counters['calls'] for counters
+                              in stats['methods'].values()]))
+        self.assertEqual(stats['caches']['xmlids'],
+                         {'hits': 0, 'misses': 1, 'ratio': 0.0})
+
+        text = self.client._stats.prometheus()
+        self.assertIn('# TYPE erppeek_rpc_calls_total counter\n', text)
+        self.assertIn('erppeek_rpc_calls_total{model="res.partner",'
+                      'method="search"} 2\n', text)
+        self.assertIn('erppeek_rpc_duration_seconds_bucket{model="res.partner'
+                      '",method="search",le="+Inf"} 2\n', text)
+        self.assertIn('erppeek_cache_misses_total{cache="xmlids"} 1\n', text)
+
+        self.client.enable_stats(False)
+        self.client.search('res.partner')
+        self.assertEqual(self.client.stats()['calls'], stats['calls'])
+        self.assertNotIn(self.client._stats, self.client._hooks)
+
+        # The number of methods is bounded
+        self.client.enable_stats()
+        self.client._stats.max_methods = len(stats['methods'])
+        self.client.read('res.partner', [1], 'name')
+        self.client.count('res.partner')
+        stats = self.client.stats()
+        self.assertEqual(len(stats['methods']), self.client._stats.max_methods
+                         + 1)
+        self.assertEqual(stats['methods'][('other', 'other')]['calls'], 2)
+
+    def test_export_stats(self):
+        tmpdir = mkdtemp(self)
+        filename = os.path.join(tmpdir, 'erppeek.prom')
+        self.client.enable_stats()
+        self.client.search('res.partner')
+        self.client.export_stats(filename)
+        with open(filename) as f:
+            self.assertIn('erppeek_rpc_calls_total{model="res.partner",'
+                          'method="search"} 1\n', f.read())
+
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.addCleanup(sock.close)
+        sock.bind(('127.0.0.1', 0))
+        sock.settimeout(0.5)
+        target = 'udp://127.0.0.1:%d' % sock.getsockname()[1]
+        exporter = self.client.export_stats(target, format='statsd',
+                                            interval=60, prefix='app')
+        self.client.search('res.partner')
+        exporter.stop()
+        received = []
+        try:
+            while True:
+                received.append(sock.recv(512).decode('utf-8'))
+        except socket.timeout:
+            pass
+        self.assertIn('app.res_partner.search.calls:2|c', received)
+        self.assertIn('app.res_partner.search.errors:0|c', received)
+        self.assertTrue([line for line in received if line.startswith(
+            'app.res_partner.search.duration:') and line.endswith('|ms')])
+        self.assertRaises(ValueError, self.client.export_stats,
+                          filename, format='json')
+
+    def test_profile(self):
+        partner = self.client.model('res.partner')
+        with mock.patch('sys.stdout', new=PseudoFile()) as stdout:
+            names = self.client.profile("partner.browse(['id < 3']).name",
+                                        limit=2)
+            ids = self.client.profile(lambda: partner.search([]))
+        self.assertEqual(names, ['name 0 name 0 na', 'name 1 name 1 na'])
+        self.assertEqual(ids, [1, 2, 3, 4, 5])
+
+        report = stdout.popvalue()
+        self.assertEqual(report.count('Profile: '), 2)
+        self.assertIn('  RPC:    4 calls, ', report)
+        self.assertIn('  RPC:    1 calls, ', report)
+        self.assertIn('s  res.partner.search\n', report)
+        self.assertIn('Client functions:\n', report)
+        self.assertIn('Ordered by: internal time', report)
+        self.assertEqual(self.client._hooks, [])
+
+    def test_loadtest(self):
+        tmpdir = mkdtemp(self)
+        filename = os.path.join(tmpdir, 'scenario.py')
+        with open(filename, 'w') as f:
+            f.write('def setup(client):\n'
+                    '    client.model("res.partner").create({"name": "X"})\n'
+                    '\n'
+                    'def scenario(client):\n'
+                    '    client.search("res.partner", ["name = X"])\n'
+                    '    client.execute("res.partner", "missing")\n')
+
+        loadtest = erppeek._LoadTest(self.client, filename, users=3,
+                                     duration=0.2, think_time=0.01,
+                                     ramp_up=0.05)
+        elapsed = loadtest.run()
+        self.assertTrue(elapsed >= 0.2)
+        iterations = len(loadtest.durations['scenario'])
+        self.assertTrue(iterations >= 3)
+        self.assertEqual(len(loadtest.durations['res.partner.search']),
+                         iterations)
+        self.assertEqual(loadtest.errors, {'res.partner.missing': iterations,
+                                           'scenario': iterations})
+
+        report = loadtest.report(elapsed).splitlines()
+        self.assertEqual(report[0].split(), [
+            'operation', 'count', 'errors', 'rate/s',
+            'p50', 'p90', 'p99', 'max'])
+        self.assertEqual(report[1].split()[:3],
+                         ['res.partner.missing', str(iterations),
+                          str(iterations)])
+        self.assertEqual(report[4], 'First error:')
+        self.assertIn("has no attribute 'missing'", report[-1])
+
+        self.assertEqual(erppeek._percentile([1, 2, 3, 4], 50), 2)
+        self.assertEqual(erppeek._percentile([1, 2, 3, 4], 99), 4)
+        self.assertEqual(erppeek._percentile([], 90), 0)
+
+    def test_concurrency(self):
+        limiter = self.client.concurrency
+        self.assertEqual(limiter.limit, 4)
+        # No latency spike on a loaded machine
+        limiter.min_latency = 60
+        model = self.client.model('res.partner')
+        names = ['name %d' % idx for idx in range(40)]
+        with mock.patch.object(model, '_keys', []):
+            ids = model.resolve_names(names, operator='ilike', workers=8)
+        self.assertEqual(len(ids), 40)
+        self.assertEqual(limiter.inflight, 0)
+        self.assertTrue(8 < limiter.limit < 11)
+        self.assertIn('res.partner.name_search', limiter.latency)
+
+        # Nested parallel jobs do not wait for a second slot
+        limiter.limit = 1.0
+        nested = lambda idx: sum(erppeek._imap(abs, [idx, -idx], 2, limiter))
+        result = []
+        thread = threading.Thread(target=lambda: result.extend(
+            erppeek._imap(nested, [1, 2, 3], 2, limiter)))
+        thread.daemon = True
+        thread.start()
+        thread.join(5)
+        self.assertEqual(result, [2, 4, 6])
+
+        # The slot is released on any exception
+        def interrupt(idx):
+            raise KeyboardInterrupt
+        self.assertRaises(KeyboardInterrupt, list,
+                          erppeek._imap(interrupt, [1, 2], 2, limiter))
+        self.assertEqual(limiter.inflight, 0)
+        self.assertEqual(self.client._hooks, [])
+
+        # Calls outside of the parallel jobs are ignored
+        del limiter.min_latency
+        limiter.limit = 8.0
+        self.client.search('res.partner')
+        self.assertEqual(limiter.limit, 8)
+
+        def call(duration, error=None):
+            rpc = erppeek.RPCCall('object', 'execute',
+                                  ('test', 1, 'admin', 'res.partner', 'read'))
+            (rpc.duration, rpc.error) = (duration, error)
+            limiter.after(rpc)
+        limiter.acquire()
+        self.addCleanup(limiter.release)
+        for idx in range(10):
+            call(0.1)
+        self.assertTrue(8.5 < limiter.limit < 9.5)
+        call(0.5)
+        self.assertTrue(4 < limiter.limit < 5)
+        # A single decrease for the calls in flight
+        call(0.5)
+        self.assertTrue(4 < limiter.limit < 5)
+        call(0.1, socket.timeout())
+        self.assertTrue(2 < limiter.limit < 2.5)
+        for idx in range(4):
+            call(0.01, erppeek.Fault('Timeout', ''))
+        self.assertEqual(limiter.limit, 1)
+
+
+class TestCassette(unittest2.TestCase):
+
+    def setUp(self):
+        tmpdir = mkdtemp(self)
+        self.filename = os.path.join(tmpdir, 'cassette.jsonl.gz')
+        self.addCleanup(erppeek.Client._login.cache.clear)
+
+    def test_record_replay(self):
+        with FakeServer(latency=0.05) as server:
+            server.populate('res.partner', 3)
+            url = server.url
+            with erppeek.Cassette(self.filename, 'record') as cassette:
+                client = erppeek.Client(url, 'test', 'admin', 'admin',
+                                        cassette=cassette)
+                names = client.read('res.partner', [], 'name')
+                self.assertRaises(erppeek.Fault, client.execute,
+                                  'res.partner', 'missing')
+        erppeek.Client._login.cache.clear()
+
+        # The server is stopped, and nothing is sent on the network
+        cassette = erppeek.Cassette(self.filename, latency=False)
+        with mock.patch('socket.create_connection',
+                        side_effect=AssertionError) as connect:
+            client = erppeek.Client(url, 'test', 'admin', 'admin',
+                                    cassette=cassette, stats=True)
+            self.assertEqual(client.read('res.partner', [], 'name'), names)
+            self.assertEqual(client.read('res.partner', [], 'name'), names)
+            self.assertRaises(erppeek.Fault, client.execute,
+                              'res.partner', 'missing')
+            self.assertRaises(ValueError, client.search, 'res.country')
+        self.assertFalse(connect.called)
+        self.assertTrue(client.stats()['bytes_received'] > 0)
+
+        erppeek.Client._login.cache.clear()
+        cassette = erppeek.Cassette(self.filename)
+        start = time.time()
+        erppeek.Client(url, 'test', 'admin', 'admin', cassette=cassette)
+        self.assertTrue(time.time() - start >= 0.1)
+
+        self.assertRaises(ValueError, erppeek.Cassette, self.filename, 'x')
+
+
+class TestRouting(unittest2.TestCase):
+
+    def setUp(self):
+        self.servers = []
+        for latency in (0.0, 0.0):
+            server = FakeServer(latency=latency).start()
+            self.addCleanup(server.stop)
+            server.populate('res.partner', 5)
+            self.servers.append(server)
+        self.addCleanup(erppeek.Client._login.cache.clear)
+        self.client = erppeek.Client([srv.url for srv in self.servers],
+                                     'test', 'admin', 'admin')
+
+    def calls(self):
+        return [server.calls for server in self.servers]
+
+    def test_writes(self):
+        (primary, secondary) = self.servers
+        self.assertEqual(repr(self.client), "<Client '%s,%s#test'>" %
+                         (primary.url, secondary.url))
+        before = self.calls()
+        for idx in range(4):
+            self.client.create('res.partner', {'name': 'New %d' % idx})
+        self.client.write('res.partner', [1], {'name': 'Changed'})
+        after = self.calls()
+        self.assertEqual(after[0] - before[0], 5)
+        self.assertEqual(after[1], before[1])
+        self.assertEqual(secondary.model('res.partner').read([1], ['name']),
+                         [{'id': 1, 'name': 'name 0 name 0 na'}])
+
+    def test_latency(self):
+        self.servers[0].latency = 0.05
+        self.client.search('res.partner')
+        self.client.search('res.partner')
+        before = self.calls()
+        for idx in range(5):
+            self.client.search('res.partner')
+        after = self.calls()
+        self.assertEqual(after[0], before[0])
+        self.assertEqual(after[1] - before[1], 5)
+
+    def test_round_robin(self):
+        self.client.routing = 'round-robin'
+        before = self.calls()
+        for idx in range(6):
+            self.client.search('res.partner')
+        after = self.calls()
+        self.assertEqual(after[0] - before[0], 3)
+        self.assertEqual(after[1] - before[1], 3)
+
+    def test_failover(self):
+        self.servers[1].stop()
+        before = self.calls()
+        for idx in range(3):
+            self.assertEqual(self.client.search('res.partner'),
+                             [1, 2, 3, 4, 5])
+        self.assertEqual(self.calls()[0] - before[0], 3)
+        self.assertRaises(erppeek.Fault, self.client.execute,
+                          'res.partner', 'missing')
+
+    def test_hedged_reads(self):
+        self.client.hedged_reads = True
+        router = self.client._router
+        for (url, latency) in zip(router.urls, (0.01, 0.02)):
+            router.latency[url] = latency
+            router.samples[url].extend([latency] * 20)
+        self.servers[0].latency = 1.0
+        before = self.calls()
+        self.assertEqual(self.client.search('res.partner'), [1, 2, 3, 4, 5])
+        # The second server answered, the first one is still busy
+        after = self.calls()
+        self.assertEqual(after[0], before[0])
+        self.assertEqual(after[1] - before[1], 1)
+
+    def test_hedged_failover(self):
+        self.client.hedged_reads = True
+        router = self.client._router
+        for (url, latency) in zip(router.urls, (0.01, 0.02)):
+            router.latency[url] = latency
+            router.samples[url].extend([10.0] * 20)
+        self.servers[0].stop()
+        before = self.calls()
+        self.assertEqual(self.client.search('res.partner'), [1, 2, 3, 4, 5])
+        self.assertEqual(self.calls()[1] - before[1], 1)
+        self.assertRaises(erppeek.Fault, self.client.execute,
+                          'res.partner', 'read', [1], ['missing'])
+        self.assertTrue(router._threads <= router.pool_size)
+
+    def test_read_config(self):
+        tmpdir = mkdtemp(self)
+        filename = os.path.join(tmpdir, 'erppeek.ini')
+        with open(filename, 'w') as f:
+            f.write('[DEFAULT]\nhost = localhost\nport = 8069\n'
+                    'database = test\nusername = admin\n'
+                    '[cluster]\nhost = node1, node2\n')
+        with mock.patch('erppeek.Client._config_file', filename):
+            self.assertEqual(erppeek.read_config('DEFAULT')[0],
+                             'http://localhost:8069')
+            self.assertEqual(erppeek.read_config('cluster')[0],
+                             ['http://node1:8069', 'http://node2:8069'])
@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+from __future__ import with_statement
+
+import unittest2
+import mock
+
+import erppeek
+from erppeek_testing import FakeServer
+
+
+class TestFakeServer(unittest2.TestCase):
+
+    def setUp(self):
+        self.server = FakeServer().start()
+        self.addCleanup(self.server.stop)
+        self.server.populate('res.country', 3)
+        self.server.populate('res.partner', 20, text_size=24)
+        self.client = erppeek.Client(self.server.url, 'test',
+                                     'admin', 'admin', verbose=False)
+        self.addCleanup(erppeek.Client._login.cache.clear)
+
+    def test_login(self):
+        self.assertEqual(self.client.user, 'admin')
+        self.assertEqual(self.client.db.list(), ['test'])
+        self.assertEqual(self.client.db.server_version(), '7.0')
+        with mock.patch('sys.stdout') as stdout:
+            self.assertFalse(self.client.login('admin', 'wrong'))
+        self.assertTrue(stdout.write.called)
+
+    def test_search_read(self):
+        partner = self.client.model('res.partner')
+        self.assertEqual(partner.search(['id < 4']), [1, 2, 3])
+        self.assertEqual(partner.search(['id > 3'], limit=2, order='id desc'),
+                         [20, 19])
+        self.assertEqual(len(partner.search(['customer = True'])), 10)
+        self.assertEqual(partner.get(2).country_id.id, 2)
+        self.assertEqual(len(partner.get(2).name), 24)
+        self.assertEqual(self.client.read('res.partner', [1, 2], 'country_id'),
+                         [[1, 'name 0 name 0 na'], [2, 'name 1 name 1 na']])
+        self.assertEqual(partner.fields('country_id'),
+                         {'country_id': {'type': 'many2one', 'string':
+                                         'country_id', 'relation':
+                                         'res.country'}})
+
+    def test_write(self):
+        partner = self.client.model('res.partner')
+        record = partner.create({'name': 'Joe', 'category_ids': [(6, 0, [])]})
+        self.assertEqual(record.id, 21)
+        record.write({'email': 'joe@example.com', 'country_id': 3,
+                      'category_ids': [(4, 1)]})
+        self.assertEqual(partner.read(21, 'email country_id category_ids'),
+                         {'id': 21, 'email': 'joe@example.com',
+                          'country_id': [3, 'name 2 name 2 na'],
+                          'category_ids': [1]})
+        record.unlink()
+        self.assertEqual(self.client.count('res.partner'), 20)
+        self.assertRaises(erppeek.Fault, self.client.execute,
+                          'res.partner', 'missing_method')
+        self.assertRaises(erppeek.Fault, self.client.execute_kw,
+                          'res.missing', 'search', [[]])
+        self.assertRaises(erppeek.Fault, self.client.execute_kw,
+                          'res.partner', '_values', [{}])
+
+    def test_counters(self):
+        calls = self.server.calls
+        self.client.search('res.partner')
+        self.assertEqual(self.server.calls, calls + 1)
+        self.assertTrue(self.server.bytes_sent > 0)
+        self.assertTrue(self.server.bytes_received > 0)
+
+    def test_magic_columns(self):
+        partner = self.client.model('res.partner')
+        self.assertEqual(partner.search(['write_date != False']), [])
+        partner.get(2).write({'email': 'two@example.com'})
+        self.assertEqual(partner.search(['write_date != False']), [2])
+        self.assertEqual(len(partner.search(['create_date > 2000-01-01'])),
+                         20)
+
+    def test_replica_sync(self):
+        replica = erppeek.Replica(self.client)
+        replica.add('res.partner', 'name email')
+        self.assertEqual(replica.sync(), {'res.partner': (20, 0)})
+        partner = self.client.model('res.partner')
+        partner.get(2).write({'email': 'two@example.com'})
+        partner.get(3).unlink()
+        (updated, deleted) = replica.sync()['res.partner']
+        self.assertTrue(updated >= 1)
+        self.assertEqual(deleted, 1)
+        self.client.replica = replica
+        self.assertEqual(partner.browse(['email = two@example.com'],
+                                        source='replica').id, [2])